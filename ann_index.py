@@ -0,0 +1,314 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+# Vetores usados no treino do k-means por lista (amostra limitada para treinar rápido)
+TRAIN_POINTS_PER_LIST = 64
+# Mínimo de vetores por lista para o k-means ter centróides estáveis
+MIN_POINTS_PER_LIST = 39
+# Vetores por lote ao atribuir listas e na busca exata
+BATCH_SIZE = 65536
+
+class IVFIndex:
+    """
+    Índice aproximado de vizinhos (IVF: listas invertidas por centróide) em NumPy.
+
+    - Vetores normalizados (similaridade de cosseno), ids e a lista de cada
+      vetor ficam em arquivos mapeados em memória (np.memmap) no diretório do
+      índice; só os centróides e as listas de posições ficam na RAM
+    - add() insere incrementalmente: cada vetor novo vai para a lista do
+      centróide mais próximo. Até train_size vetores a busca é exata; depois
+      o k-means (nlist ≈ √n listas) é treinado e refeito quando a coleção
+      cresce retrain_growth vezes
+    - search() compara a pergunta com os centróides e calcula a similaridade
+      exata só nos vetores das nprobe listas mais próximas
+    - meta.json é trocado atomicamente depois de cada gravação; centróides e
+      atribuições têm o número da geração no nome, então quem lê (outro
+      processo, refresh()) nunca vê um treino pela metade
+    """
+
+    def __init__(self, directory, nlist=None, nprobe=8, train_size=1024, retrain_growth=4.0,
+                 kmeans_iterations=10, seed=1):
+        self.directory = directory
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.retrain_growth = retrain_growth
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+
+        self.dim = None
+        self.count = 0
+        self.capacity = 0
+        self.generation = 0
+        self.trained_count = 0
+
+        self._lock = threading.RLock()
+        self._vectors = None
+        self._ids = None
+        self._assignments = None
+        self._centroids = None
+        self._lists = None
+        self._meta_stamp = None
+        self._previous_generation = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+
+    def add(self, ids, vectors):
+        """Insere vetores (matriz n x dim) com seus ids inteiros; retorna o total indexado"""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = _normalize(vectors)
+        if not len(ids):
+            return self.count
+
+        with self._lock:
+            # Outro processo pode ter gravado desde a última leitura
+            self.refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f'Dimensão {vectors.shape[1]} diferente da do índice ({self.dim})')
+
+            start, end = self.count, self.count + len(ids)
+            self._ensure_capacity(end)
+            self._vectors[start:end] = vectors
+            self._ids[start:end] = ids
+            self.count = end
+
+            if self._centroids is None and end >= self.train_size or \
+                    self._centroids is not None and end >= self.trained_count * self.retrain_growth:
+                self._train()
+            elif self._centroids is not None:
+                assignments = self._assign(vectors)
+                self._assignments[start:end] = assignments
+                self._append_to_lists(start, assignments)
+
+            self._save_meta()
+            return self.count
+
+    def search(self, vector, k=10, nprobe=None):
+        """(ids, similaridades) dos k vetores mais próximos, do mais similar ao menos"""
+        query = _normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        with self._lock:
+            self.refresh()
+            if not self.count:
+                return _empty()
+            if self._centroids is None:
+                return self.exact_search(query, k)
+
+            nprobe = min(nprobe or self.nprobe, len(self._centroids))
+            centroid_scores = self._centroids @ query
+            probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            rows = np.concatenate([self._lists[probe] for probe in probes])
+            if not len(rows):
+                return _empty()
+
+            # Posições em ordem crescente: leitura sequencial do arquivo mapeado
+            rows.sort()
+            scores = self._vectors[rows] @ query
+            return self._top(self._ids[rows], scores, k)
+
+    def exact_search(self, vector, k=10):
+        """Busca exata em todos os vetores (referência para medir o recall)"""
+        query = _normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        with self._lock:
+            self.refresh()
+            best_ids, best_scores = _empty()
+            for start in range(0, self.count, BATCH_SIZE):
+                end = min(start + BATCH_SIZE, self.count)
+                ids, scores = self._top(self._ids[start:end], self._vectors[start:end] @ query, k)
+                best_ids, best_scores = self._top(np.concatenate([best_ids, ids]),
+                                                  np.concatenate([best_scores, scores]), k)
+            return best_ids, best_scores
+
+    def refresh(self):
+        """Recarrega o estado gravado por outro processo (barato quando nada mudou)"""
+        meta_path = self._path('meta.json')
+        with self._lock:
+            try:
+                stat = os.stat(meta_path)
+            except FileNotFoundError:
+                return
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if stamp == self._meta_stamp:
+                return
+
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+
+            previous_count = self.count
+            reopen = meta['capacity'] != self.capacity or meta['generation'] != self.generation or self._vectors is None
+            rebuild = meta['generation'] != self.generation or self._lists is None
+
+            self.dim = meta['dim']
+            self.capacity = meta['capacity']
+            self.count = meta['count']
+            self.trained_count = meta['trained_count']
+            self.generation = meta['generation']
+            self._meta_stamp = stamp
+
+            if reopen:
+                self._open_files()
+            if meta['trained']:
+                self._centroids = np.load(self._path(f'centroids-{self.generation}.npy'))
+                if rebuild:
+                    self._rebuild_lists()
+                elif self.count > previous_count:
+                    self._append_to_lists(previous_count, self._assignments[previous_count:self.count])
+            else:
+                self._centroids = None
+                self._lists = None
+
+    def ids(self):
+        """Ids de todos os vetores indexados"""
+        with self._lock:
+            self.refresh()
+            return np.array(self._ids[:self.count]) if self.count else np.zeros(0, dtype=np.int64)
+
+    def stats(self):
+        with self._lock:
+            self.refresh()
+            sizes = [len(rows) for rows in self._lists] if self._lists is not None else []
+            return {
+                'count': self.count,
+                'dim': self.dim,
+                'nlist': len(sizes),
+                'nprobe': self.nprobe,
+                'trained_count': self.trained_count,
+                'largest_list': max(sizes) if sizes else 0,
+                'disk_bytes': sum(os.path.getsize(self._path(name)) for name in os.listdir(self.directory)),
+            }
+
+    def _train(self):
+        """k-means esférico sobre uma amostra e nova geração de centróides e atribuições"""
+        count = self.count
+        nlist = self.nlist or int(np.sqrt(count))
+        nlist = max(1, min(nlist, count // MIN_POINTS_PER_LIST))
+        rng = np.random.default_rng(self.seed)
+
+        sample_size = min(count, nlist * TRAIN_POINTS_PER_LIST)
+        sample_rows = np.sort(rng.choice(count, sample_size, replace=False))
+        sample = np.asarray(self._vectors[sample_rows])
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            assignments = _nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            sizes = np.bincount(assignments, minlength=nlist)
+            # Lista vazia: recomeça em um ponto qualquer da amostra
+            empty = np.flatnonzero(sizes == 0)
+            sums[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+            centroids = _normalize(sums)
+
+        generation = self.generation + 1
+        path = self._path(f'assignments-{generation}.i32')
+        _resize_file(path, self.capacity * 4)
+        assignments = np.memmap(path, dtype=np.int32, mode='r+', shape=(self.capacity,))
+        for start in range(0, count, BATCH_SIZE):
+            end = min(start + BATCH_SIZE, count)
+            assignments[start:end] = _nearest(np.asarray(self._vectors[start:end]), centroids)
+        assignments.flush()
+        np.save(self._path(f'centroids-{generation}.npy'), centroids)
+
+        previous = self.generation
+        self._centroids = centroids
+        self._assignments = assignments
+        self.generation = generation
+        self.trained_count = count
+        self._rebuild_lists()
+        self._previous_generation = previous
+        print(f"🧭 Índice ANN treinado: {count} vetores em {nlist} listas")
+
+    def _assign(self, vectors):
+        return _nearest(vectors, self._centroids)
+
+    def _rebuild_lists(self):
+        assignments = np.asarray(self._assignments[:self.count])
+        order = np.argsort(assignments, kind='stable')
+        sizes = np.bincount(assignments, minlength=len(self._centroids))
+        self._lists = np.split(order.astype(np.int64), np.cumsum(sizes)[:-1])
+
+    def _append_to_lists(self, start, assignments):
+        assignments = np.asarray(assignments)
+        for centroid in np.unique(assignments):
+            rows = start + np.flatnonzero(assignments == centroid)
+            self._lists[centroid] = np.concatenate([self._lists[centroid], rows])
+
+    def _ensure_capacity(self, needed):
+        if needed <= self.capacity:
+            return
+        self.capacity = max(needed, self.capacity * 2, 1024)
+        _resize_file(self._path('vectors.f32'), self.capacity * self.dim * 4)
+        _resize_file(self._path('ids.i64'), self.capacity * 8)
+        if self._centroids is not None:
+            _resize_file(self._path(f'assignments-{self.generation}.i32'), self.capacity * 4)
+        self._open_files()
+
+    def _open_files(self):
+        if not self.capacity:
+            return
+        self._vectors = np.memmap(self._path('vectors.f32'), dtype=np.float32, mode='r+',
+                                  shape=(self.capacity, self.dim))
+        self._ids = np.memmap(self._path('ids.i64'), dtype=np.int64, mode='r+', shape=(self.capacity,))
+        assignments_path = self._path(f'assignments-{self.generation}.i32')
+        self._assignments = np.memmap(assignments_path, dtype=np.int32, mode='r+', shape=(self.capacity,)) \
+            if os.path.exists(assignments_path) else None
+
+    def _save_meta(self):
+        for mapped in (self._vectors, self._ids, self._assignments):
+            if mapped is not None:
+                mapped.flush()
+
+        meta = {'dim': self.dim, 'count': self.count, 'capacity': self.capacity, 'generation': self.generation,
+                'trained': self._centroids is not None, 'trained_count': self.trained_count}
+        meta_path = self._path('meta.json')
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        stat = os.stat(meta_path)
+        self._meta_stamp = (stat.st_mtime_ns, stat.st_size)
+
+        previous = self._previous_generation
+        if previous is not None:
+            self._previous_generation = None
+            for name in (f'assignments-{previous}.i32', f'centroids-{previous}.npy'):
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    # Ainda aberto por outro processo (Windows): fica para a próxima geração
+                    pass
+
+    def _top(self, ids, scores, k):
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return np.asarray(ids[order], dtype=np.int64), np.asarray(scores[order], dtype=np.float32)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _nearest(vectors, centroids, batch_size=8192):
+    """Centróide mais similar de cada vetor (em lotes para limitar a matriz de similaridades)"""
+    nearest = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch_size):
+        nearest[start:start + batch_size] = np.argmax(vectors[start:start + batch_size] @ centroids.T, axis=1)
+    return nearest
+
+def _resize_file(path, size):
+    with open(path, 'ab') as f:
+        f.truncate(size)
+
+def _empty():
+    return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
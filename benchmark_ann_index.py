@@ -0,0 +1,97 @@
+"""
+Benchmark do índice aproximado de vizinhos (ann_index.IVFIndex).
+
+Compara a busca IVF com a busca exata (todos os vetores) em recall@k e
+latência por pergunta, para vários valores de nprobe. Usa os embeddings do
+índice de busca do corpus (training_data/retrieval_index_ann) quando existem;
+senão gera vetores sintéticos agrupados, como embeddings de textos reais.
+Os vetores são inseridos em lotes, medindo também as inserções incrementais.
+
+Uso: python benchmark_ann_index.py [diretório do índice] [--count N] [--dim D] [--queries Q] [-k K]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex
+
+def load_vectors(directory):
+    """Vetores já indexados pelo índice de busca (vazio se o diretório não tem índice)"""
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        return np.zeros((0, 0), dtype=np.float32)
+    index = IVFIndex(directory)
+    return np.array(index._vectors[:index.count])
+
+def synthetic_vectors(count, dim, clusters=1000, seed=1):
+    """Vetores em torno de centros aleatórios (assuntos), com ruído"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    return centers[labels] + 1.0 * rng.standard_normal((count, dim)).astype(np.float32)
+
+def make_queries(vectors, count, seed=2):
+    """Perguntas próximas de vetores da coleção, mas não iguais a eles"""
+    rng = np.random.default_rng(seed)
+    base = vectors[rng.integers(0, len(vectors), count)]
+    scale = np.linalg.norm(base, axis=1, keepdims=True) / np.sqrt(vectors.shape[1])
+    return base + 0.5 * scale * rng.standard_normal(base.shape).astype(np.float32)
+
+def timed_search(search, queries):
+    latencies = []
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query)[0])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return results, np.array(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do índice ANN (IVF) contra a busca exata')
+    parser.add_argument('directory', nargs='?', default=os.path.join('training_data', 'retrieval_index_ann'))
+    parser.add_argument('--count', type=int, default=100000, help='vetores sintéticos (sem índice salvo)')
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--batch', type=int, default=10000, help='vetores por inserção')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.directory) if os.path.isdir(args.directory) else np.zeros((0, 0))
+    source = args.directory
+    if len(vectors) < 1000:
+        vectors = synthetic_vectors(args.count, args.dim)
+        source = 'vetores sintéticos'
+    queries = make_queries(vectors, args.queries)
+    print(f"🧮 {len(vectors)} vetores de dimensão {vectors.shape[1]} ({source}), {len(queries)} perguntas, k={args.k}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = IVFIndex(directory)
+        started = time.perf_counter()
+        insert_times = []
+        for start in range(0, len(vectors), args.batch):
+            batch_started = time.perf_counter()
+            index.add(np.arange(start, min(start + args.batch, len(vectors))), vectors[start:start + args.batch])
+            insert_times.append(time.perf_counter() - batch_started)
+        build_seconds = time.perf_counter() - started
+        stats = index.stats()
+        print(f"Construção: {build_seconds:.2f}s ({len(insert_times)} inserções, mediana "
+              f"{np.median(insert_times) * 1000:.0f}ms), {stats['nlist']} listas, maior lista {stats['largest_list']}, "
+              f"{stats['disk_bytes'] / 1024 / 1024:.1f} MB em disco")
+
+        exact, exact_latencies = timed_search(lambda query: index.exact_search(query, args.k), queries)
+        exact_mean = exact_latencies.mean()
+
+        print(f"{'busca':<16}{'recall@' + str(args.k):>11}{'média (ms)':>12}{'p95 (ms)':>10}{'ganho':>8}")
+        print(f"{'exata':<16}{1.0:>11.3f}{exact_mean:>12.2f}{np.percentile(exact_latencies, 95):>10.2f}{1.0:>7.1f}x")
+        for nprobe in args.nprobe:
+            found, latencies = timed_search(lambda query: index.search(query, args.k, nprobe=nprobe), queries)
+            recall = np.mean([len(set(ann_ids) & set(exact_ids)) / max(len(exact_ids), 1)
+                              for ann_ids, exact_ids in zip(found, exact)])
+            print(f"{'IVF nprobe=' + str(nprobe):<16}{recall:>11.3f}{latencies.mean():>12.2f}"
+                  f"{np.percentile(latencies, 95):>10.2f}{exact_mean / latencies.mean():>7.1f}x")
+
+if __name__ == '__main__':
+    main()
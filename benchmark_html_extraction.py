@@ -0,0 +1,138 @@
+"""
+Benchmark da extração de texto HTML.
+
+Compara a extração anterior (BeautifulSoup + html.parser com find_all/get_text
+por tag) com o extrator de passada única (html_extraction) sobre páginas
+salvas: corpos do cache de páginas (collected_data/page_cache/*.body) ou
+arquivos .html de um diretório. Sem páginas salvas, gera páginas sintéticas.
+Com lxml instalado, também confere se os dois parsers extraem os mesmos blocos.
+
+Uso: python benchmark_html_extraction.py [diretório] [--repeat N]
+"""
+import argparse
+import glob
+import os
+import random
+import time
+
+from html_extraction import extract_blocks, etree
+
+def legacy_extract(content):
+    """Extração anterior: get_text de cada tag encontrada (texto de filhos repetido nos ancestrais)"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, 'html.parser')
+    for script in soup(["script", "style", "nav", "header", "footer", "aside"]):
+        script.decompose()
+
+    content_tags = soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'article', 'section', 'div', 'li'])
+    return [text for text in (tag.get_text(strip=True) for tag in content_tags) if len(text) >= 20]
+
+def single_pass_extract(content, engine):
+    return [block['text'] for block in extract_blocks(content, engine) if len(block['text']) >= 20]
+
+def load_pages(directory):
+    paths = sorted(glob.glob(os.path.join(directory, '*.body')) + glob.glob(os.path.join(directory, '*.html')))
+    pages = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+    return pages
+
+def synthetic_pages(count=20, seed=1):
+    """Páginas com divs aninhadas, como em layouts reais de blogs e portais"""
+    rng = random.Random(seed)
+    words = ('modelo dados treinamento texto rede neural página conteúdo usuário sistema '
+             'processo resultado análise exemplo informação the of and learning').split()
+
+    def paragraph():
+        return ' '.join(rng.choice(words) for _ in range(rng.randint(12, 60)))
+
+    def section(depth):
+        if depth == 0:
+            items = ''.join(f'<li>{paragraph()}</li>' for _ in range(rng.randint(0, 3)))
+            return f'<p>{paragraph()} <b>{paragraph()}</b></p><ul>{items}</ul>'
+        children = ''.join(section(depth - 1) for _ in range(rng.randint(2, 3)))
+        return f'<div class="content-{depth}"><h3>{paragraph()[:60]}</h3>{children}</div>'
+
+    pages = []
+    for index in range(count):
+        body = ''.join(section(rng.randint(2, 4)) for _ in range(4))
+        if index % 5 == 4:
+            # XHTML com declaração XML (o lxml não aceita a declaração em texto já decodificado)
+            pages.append(f'<?xml version="1.0" encoding="iso-8859-1"?>\n<!DOCTYPE html>\n'
+                         f'<html xmlns="http://www.w3.org/1999/xhtml"><head><title>Página</title></head>'
+                         f'<body><main><article>{body}</article></main></body></html>'.encode('iso-8859-1'))
+            continue
+        pages.append(f'<html><head><meta charset="utf-8"><script>var x = 1;</script></head>'
+                     f'<body><nav><a href="/">Início</a></nav><main><article>{body}</article></main>'
+                     f'<footer>Todos os direitos reservados</footer></body></html>'.encode('utf-8'))
+    return pages
+
+def check_engine_parity(pages):
+    """Páginas em que lxml e html.parser extraem blocos diferentes (ou em que um deles falha)"""
+    mismatches = []
+    for index, page in enumerate(pages):
+        try:
+            same = extract_blocks(page, 'lxml') == extract_blocks(page, 'stdlib')
+        except Exception as e:
+            same = False
+            print(f"⚠️ Página {index}: erro na extração ({e})")
+        if not same:
+            mismatches.append(index)
+    return mismatches
+
+def run(name, extract, pages, repeat):
+    best = None
+    texts = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        texts = [extract(page) for page in pages]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    blocks = sum(len(page_texts) for page_texts in texts)
+    characters = sum(len(text) for page_texts in texts for text in page_texts)
+    return {'name': name, 'seconds': best, 'blocks': blocks, 'characters': characters}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da extração de texto HTML')
+    parser.add_argument('directory', nargs='?', default=os.path.join('collected_data', 'page_cache'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_pages(args.directory) if os.path.isdir(args.directory) else []
+    source = args.directory
+    if not pages:
+        pages = synthetic_pages()
+        source = 'páginas sintéticas'
+
+    total_mb = sum(len(page) for page in pages) / 1024 / 1024
+    print(f"📄 {len(pages)} páginas ({total_mb:.2f} MB) de {source}")
+
+    if etree is not None:
+        mismatches = check_engine_parity(pages)
+        if mismatches:
+            print(f"⚠️ lxml e html.parser diferem em {len(mismatches)} páginas: {mismatches[:10]}")
+        else:
+            print("✅ lxml e html.parser extraem os mesmos blocos em todas as páginas")
+
+    results = []
+    try:
+        results.append(run('bs4 + html.parser (anterior)', legacy_extract, pages, args.repeat))
+    except ImportError:
+        print("⚠️ beautifulsoup4 não instalado: extração anterior não medida")
+    results.append(run('passada única (html.parser)', lambda page: single_pass_extract(page, 'stdlib'), pages, args.repeat))
+    if etree is not None:
+        results.append(run('passada única (lxml)', lambda page: single_pass_extract(page, 'lxml'), pages, args.repeat))
+    else:
+        print("⚠️ lxml não instalado: usando apenas o parser da biblioteca padrão")
+
+    baseline = results[0]['seconds']
+    print(f"{'extrator':<32}{'tempo (s)':>12}{'MB/s':>10}{'ganho':>8}{'blocos':>9}{'caracteres':>13}")
+    for result in results:
+        print(f"{result['name']:<32}{result['seconds']:>12.3f}{total_mb / result['seconds']:>10.2f}"
+              f"{baseline / result['seconds']:>7.1f}x{result['blocks']:>9}{result['characters']:>13}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+import codecs
+import re
+import threading
+from collections import Counter, OrderedDict
+from email.utils import parseaddr
+
+try:
+    from charset_normalizer import from_bytes as normalizer_from_bytes
+except ImportError:
+    normalizer_from_bytes = None
+
+# Candidatos de um byte testados quando o texto não é UTF-8 (em ordem de preferência)
+SINGLE_BYTE_CANDIDATES = ('cp1252', 'iso8859-15', 'cp850')
+
+# Rótulos tratados como windows-1252, como fazem os navegadores (WHATWG):
+# clientes antigos declaram iso-8859-1/ascii e enviam aspas e travessões cp1252
+WINDOWS_1252_ALIASES = {'iso8859-1', 'ascii'}
+
+# Caracteres não-ASCII frequentes em textos em português, espanhol, francês, inglês...
+COMMON_LATIN_CHARS = set('áàâãäéèêëíìîïóòôõöúùûüçñÁÀÂÃÄÉÈÊËÍÌÎÓÒÔÕÖÚÙÛÜÇÑºª°€£§«»“”‘’–—…•\xa0')
+
+# Em idiomas latinos a maior parte dos caracteres é ASCII; acima disso é outro alfabeto
+MAX_NON_ASCII_SHARE = 0.3
+
+# Bytes analisados na detecção (o restante só é decodificado)
+DETECTION_SAMPLE_BYTES = 16384
+
+_NON_ASCII_RE = re.compile(r'[^\x00-\x7f]')
+
+# UTF-8 lido como charset de um byte: o primeiro byte de 'ç', 'ã', 'á'... vira Ã ou Â e o
+# byte de continuação (0x80-0xbf) vira um símbolo ou caractere de controle ("informaÃ§Ã£o")
+_CONTINUATION_CHARS = ''.join(sorted({char for charset in SINGLE_BYTE_CANDIDATES + ('latin-1',)
+                                      for char in bytes(range(0x80, 0xc0)).decode(charset, errors='ignore')}))
+_MOJIBAKE_RE = re.compile('[ÃÂ][' + re.escape(_CONTINUATION_CHARS) + ']')
+
+class CharsetDecoder:
+    """
+    Decodificação de payloads de email com charset declarado ou detectado.
+
+    Ordem: ASCII puro -> charset declarado na parte (UTF-8 válido rotulado
+    como charset de um byte é tratado como UTF-8) -> UTF-8 estrito (não é
+    ambíguo, então vem antes do cache) -> charset que funcionou antes para
+    o mesmo domínio do remetente -> pontuação dos charsets de um byte
+    (proporção de caracteres latinos comuns entre os não-ASCII, sem contar
+    sequências típicas de UTF-8 mal decodificado) -> charset_normalizer, se
+    instalado -> cp1252 com substituição. metrics() conta quantas vezes
+    cada caminho foi usado.
+    """
+
+    def __init__(self, min_score=0.8, max_cached_domains=10000):
+        self.min_score = min_score
+        self.max_cached_domains = max_cached_domains
+        self._domain_charsets = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = Counter()
+        self._charsets = Counter()
+
+    def decode(self, payload, declared=None, sender=None):
+        """Converte bytes em texto; declared é o charset da parte e sender o remetente (From)"""
+        if not payload:
+            return ''
+        if isinstance(payload, str):
+            return payload
+
+        if payload.isascii():
+            self._count('ascii', 'ascii')
+            return payload.decode('ascii')
+
+        declared = self._normalize(declared)
+        if declared and declared != 'utf-8' and self._is_utf8(payload):
+            # Rótulo errado comum: cliente declara iso-8859-1 e envia UTF-8
+            self._count('declared_mislabeled', 'utf-8')
+            return payload.decode('utf-8')
+        if declared:
+            if declared in WINDOWS_1252_ALIASES:
+                declared = 'cp1252'
+            try:
+                text = payload.decode(declared)
+                self._count('declared', declared)
+                return text
+            except UnicodeDecodeError:
+                # Charset declarado errado: segue para a detecção
+                self._count('declared_invalid')
+
+        # UTF-8 válido com bytes altos: o cache do domínio (de um byte) só o corromperia
+        if self._is_utf8(payload):
+            self._count('utf8', 'utf-8')
+            return payload.decode('utf-8')
+
+        domain = self._sender_domain(sender)
+        cached = self._cached_charset(domain)
+        if cached:
+            try:
+                text = payload.decode(cached)
+                if self._latin_score(text[:DETECTION_SAMPLE_BYTES]) >= self.min_score:
+                    self._count('domain_cache', cached)
+                    return text
+            except UnicodeDecodeError:
+                pass
+            self._count('domain_cache_miss')
+
+        charset, text = self.detect(payload)
+        if charset:
+            self._count('detected', charset)
+            self._remember(domain, charset)
+            return text
+
+        self._count('fallback', 'cp1252')
+        return payload.decode('cp1252', errors='replace')
+
+    def detect(self, payload):
+        """Retorna (charset, texto) ou (None, None) quando nenhum candidato é plausível"""
+        if self._is_utf8(payload):
+            return 'utf-8', payload.decode('utf-8')
+
+        sample = payload[:DETECTION_SAMPLE_BYTES]
+        best_score, best_charset = 0.0, None
+        for charset in SINGLE_BYTE_CANDIDATES:
+            try:
+                score = self._latin_score(sample.decode(charset))
+            except UnicodeDecodeError:
+                continue
+            if score > best_score:
+                best_score, best_charset = score, charset
+
+        if best_score >= self.min_score:
+            try:
+                return best_charset, payload.decode(best_charset)
+            except UnicodeDecodeError:
+                pass
+
+        # Provavelmente não é um idioma latino (cirílico, CJK...): detector completo
+        if normalizer_from_bytes is not None:
+            match = normalizer_from_bytes(payload).best()
+            if match is not None:
+                return self._normalize(match.encoding) or match.encoding, str(match)
+
+        return None, None
+
+    def metrics(self):
+        """Contagem por caminho de decodificação e por charset usado"""
+        with self._lock:
+            total = sum(self._charsets.values())
+            fallbacks = self._metrics['fallback'] + self._metrics['declared_invalid']
+            return {
+                'total': total,
+                'paths': dict(self._metrics),
+                'charsets': dict(self._charsets),
+                'fallback_rate': round(fallbacks / total, 4) if total else 0.0,
+                'cached_domains': len(self._domain_charsets),
+            }
+
+    def format_metrics(self):
+        metrics = self.metrics()
+        if not metrics['total']:
+            return 'nenhum payload decodificado'
+        paths = ', '.join(f'{path}: {count}' for path, count in sorted(metrics['paths'].items(), key=lambda item: -item[1]))
+        return f"{metrics['total']} payloads ({paths}; {metrics['fallback_rate']:.1%} com fallback)"
+
+    def _is_utf8(self, payload):
+        # Sequências UTF-8 válidas com bytes altos quase nunca acontecem por acaso
+        try:
+            payload.decode('utf-8')
+            return True
+        except UnicodeDecodeError:
+            return False
+
+    def _latin_score(self, text):
+        """
+        Proporção de caracteres latinos comuns entre os não-ASCII (0 para outros alfabetos).
+        Pares como 'Ã§' (UTF-8 decodificado como um byte) não contam como comuns.
+        """
+        high = _NON_ASCII_RE.findall(text)
+        if not high:
+            return 1.0
+        if len(high) > MAX_NON_ASCII_SHARE * len(text):
+            return 0.0
+        common = _NON_ASCII_RE.findall(_MOJIBAKE_RE.sub('', text))
+        return sum(1 for char in common if char in COMMON_LATIN_CHARS) / len(high)
+
+    def _normalize(self, charset):
+        if not charset:
+            return None
+        try:
+            return codecs.lookup(charset.strip().strip('"\'')).name
+        except LookupError:
+            return None
+
+    def _sender_domain(self, sender):
+        address = parseaddr(sender or '')[1]
+        return address.rpartition('@')[2].lower() or None
+
+    def _cached_charset(self, domain):
+        if not domain:
+            return None
+        with self._lock:
+            charset = self._domain_charsets.get(domain)
+            if charset:
+                self._domain_charsets.move_to_end(domain)
+            return charset
+
+    def _remember(self, domain, charset):
+        if not domain:
+            return
+        with self._lock:
+            self._domain_charsets[domain] = charset
+            self._domain_charsets.move_to_end(domain)
+            while len(self._domain_charsets) > self.max_cached_domains:
+                self._domain_charsets.popitem(last=False)
+
+    def _count(self, path, charset=None):
+        with self._lock:
+            self._metrics[path] += 1
+            if charset:
+                self._charsets[charset] += 1
@@ -1,6 +1,7 @@
 from flask import Flask
 from flask_cors import CORS
 import atexit
+import threading
 import torch
 from .chatbot import ChatBot
 from .routes.chat_routes import register_chat_routes
@@ -11,8 +12,13 @@ from data_collector import DataCollector
 def create_chat_app():
     """Cria e configura a aplicação Flask do chat"""
     
+    # Instanciar coletor de dados (índice de busca do corpus compartilhado com o chatbot)
+    data_collector = DataCollector()
+    
     # Inicializar chatbot
-    chatbot = ChatBot()
+    chatbot = ChatBot(retrieval_index=data_collector.retrieval_index)
+    # Carregar o índice de busca em background: a primeira pergunta não espera a leitura do corpus
+    threading.Thread(target=data_collector.retrieval_index.warm_up, daemon=True).start()
     
     # Tentar carregar modelo
     print("Iniciando sistema de chat...")
@@ -37,9 +43,6 @@ def create_chat_app():
         "http://127.0.0.1:5001"
     ])
     
-    # Instanciar coletor de dados
-    data_collector = DataCollector()
-    
     # Registrar rotas
     register_chat_routes(app, chatbot)
     register_admin_routes(app, chatbot)
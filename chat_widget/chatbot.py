@@ -5,9 +5,17 @@ import os
 from datetime import datetime
 import threading
 import re
+import time
+
+from retrieval_index import tokenize
+
+# Fração mínima dos termos da pergunta presentes na passagem para responder direto do corpus
+RETRIEVAL_MIN_COVERAGE = float(os.environ.get('CHAT_RETRIEVAL_MIN_COVERAGE', 0.6))
 
 class ChatBot:
-    def __init__(self):
+    def __init__(self, retrieval_index=None):
+        # Índice de busca sobre o corpus (RetrievalIndex): respostas de FAQ sem treinar um modelo
+        self.retrieval_index = retrieval_index
         self.model = None
         self.tokenizer = None
         self.model_loaded = False
@@ -23,8 +31,11 @@ class ChatBot:
                 print("Diretório de modelos não encontrado. Sistema funcionará apenas com respostas padrão.")
                 return False
                 
-            # Encontrar o modelo mais recente
-            model_folders = [f for f in os.listdir(models_dir) if f.startswith('trained_')]
+            # Encontrar o modelo mais recente (apenas treinamentos concluídos;
+            # diretórios em andamento contêm só checkpoints)
+            model_folders = [f for f in os.listdir(models_dir) 
+                             if f.startswith('trained_') and 
+                             os.path.exists(os.path.join(models_dir, f, 'training_info.json'))]
             if not model_folders:
                 print("Nenhum modelo treinado encontrado. Sistema funcionará apenas com respostas padrão.")
                 return False
@@ -37,12 +48,16 @@ class ChatBot:
             # Carregar com tratamento de erro melhorado
             try:
                 self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    model_path,
-                    torch_dtype=torch.float32,
-                    device_map="auto" if torch.cuda.is_available() else None,
-                    low_cpu_mem_usage=True
-                )
+                
+                if os.path.exists(os.path.join(model_path, 'adapter_config.json')):
+                    self.model = self._load_lora_model(model_path)
+                else:
+                    self.model = AutoModelForCausalLM.from_pretrained(
+                        model_path,
+                        torch_dtype=torch.float32,
+                        device_map="auto" if torch.cuda.is_available() else None,
+                        low_cpu_mem_usage=True
+                    )
                 
                 if self.tokenizer.pad_token is None:
                     self.tokenizer.pad_token = self.tokenizer.eos_token
@@ -61,6 +76,28 @@ class ChatBot:
             print("Sistema continuará com respostas padrão.")
             return False
     
+    def _load_lora_model(self, model_path):
+        """Carrega modelo base + adaptador LoRA (mesclados por padrão para inferência mais rápida)"""
+        from peft import PeftConfig, PeftModel
+        
+        peft_config = PeftConfig.from_pretrained(model_path)
+        base_model_name = peft_config.base_model_name_or_path
+        print(f"Adaptador LoRA detectado. Modelo base: {base_model_name}")
+        
+        base_model = AutoModelForCausalLM.from_pretrained(
+            base_model_name,
+            torch_dtype=torch.float32,
+            device_map="auto" if torch.cuda.is_available() else None,
+            low_cpu_mem_usage=True
+        )
+        model = PeftModel.from_pretrained(base_model, model_path)
+        
+        if os.environ.get('CHAT_MERGE_LORA', 'true').lower() != 'false':
+            model = model.merge_and_unload()
+            print("Adaptador LoRA mesclado ao modelo base")
+        
+        return model
+    
     def try_load_model_async(self):
         """Tenta carregar modelo em background de forma segura"""
         def load_model_safe():
@@ -81,6 +118,10 @@ class ChatBot:
     def generate_response(self, message, conversation_id=None):
         """Gera resposta usando o modelo treinado (melhorada)"""
         if not self.model_loaded:
+            # Sem modelo: passagem do corpus que responda à pergunta, senão respostas padrão
+            corpus_response = self._get_corpus_response(message)
+            if corpus_response:
+                return corpus_response
             print("Modelo não carregado, usando respostas padrão")
             return self._get_fallback_response(message)
         
@@ -90,6 +131,11 @@ class ChatBot:
             if intelligent_response:
                 return intelligent_response
             
+            # Depois uma passagem do corpus que responda diretamente à pergunta
+            corpus_response = self._get_corpus_response(message)
+            if corpus_response:
+                return corpus_response
+            
             # Se não encontrou padrão, tentar modelo treinado
             return self._generate_ai_response(message, conversation_id)
             
@@ -148,6 +194,42 @@ class ChatBot:
         
         return None
     
+    def _get_corpus_response(self, message, max_chars=700):
+        """Resposta de FAQ a partir da passagem mais relevante do corpus (None sem resultado confiável)"""
+        if self.retrieval_index is None:
+            return None
+        
+        # Perguntas de uma palavra ("oi", "preço") ficam com as respostas padrão
+        if len(set(tokenize(message))) < 2:
+            return None
+        
+        try:
+            started = time.perf_counter()
+            hits = self.retrieval_index.search(message, k=3)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        except Exception as e:
+            print(f"Erro na busca no corpus: {e}")
+            return None
+        
+        if not hits or hits[0]['coverage'] < RETRIEVAL_MIN_COVERAGE:
+            return None
+        
+        best = hits[0]
+        text = best['text']
+        # Pares de conversa/email: responder com a parte do atendente
+        if 'Assistente:' in text:
+            text = text.rsplit('Assistente:', 1)[1]
+        text = re.sub(r'^Assunto:.*\n+', '', text.strip())
+        
+        if len(text) > max_chars:
+            cut = text[:max_chars]
+            sentence_end = max(cut.rfind('. '), cut.rfind('! '), cut.rfind('? '))
+            text = cut[:sentence_end + 1] if sentence_end > max_chars // 2 else cut.rsplit(' ', 1)[0] + '...'
+        
+        print(f"Resposta do corpus ({best['source']}, score {best['score']}, "
+              f"cobertura {best['coverage']:.0%}, {elapsed_ms:.1f}ms)")
+        return text.strip()
+    
     def _get_fallback_response(self, message):
         """Resposta padrão quando modelo não está disponível"""
         message_lower = message.lower().strip()
@@ -187,7 +269,15 @@ class ChatBot:
             return
         
         from .utils import save_conversation_to_file
-        return save_conversation_to_file(self.conversations[conversation_id], self.human_agents)
+        filename = save_conversation_to_file(self.conversations[conversation_id], self.human_agents)
+        
+        # Respostas dos atendentes passam a ser encontradas pela busca no corpus
+        if filename and self.retrieval_index is not None:
+            try:
+                self.retrieval_index.add_chat_file(filename)
+            except Exception as e:
+                print(f"Erro ao indexar conversa para busca: {e}")
+        return filename
 
     def _calculate_duration(self, conversation):
         """Calcula duração da conversa em minutos"""
@@ -0,0 +1,278 @@
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+_DONE = object()
+# Intervalo máximo para uma thread bloqueada em uma fila perceber que o pipeline foi interrompido
+STOP_POLL_SECONDS = 0.1
+
+class PipelineStopped(Exception):
+    """O pipeline foi interrompido: produtores e estágios devem parar"""
+
+class StreamingPipeline:
+    """
+    Pipeline em estágios concorrentes ligados por filas limitadas.
+
+    - Produtores (estágio "fetch") entregam itens com emit(item); cada estágio
+      seguinte roda em suas próprias threads e repassa o que o handler produz
+    - Filas com tamanho máximo dão contrapressão: um estágio lento bloqueia
+      quem está antes dele, então a memória fica limitada pelo tamanho das filas
+    - Contadores por estágio (itens, erros, tempo ocupado e tempo bloqueado
+      esperando espaço na fila seguinte) em stats()
+    - Se run() sai com erro (inclusive do progress_callback, ex.: job
+      cancelado), o pipeline é interrompido: emit() passa a levantar
+      PipelineStopped, os estágios param sem consumir o resto das filas e
+      run() só repassa o erro depois que todas as threads terminaram
+    """
+
+    def __init__(self, queue_size=64, source_stage='fetch'):
+        self.queue_size = queue_size
+        self.source_stage = source_stage
+        self._stages = []
+        self._stats = {source_stage: self._new_stats(0)}
+        self._lock = threading.Lock()
+        self._started = None
+        self._finished = None
+        self._queues = []
+        self._stop = threading.Event()
+
+    def add_stage(self, name, handler, workers=1):
+        """
+        handler(item) roda em uma das `workers` threads do estágio e retorna um
+        iterável de itens para o próximo estágio (None para não repassar nada).
+        """
+        self._stages.append((name, handler, workers))
+        self._stats[name] = self._new_stats(workers)
+        return self
+
+    def run(self, producers, progress_callback=None, progress_interval=2.0):
+        """
+        Executa até todos os produtores terminarem e as filas esvaziarem.
+
+        producers: {nome: função(emit)}, cada um em sua thread.
+        progress_callback(stats) é chamado a cada progress_interval segundos e no fim.
+        Retorna stats().
+        """
+        self._started = time.time()
+        self._queues = [queue.Queue(maxsize=self.queue_size) for _ in self._stages]
+        threads = []
+
+        remaining_producers = [len(producers)]
+        for name, producer in producers.items():
+            threads.append(threading.Thread(target=self._run_producer, args=(name, producer, remaining_producers),
+                                            name=f'pipeline-{self.source_stage}-{name}', daemon=True))
+
+        for index, (name, handler, workers) in enumerate(self._stages):
+            remaining_workers = [workers]
+            for worker in range(workers):
+                threads.append(threading.Thread(target=self._run_stage, args=(index, remaining_workers),
+                                                name=f'pipeline-{name}-{worker}', daemon=True))
+
+        if not producers:
+            self._finish_stage(-1)
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(progress_interval)
+                    if thread.is_alive() and progress_callback:
+                        progress_callback(self.stats())
+        except BaseException:
+            # Quem chamou pode liberar os recursos dos estágios (arquivos, sessões) logo em seguida
+            self.stop()
+            for thread in threads:
+                thread.join()
+            raise
+
+        self._finished = time.time()
+        stats = self.stats()
+        if progress_callback:
+            progress_callback(stats)
+        return stats
+
+    def stop(self):
+        """Interrompe produtores e estágios (itens ainda nas filas são descartados)"""
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def stats(self):
+        """Contadores por estágio; items_per_second considera o tempo desde o início da execução"""
+        elapsed = max((self._finished or time.time()) - (self._started or time.time()), 1e-9)
+        snapshot = {}
+        with self._lock:
+            for name, counts in self._stats.items():
+                stage = dict(counts)
+                stage['busy_seconds'] = round(stage['busy_seconds'], 3)
+                stage['blocked_seconds'] = round(stage['blocked_seconds'], 3)
+                stage['items_per_second'] = round(stage['items_out'] / elapsed, 2)
+                snapshot[name] = stage
+
+        for index, (name, _, _) in enumerate(self._stages):
+            if index < len(self._queues):
+                snapshot[name]['queued'] = self._queues[index].qsize()
+        return snapshot
+
+    def format_stats(self, stats=None):
+        stats = stats or self.stats()
+        return ' → '.join(f"{name}: {stage['items_out']} ({stage['items_per_second']}/s"
+                          f"{', ' + str(stage['errors']) + ' erros' if stage['errors'] else ''})"
+                          for name, stage in stats.items())
+
+    def _new_stats(self, workers):
+        return {'workers': workers, 'items_in': 0, 'items_out': 0, 'errors': 0,
+                'busy_seconds': 0.0, 'blocked_seconds': 0.0}
+
+    def _count(self, stage, **increments):
+        with self._lock:
+            counts = self._stats[stage]
+            for key, value in increments.items():
+                counts[key] += value
+
+    def _emit(self, stage, index, item):
+        """Entrega um item ao estágio `index` (bloqueia enquanto a fila estiver cheia)"""
+        started = time.perf_counter()
+        if not self._put(self._queues[index], item):
+            raise PipelineStopped('Pipeline interrompido')
+        self._count(stage, items_out=1, blocked_seconds=time.perf_counter() - started)
+
+    def _put(self, target, item):
+        """put() que desiste quando o pipeline é interrompido (retorna False)"""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=STOP_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run_producer(self, name, producer, remaining):
+        stage = self.source_stage
+        with self._lock:
+            self._stats[stage]['workers'] += 1
+        try:
+            producer(lambda item: self._emit(stage, 0, item))
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            self._count(stage, errors=1)
+            print(f"❌ Erro no produtor {name}: {e}")
+        finally:
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._finish_stage(-1)
+
+    def _run_stage(self, index, remaining):
+        name, handler, _ = self._stages[index]
+        input_queue = self._queues[index]
+        try:
+            while not self._stop.is_set():
+                try:
+                    item = input_queue.get(timeout=STOP_POLL_SECONDS)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+
+                self._count(name, items_in=1)
+                started = time.perf_counter()
+                try:
+                    outputs = handler(item)
+                    if index + 1 < len(self._stages):
+                        for output in outputs or ():
+                            self._emit(name, index + 1, output)
+                    else:
+                        # Último estágio: saída é o item consumido
+                        self._count(name, items_out=1)
+                except PipelineStopped:
+                    break
+                except Exception as e:
+                    self._count(name, errors=1)
+                    print(f"❌ Erro no estágio {name}: {e}")
+                self._count(name, busy_seconds=time.perf_counter() - started)
+        finally:
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._finish_stage(index)
+
+    def _finish_stage(self, index):
+        """Avisa todas as threads do estágio seguinte que não há mais itens"""
+        next_index = index + 1
+        if next_index < len(self._stages):
+            for _ in range(self._stages[next_index][2]):
+                self._put(self._queues[next_index], _DONE)
+
+class ShardWriter:
+    """
+    Grava textos em shards JSONL (part-00000.jsonl, ...) à medida que chegam.
+
+    Cada lote é gravado e descarregado no disco logo em seguida, então uma
+    interrupção no meio da coleta preserva tudo o que já foi escrito. Ao abrir
+    um diretório com shards existentes, continua a numeração.
+    """
+
+    def __init__(self, directory, shard_size=1000):
+        self.directory = directory
+        self.shard_size = shard_size
+        os.makedirs(directory, exist_ok=True)
+
+        self._file = None
+        self._in_shard = 0
+        self._next_index = len(shard_paths(directory))
+        self.count = 0
+
+    def write(self, records):
+        """records: iterável de {'text', 'source'}; retorna quantos foram gravados"""
+        written = 0
+        for record in records:
+            if self._file is None:
+                path = os.path.join(self.directory, f'part-{self._next_index:05d}.jsonl')
+                self._file = open(path, 'a', encoding='utf-8')
+                self._next_index += 1
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._in_shard += 1
+            written += 1
+            if self._in_shard >= self.shard_size:
+                self._close_shard()
+
+        if self._file is not None:
+            self._file.flush()
+        self.count += written
+        return written
+
+    def close(self):
+        self._close_shard()
+
+    def _close_shard(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._in_shard = 0
+
+def shard_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, 'part-*.jsonl')))
+
+def read_shards(directory):
+    """Registros gravados pelo ShardWriter (linha incompleta de uma gravação interrompida é ignorada)"""
+    for path in shard_paths(directory):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+class ContentHashIndex:
+    """
+    Índice persistente (SQLite) com o hash SHA-1 de cada texto já gravado no corpus.
+
+    O coletor consulta o índice antes de salvar um collected_data_*.json, então
+    o corpus nunca contém o mesmo texto duas vezes e o carregamento para
+    retreinamento não precisa deduplicar os arquivos anteriores.
+
+    Na primeira execução o corpus existente é indexado em background; até
+    terminar, filter_new() e contains() esperam (sem resposta incompleta).
+    """
+
+    # Limite de parâmetros por consulta IN (...) do SQLite
+    QUERY_CHUNK = 500
+
+    def __init__(self, db_path='training_data/content_index.db', data_dir='training_data'):
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        is_new = not os.path.exists(db_path)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS content_hashes (
+                    digest BLOB PRIMARY KEY,
+                    data_file TEXT,
+                    added_at TEXT
+                ) WITHOUT ROWID
+            ''')
+            rebuild_pending = _mark_rebuild(conn, is_new)
+
+        self._ready = threading.Event()
+        if rebuild_pending:
+            # Primeira execução: indexar o corpus já existente sem atrasar a inicialização dos apps
+            threading.Thread(target=self._initial_rebuild, name='content-index-rebuild', daemon=True).start()
+        else:
+            self._ready.set()
+
+    def wait_ready(self, timeout=None):
+        """Espera a indexação inicial do corpus (True quando concluída)"""
+        return self._ready.wait(timeout)
+
+    def digest(self, text):
+        """Hash do texto normalizado (espaços e maiúsculas não diferenciam textos)"""
+        normalized = re.sub(r'\s+', ' ', text.lower()).strip()
+        return hashlib.sha1(normalized.encode('utf-8')).digest()
+
+    def filter_new(self, texts):
+        """
+        Retorna (textos_novos, duplicados): descarta textos já indexados e
+        repetições dentro do próprio lote, preservando a ordem.
+        """
+        self._ready.wait()
+        by_digest = {}
+        for text in texts:
+            by_digest.setdefault(self.digest(text), text)
+
+        known = self._existing_digests(list(by_digest))
+        new_texts = [text for digest, text in by_digest.items() if digest not in known]
+
+        return new_texts, len(texts) - len(new_texts)
+
+    def add(self, texts, data_file=None):
+        """Registra os textos gravados no corpus; retorna quantos hashes eram novos"""
+        added_at = datetime.now().isoformat()
+        rows = [(self.digest(text), data_file, added_at) for text in texts]
+
+        with self._lock, self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO content_hashes VALUES (?, ?, ?)', rows)
+            return conn.total_changes - before
+
+    def contains(self, text):
+        self._ready.wait()
+        return bool(self._existing_digests([self.digest(text)]))
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM content_hashes').fetchone()[0]
+
+    def rebuild_from_files(self):
+        """Indexa os textos de todos os collected_data_*.json do diretório de dados"""
+        if not os.path.exists(self.data_dir):
+            return 0
+
+        added = 0
+        for filename in sorted(os.listdir(self.data_dir)):
+            if not (filename.startswith('collected_data_') and filename.endswith('.json')):
+                continue
+
+            file_path = os.path.join(self.data_dir, filename)
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    texts = json.load(f).get('texts', [])
+                added += self.add([text for text in texts if isinstance(text, str)], file_path)
+            except Exception as e:
+                print(f"Erro ao indexar {filename}: {e}")
+
+        print(f"🗂️ Índice de conteúdo criado: {added} textos do corpus existente")
+        return added
+
+    def _initial_rebuild(self):
+        try:
+            self.rebuild_from_files()
+            _finish_rebuild(self._connect)
+        except Exception as e:
+            print(f"Erro na indexação inicial do corpus: {e}")
+        finally:
+            self._ready.set()
+
+    def _existing_digests(self, digests):
+        known = set()
+        with self._connect() as conn:
+            for start in range(0, len(digests), self.QUERY_CHUNK):
+                chunk = digests[start:start + self.QUERY_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(f'SELECT digest FROM content_hashes WHERE digest IN ({placeholders})', chunk)
+                known.update(row[0] for row in rows)
+        return known
+
+    def _connect(self):
+        # Conexão por operação: o índice é usado por threads de jobs e de requisições
+        return _ClosingConnection(sqlite3.connect(self.db_path, timeout=30))
+
+def _mark_rebuild(conn, is_new):
+    """
+    Indica se o índice ainda precisa da indexação inicial do corpus. A marca
+    fica no banco: uma indexação interrompida é retomada na próxima inicialização.
+    """
+    conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    if is_new:
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('rebuild_pending', '1')")
+    return conn.execute("SELECT 1 FROM meta WHERE key = 'rebuild_pending'").fetchone() is not None
+
+def _finish_rebuild(connect):
+    with connect() as conn:
+        conn.execute("DELETE FROM meta WHERE key = 'rebuild_pending'")
+
+class _ClosingConnection:
+    """Context manager que faz commit/rollback e fecha a conexão SQLite"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.conn.close()
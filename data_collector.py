@@ -1,5 +1,4 @@
 import requests
-from bs4 import BeautifulSoup
 import imaplib
 import smtplib
 import email
@@ -12,7 +11,48 @@ import json
 from datetime import datetime
 import re
 import time
+import itertools
+import shutil
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from content_index import ContentHashIndex
+from text_quality import TextQualityFilter
+from web_fetcher import WebFetcher
+from page_cache import PageCache
+from html_extraction import extract_blocks, extract_page
+from email_sync import EmailSyncCheckpoint, MailboxSync, ImapConnectionPool, SyncProgress
+from site_crawler import SiteCrawler
+from email_threads import EmailThreadBuilder, EmailThreadStore
+from charset_decoding import CharsetDecoder
+from collection_pipeline import read_shards
+from embedding_service import EmbeddingService
+from retrieval_index import RetrievalIndex, default_encoder
+
+# Incrementar ao mudar a extração/filtragem: invalida textos reaproveitados do cache de páginas
+EXTRACTION_VERSION = 4
+
+def extract_web_texts(content, keywords=None):
+    """Extrai textos relevantes do HTML (função de módulo: roda no pool de parsing)"""
+    # Passada única: cada bloco folha aparece uma vez (sem repetir o texto dos filhos em div/section)
+    return _relevant_texts(extract_blocks(content), keywords)
+
+def extract_web_page(content, keywords=None):
+    """Textos relevantes e links da página (parse do crawler, roda no pool de parsing)"""
+    blocks, links = extract_page(content)
+    return _relevant_texts(blocks, keywords), links
+
+def _relevant_texts(blocks, keywords):
+    text_content = []
+    for block in blocks:
+        text = block['text']
+        # Filtros mais flexíveis
+        if len(text) >= 20:  # Mínimo de 20 caracteres
+            # Se não há keywords, aceita qualquer texto válido
+            if not keywords or any(keyword.lower() in text.lower() for keyword in keywords):
+                text_content.append(text)
+    
+    return text_content
 
 class DataCollector:
     def __init__(self, config_manager = None):
@@ -21,6 +61,22 @@ class DataCollector:
         self.base_dir = 'collected_data'
         self.data_dir = Path(self.base_dir)
         self.ensure_directory()
+        # Hashes de tudo que já foi gravado no corpus (training_data/collected_data_*)
+        self.content_index = ContentHashIndex()
+        # Filtro de qualidade em lote (regras extras via quality_filter.add_rule)
+        self.quality_filter = TextQualityFilter()
+        self.last_quality_stats = None
+        # Downloads concorrentes com pool de conexões compartilhado e revalidação via cache em disco
+        self.page_cache = PageCache(os.path.join(self.base_dir, 'page_cache'))
+        self.web_fetcher = WebFetcher(page_cache=self.page_cache)
+        # Maior UID processado por conta/pasta IMAP (coleta de emails incremental)
+        self.email_checkpoint = EmailSyncCheckpoint(os.path.join(self.base_dir, 'email_checkpoints.json'))
+        # Threads de email: mensagens de coletas anteriores ficam disponíveis para montar pares pergunta/resposta
+        self.email_threads = EmailThreadBuilder(EmailThreadStore(os.path.join(self.base_dir, 'email_threads.db')))
+        # Charset declarado ou detectado, com cache do charset por domínio do remetente
+        self.charset_decoder = CharsetDecoder()
+        # Busca BM25 (e embeddings, com RETRIEVAL_EMBEDDING_MODEL) sobre o corpus, atualizada a cada gravação
+        self.retrieval_index = RetrievalIndex(encoder=default_encoder())
     
     def ensure_directory(self):
         """Garantir que o diretório existe"""
@@ -30,10 +86,10 @@ class DataCollector:
     def collect_data(self, config):
         """Coleta dados baseado na configuração fornecida"""
         try:
-            # Coletar dados da web
+            # Coletar dados da web (todas as URLs em paralelo)
             if config.get('web_sources'):
-                for url in config['web_sources']:
-                    self.scrape_website(url, config.get('keywords', []))
+                self.collect_web_sources(config['web_sources'], config.get('keywords', []),
+                                         config.get('fetch_config'))
             
             # Coletar dados de emails
             if config.get('email_config'):
@@ -73,35 +129,17 @@ class DataCollector:
             response = requests.get(url, headers=headers, timeout=10)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove elementos desnecessários
-            for element in soup(['script', 'style', 'nav', 'header', 'footer', 'aside']):
-                element.decompose()
+            blocks = extract_blocks(response.content)
             
             # Extrair texto relevante com prioridades
-            texts = []
-            
-            # Prioridade 1: Conteúdo principal
-            main_tags = ['main', 'article', 'section[class*="content"]', 'div[class*="content"]']
-            for selector in main_tags:
-                elements = soup.select(selector)
-                for element in elements:
-                    paragraphs = element.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'li'])
-                    for p in paragraphs:
-                        text = p.get_text().strip()
-                        if self.is_relevant_text(text, keywords):
-                            texts.append(text)
-            
-            # Prioridade 2: Se não encontrou conteúdo principal, busca em todos os parágrafos
+            # Prioridade 1: Conteúdo principal (main, article, section/div com "content" na classe)
+            texts = [block['text'] for block in blocks
+                     if block['in_main_content'] and self.is_relevant_text(block['text'], keywords)]
+            
+            # Prioridade 2: Se não encontrou conteúdo principal, busca em todos os blocos
             if not texts:
                 print(f"⚠️ Nenhum conteúdo principal encontrado em {url}, buscando em todos os elementos...")
-                for tag in ['p', 'h1', 'h2', 'h3', 'h4', 'li', 'td']:
-                    elements = soup.find_all(tag)
-                    for element in elements:
-                        text = element.get_text().strip()
-                        if self.is_relevant_text(text, keywords):
-                            texts.append(text)
+                texts = [block['text'] for block in blocks if self.is_relevant_text(block['text'], keywords)]
             
             # Adicionar dados coletados
             valid_texts = []
@@ -124,101 +162,183 @@ class DataCollector:
         except Exception as e:
             print(f"❌ Erro no scraping de {url}: {e}")
     
-    def collect_emails(self, email_config):
-        """Coleta emails com suporte a diferentes provedores"""
+    def collect_emails(self, email_config, progress_callback=None, checkpoints=None, collected=None):
+        """
+        Coleta emails com suporte a diferentes provedores.
+        
+        email_config pode listar várias contas em 'accounts' (campos ausentes
+        são herdados da configuração principal) e várias pastas em 'folders'.
+        As pastas são sincronizadas em paralelo sobre um pool limitado de
+        conexões IMAP (max_connections, max_connections_per_account).
+        progress_callback(snapshot) recebe o progresso por conta.
+        Com checkpoints (dict), o maior UID de cada pasta fica reservado nele
+        em vez de gravado: quem chama confirma com commit_email_checkpoints
+        depois que os textos chegaram ao corpus.
+        As mensagens vão para self.collected_data, ou para a lista collected.
+        """
         try:
-            # Configurações do servidor IMAP
-            imap_server = email_config['imap_server']
-            imap_port = email_config.get('imap_port', 993)
-            username = email_config['username']
-            password = email_config['password']
-            use_ssl = email_config.get('use_ssl', True)
-            
-            print(f"Conectando ao servidor IMAP: {imap_server}:{imap_port}")
-            
-            # Conectar ao servidor IMAP
-            if use_ssl:
-                mail = imaplib.IMAP4_SSL(imap_server, imap_port)
-            else:
-                mail = imaplib.IMAP4(imap_server, imap_port)
-                if email_config.get('use_starttls', False):
-                    mail.starttls()
-            
-            # Fazer login
-            mail.login(username, password)
-            print("Login realizado com sucesso")
-            
-            # Selecionar caixa de entrada
-            mail.select('inbox')
-            
-            # Buscar emails recentes (últimos 50)
-            search_criteria = 'ALL'
-            if email_config.get('only_unread', False):
-                search_criteria = 'UNSEEN'
-            
-            status, messages = mail.search(None, search_criteria)
-            
-            if status != 'OK':
-                print("Erro ao buscar emails")
-                return
-            
-            # Pegar IDs dos emails
-            email_ids = messages[0].split()
-            
-            # Limitar a últimos 50 emails para evitar sobrecarga
-            email_ids = email_ids[-50:] if len(email_ids) > 50 else email_ids
-            
-            print(f"Processando {len(email_ids)} emails...")
-            
-            for i, msg_id in enumerate(email_ids):
-                try:
-                    # Buscar email
-                    status, msg_data = mail.fetch(msg_id, '(RFC822)')
-                    
-                    if status != 'OK':
-                        continue
-                    
-                    # Parsear email
-                    msg = email.message_from_bytes(msg_data[0][1])
-                    
-                    # Extrair informações
-                    subject = self.decode_header_value(msg.get('Subject', ''))
-                    from_addr = self.decode_header_value(msg.get('From', ''))
-                    date = msg.get('Date', '')
-                    
-                    # Extrair conteúdo
-                    content = self.extract_email_content(msg)
-                    
-                    if content and len(content.strip()) > 20:
-                        # Combinar assunto e conteúdo
-                        full_content = f"Assunto: {subject}\n\n{content}"
-                        
-                        self.collected_data.append({
-                            'source': f"Email de {from_addr}",
-                            'type': 'email',
-                            'content': full_content,
-                            'subject': subject,
-                            'from': from_addr,
-                            'date': date,
-                            'timestamp': datetime.now().isoformat()
-                        })
-                    
-                    # Mostrar progresso
-                    if (i + 1) % 10 == 0:
-                        print(f"Processados {i + 1}/{len(email_ids)} emails")
-                
-                except Exception as e:
-                    print(f"Erro ao processar email {msg_id}: {e}")
-                    continue
+            accounts = self.email_accounts(email_config)
+            tasks = [(account, folder) for account in accounts for folder in account['folders']]
+            
+            folders_by_account = {}
+            for account, _ in tasks:
+                key = self._email_account_key(account)
+                folders_by_account[key] = folders_by_account.get(key, 0) + 1
+            progress = SyncProgress(folders_by_account, progress_callback)
+            
+            pool = ImapConnectionPool(self._connect_imap,
+                                      max_connections=email_config.get('max_connections', 4),
+                                      max_per_account=email_config.get('max_connections_per_account', 2))
+            print(f"Coletando {len(tasks)} pastas de {len(accounts)} contas "
+                  f"(até {pool.max_connections} conexões IMAP simultâneas)")
+            
+            try:
+                with ThreadPoolExecutor(max_workers=min(pool.max_connections, len(tasks)) or 1,
+                                        thread_name_prefix='imap') as executor:
+                    futures = {executor.submit(self._sync_email_folder, pool, account, folder, progress,
+                                               checkpoints, collected): (account, folder)
+                               for account, folder in tasks}
+                    for future in as_completed(futures):
+                        account, folder = futures[future]
+                        try:
+                            future.result()
+                        except Exception as e:
+                            print(f"Erro na coleta de {account['username']}/{folder}: {e}")
+            finally:
+                pool.close_all()
             
-            mail.close()
-            mail.logout()
-            print(f"Coleta de emails concluída: {len([d for d in self.collected_data if d['type'] == 'email'])} emails coletados")
+            print(f"🔤 Decodificação de emails: {self.charset_decoder.format_metrics()}")
+            emails = len([d for d in (self.collected_data if collected is None else collected) if d['type'] == 'email'])
+            print(f"Coleta de emails concluída: {emails} emails coletados")
             
         except Exception as e:
             print(f"Erro na coleta de emails: {e}")
+            return
+        
+        if progress.error is not None:
+            raise progress.error
     
-    def decode_header_value(self, value):
+    def email_accounts(self, email_config):
+        """Contas da configuração, cada uma com a lista de pastas em 'folders'"""
+        if email_config.get('accounts'):
+            shared = {key: value for key, value in email_config.items() if key != 'accounts'}
+            accounts = [{**shared, **account} for account in email_config['accounts']]
+        else:
+            accounts = [dict(email_config)]
+        
+        for account in accounts:
+            account['folders'] = account.get('folders') or [account.get('folder', 'inbox')]
+        return accounts
+    
+    def _email_account_key(self, account):
+        return f"{account['username']}@{account['imap_server']}"
+    
+    def _connect_imap(self, account):
+        """Abre e autentica uma conexão IMAP para a conta"""
+        # Configurações do servidor IMAP
+        imap_server = account['imap_server']
+        imap_port = account.get('imap_port', 993)
+        
+        print(f"Conectando ao servidor IMAP: {imap_server}:{imap_port} ({account['username']})")
+        
+        # Conectar ao servidor IMAP
+        if account.get('use_ssl', True):
+            mail = imaplib.IMAP4_SSL(imap_server, imap_port)
+        else:
+            mail = imaplib.IMAP4(imap_server, imap_port)
+            if account.get('use_starttls', False):
+                mail.starttls()
+        
+        # Fazer login
+        mail.login(account['username'], account['password'])
+        print("Login realizado com sucesso")
+        return mail
+    
+    def _sync_email_folder(self, pool, account, folder, progress, checkpoints=None, collected=None):
+        """Sincroniza uma pasta usando uma conexão do pool (roda em thread do pool)"""
+        key = self._email_account_key(account)
+        error = False
+        try:
+            with pool.connection(key, account) as mail:
+                # Sincronização incremental por UID: só mensagens novas desde o último checkpoint
+                sync = MailboxSync(
+                    mail, key, self.email_checkpoint,
+                    backfill_limit=account.get('backfill_limit', 50),
+                    backfill_days=account.get('backfill_days'),
+                    only_unread=account.get('only_unread', False),
+                    max_messages=account.get('max_messages'),
+                    full_resync=account.get('full_resync', False)
+                )
+                uidvalidity, uids, mode = sync.pending_uids(folder)
+                progress.folder_started(key, len(uids))
+                
+                if mode == 'incremental':
+                    print(f"Sincronização incremental de {key}/{folder}: {len(uids)} emails novos")
+                else:
+                    print(f"Primeira sincronização de {key}/{folder} (backfill): processando {len(uids)} emails...")
+                
+                # Lotes de UIDs: cabeçalhos + BODYSTRUCTURE e depois só a parte de texto (anexos não são baixados)
+                batches = sync.fetch_messages(uids, batch_size=account.get('fetch_batch_size', 200),
+                                              max_body_bytes=account.get('max_body_bytes', 262144))
+                for batch_uids, messages in batches:
+                    if progress.error is not None:
+                        # Quem acompanha a coleta pediu para parar (ex.: job cancelado)
+                        raise progress.error
+                    for uid, raw_message in messages:
+                        try:
+                            self._store_email_message(email.message_from_bytes(raw_message), collected)
+                        except Exception as e:
+                            print(f"Erro ao processar email {uid}: {e}")
+                    
+                    if checkpoints is None:
+                        # Checkpoint por lote e por pasta: uma conexão perdida não repete os lotes já processados
+                        sync.save(folder, uidvalidity, batch_uids[-1])
+                    else:
+                        checkpoints[(key, folder)] = (uidvalidity, batch_uids[-1])
+                    progress.advance(key, len(batch_uids))
+        except Exception:
+            error = True
+            raise
+        finally:
+            progress.folder_finished(key, error)
+    
+    def commit_email_checkpoints(self, checkpoints):
+        """Grava os checkpoints reservados por collect_emails (chamar depois de salvar os textos)"""
+        for (account, folder), (uidvalidity, last_uid) in list(checkpoints.items()):
+            self.email_checkpoint.update(account, folder, uidvalidity, last_uid)
+        checkpoints.clear()
+    
+    def _store_email_message(self, msg, collected=None):
+        """Extrai assunto, remetente e conteúdo da mensagem e adiciona à coleção (ou a collected)"""
+        # Extrair informações
+        sender = str(msg.get('From', ''))
+        subject = self.decode_header_value(msg.get('Subject', ''), sender)
+        from_addr = self.decode_header_value(msg.get('From', ''), sender)
+        date = msg.get('Date', '')
+        
+        # Extrair conteúdo
+        content = self.extract_email_content(msg)
+        
+        if content and len(content.strip()) > 20:
+            # Combinar assunto e conteúdo
+            full_content = f"Assunto: {subject}\n\n{content}"
+            
+            (self.collected_data if collected is None else collected).append({
+                'source': f"Email de {from_addr}",
+                'type': 'email',
+                'content': full_content,
+                'body': content,
+                'subject': subject,
+                'from': from_addr,
+                'date': date,
+                # Cabeçalhos para reconstruir as threads
+                'message_id': msg.get('Message-ID', ''),
+                'in_reply_to': msg.get('In-Reply-To', ''),
+                'references': msg.get('References', ''),
+                'timestamp': datetime.now().isoformat()
+            })
+    
+    def decode_header_value(self, value, sender=None):
         """Decodifica headers de email que podem estar em diferentes encodings"""
         if not value:
             return ""
@@ -229,10 +349,7 @@ class DataCollector:
             
             for part, encoding in decoded_parts:
                 if isinstance(part, bytes):
-                    if encoding:
-                        decoded_value += part.decode(encoding)
-                    else:
-                        decoded_value += part.decode('utf-8', errors='ignore')
+                    decoded_value += self.charset_decoder.decode(part, encoding, sender)
                 else:
                     decoded_value += str(part)
             
@@ -242,8 +359,9 @@ class DataCollector:
             return str(value)
     
     def extract_email_content(self, msg):
-        """Extrai conteúdo de texto do email com melhor tratamento de encoding"""
+        """Extrai conteúdo de texto do email (charset declarado na parte ou detectado)"""
         content = ""
+        sender = str(msg.get('From', ''))
         
         try:
             if msg.is_multipart():
@@ -256,14 +374,7 @@ class DataCollector:
                         try:
                             payload = part.get_payload(decode=True)
                             if payload:
-                                # Tentar diferentes encodings
-                                for encoding in ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']:
-                                    try:
-                                        content = payload.decode(encoding)
-                                        break
-                                    except UnicodeDecodeError:
-                                        continue
-                                
+                                content = self.charset_decoder.decode(payload, part.get_content_charset(), sender)
                                 if content:
                                     break
                         except Exception as e:
@@ -274,12 +385,7 @@ class DataCollector:
                 try:
                     payload = msg.get_payload(decode=True)
                     if payload:
-                        for encoding in ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']:
-                            try:
-                                content = payload.decode(encoding)
-                                break
-                            except UnicodeDecodeError:
-                                continue
+                        content = self.charset_decoder.decode(payload, msg.get_content_charset(), sender)
                 except Exception as e:
                     print(f"Erro ao extrair conteúdo simples: {e}")
         
@@ -288,16 +394,25 @@ class DataCollector:
         
         return content.strip() if content else ""
     
-    def collect_email_data(self, email_config):
-        """Método para compatibilidade com app.py - coleta dados de email"""
+    def collect_email_data(self, email_config, progress_callback=None, checkpoints=None, keep_in_memory=True):
+        """
+        Método para compatibilidade com app.py - coleta dados de email.
+        Com keep_in_memory=False as mensagens desta coleta não ficam em
+        self.collected_data (coletas em pipeline, que gravam direto no disco).
+        """
+        collected = None if keep_in_memory else []
+        # Erro do progress_callback (ex.: job cancelado) interrompe a coleta e chega a quem chamou
+        self.collect_emails(email_config, progress_callback, checkpoints, collected)
+        
         try:
-            self.collect_emails(email_config)
-            
-            # Extrair apenas o conteúdo dos emails coletados
-            email_texts = []
-            for item in self.collected_data:
-                if item.get('type') == 'email':
-                    email_texts.append(item['content'])
+            email_items = [item for item in (self.collected_data if collected is None else collected)
+                           if item.get('type') == 'email']
+            if email_config.get('reconstruct_threads', True):
+                # Threads: sem histórico citado nem assinaturas, respostas viram pares pergunta/resposta
+                email_texts = self.email_threads.build_texts(email_items)
+            else:
+                # Extrair apenas o conteúdo dos emails coletados
+                email_texts = [item['content'] for item in email_items]
             
             print(f"📧 Extraídos {len(email_texts)} textos de email")
             return email_texts
@@ -309,72 +424,165 @@ class DataCollector:
     def collect_web_data(self, url, keywords=None):
         """Coleta dados de uma URL web (corrigida para retornar lista de textos)"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove scripts e estilos
-            for script in soup(["script", "style", "nav", "header", "footer", "aside"]):
-                script.decompose()
+            fetch_result = self.web_fetcher.fetch(url)
+            if not fetch_result.ok:
+                print(f"❌ Erro de requisição para {url}: {fetch_result.error}")
+                return []
             
-            # Extrai texto das tags principais com melhor seleção
-            content_tags = soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'article', 'section', 'div', 'li'])
-            text_content = []
+            variant = self._extraction_variant(keywords)
+            cached_texts = self._reuse_extracted(fetch_result, variant)
+            if cached_texts is not None:
+                return self._store_cached_web_texts(url, cached_texts)
             
-            for tag in content_tags:
-                text = tag.get_text(strip=True)
-                # Filtros mais flexíveis
-                if text and len(text) >= 20:  # Mínimo de 20 caracteres
-                    # Se não há keywords, aceita qualquer texto válido
-                    if not keywords or any(keyword.lower() in text.lower() for keyword in keywords):
-                        text_content.append(text)
+            text_content = extract_web_texts(fetch_result.content, keywords)
+            valid_texts = self._store_web_texts(url, text_content)
+            self.page_cache.put_extracted(url, variant, valid_texts)
+            return valid_texts
             
-            result_string = '\n'.join(text_content)
-            print(f"📊 Coletado {len(text_content)} textos, total de caracteres: {len(result_string)}")
-            
-            # Debug: mostrar amostra do conteúdo
-            if result_string:
-                print(f"🔍 Amostra do conteúdo coletado: {result_string[:300]}...")
-                
-            # Validar se o resultado tem conteúdo útil
-            valid_paragraphs = [p for p in result_string.split('\n') if len(p.strip()) >= 30]
-            print(f"📋 Parágrafos válidos encontrados: {len(valid_paragraphs)}")
-            
-            if valid_paragraphs:
-                print(f"✅ Exemplo de parágrafo válido: {valid_paragraphs[0][:100]}...")
-                
-            # IMPORTANTE: Processar e armazenar os dados válidos
-            processed_data = self.process_collected_text(result_string, url)
-            if processed_data:
-                self.collected_data.extend(processed_data)
-                print(f"💾 Adicionados {len(processed_data)} itens válidos à coleção")
-            
-            # RETORNAR LISTA DE TEXTOS VÁLIDOS (não string)
-            valid_texts = [p.strip() for p in valid_paragraphs if len(p.strip()) >= 30]
-            print(f"🔄 Retornando {len(valid_texts)} textos válidos para o app.py")
-            
-            return valid_texts  # Retorna lista, não string
-            
-        except requests.RequestException as e:
-            print(f"❌ Erro de requisição para {url}: {e}")
-            return []
         except Exception as e:
             print(f"❌ Erro ao processar {url}: {e}")
             return []
 
+    def collect_web_sources(self, urls, keywords=None, fetch_config=None, crawl_config=None, on_texts=None):
+        """
+        Coleta várias URLs em paralelo (downloads e parsing concorrentes).
+        
+        Retorna {url: lista de textos válidos}, como collect_web_data para cada URL.
+        Com crawl_config as URLs são sementes e os links das páginas são seguidos.
+        Com on_texts(url, textos) os textos de cada página são entregues assim
+        que ficam prontos e não são acumulados: o retorno traz {url: quantidade}.
+        """
+        if crawl_config:
+            return self.crawl_web_sources(urls, keywords, crawl_config, fetch_config, on_texts)
+        
+        fetcher = self._get_web_fetcher(fetch_config)
+        
+        # Página não modificada (304): reaproveitar textos já extraídos e filtrados
+        variant = self._extraction_variant(keywords)
+        reuse = (lambda fetch_result: self._reuse_extracted(fetch_result, variant)) if fetcher.page_cache else None
+        collected = {}
+        
+        def on_result(url, fetch_result, output):
+            try:
+                if fetch_result.reused:
+                    texts = self._store_cached_web_texts(url, output, keep_in_memory=on_texts is None)
+                elif output is not None:
+                    texts = self._store_web_texts(url, output, keep_in_memory=on_texts is None)
+                    if fetcher.page_cache:
+                        fetcher.page_cache.put_extracted(url, variant, texts)
+                else:
+                    texts = []
+            except Exception as e:
+                print(f"❌ Erro ao processar {url}: {e}")
+                texts = []
+            collected[url] = self._deliver_web_texts(url, texts, on_texts)
+        
+        fetcher.fetch_all(urls, extract_web_texts, (keywords,), reuse=reuse, on_result=on_result)
+        # Mesma ordem das URLs informadas
+        return {url: collected[url] for url in dict.fromkeys(urls) if url in collected}
+
+    def crawl_web_sources(self, seeds, keywords=None, crawl_config=None, fetch_config=None, on_texts=None):
+        """
+        Coleta sites inteiros a partir das URLs semente (SiteCrawler).
+        
+        crawl_config: max_depth, max_pages, politeness_delay, same_domain,
+        respect_robots, include_patterns, exclude_patterns.
+        Retorna {url: lista de textos válidos} de cada página visitada
+        ({url: quantidade} com on_texts, como em collect_web_sources).
+        """
+        crawler = SiteCrawler(self._get_web_fetcher(fetch_config), **(crawl_config or {}))
+        collected = {}
+        
+        def on_page(url, fetch_result, text_content):
+            # Validação e filtragem de cada página enquanto as demais são baixadas
+            try:
+                texts = self._store_web_texts(url, text_content, keep_in_memory=on_texts is None)
+            except Exception as e:
+                print(f"❌ Erro ao processar {url}: {e}")
+                texts = []
+            collected[url] = self._deliver_web_texts(url, texts, on_texts)
+        
+        crawler.crawl(seeds, extract_web_page, (keywords,), on_page=on_page)
+        return collected
+
+    def _deliver_web_texts(self, url, texts, on_texts):
+        if on_texts is None:
+            return texts
+        on_texts(url, texts)
+        return len(texts)
+
+    def _get_web_fetcher(self, fetch_config):
+        if not fetch_config:
+            return self.web_fetcher
+        fetch_config = dict(fetch_config)
+        page_cache = self.page_cache if fetch_config.pop('use_page_cache', True) else None
+        return WebFetcher(page_cache=page_cache, **fetch_config)
+
+    def _extraction_variant(self, keywords):
+        """Identifica textos extraídos com as mesmas palavras-chave e versão do extrator"""
+        normalized = sorted({keyword.strip().lower() for keyword in (keywords or []) if keyword.strip()})
+        return f"v{EXTRACTION_VERSION}:{json.dumps(normalized, ensure_ascii=False)}"
+
+    def _reuse_extracted(self, fetch_result, variant):
+        if not fetch_result.not_modified:
+            return None
+        return self.page_cache.get_extracted(fetch_result.url, variant)
+
+    def _store_cached_web_texts(self, url, valid_texts, keep_in_memory=True):
+        """Registra textos reaproveitados do cache (página não modificada) na coleção"""
+        if keep_in_memory:
+            timestamp = datetime.now().isoformat()
+            self.collected_data.extend({
+                'source': url,
+                'type': 'web',
+                'content': text,
+                'timestamp': timestamp,
+                'length': len(text),
+                'word_count': len(text.split())
+            } for text in valid_texts)
+        
+        print(f"♻️ {url} não modificada: {len(valid_texts)} textos reaproveitados do cache")
+        return valid_texts
+
+    def _store_web_texts(self, url, text_content, keep_in_memory=True):
+        """
+        Valida os textos extraídos de uma página, guarda na coleção e retorna os válidos.
+        Com keep_in_memory=False (textos entregues por on_texts) a coleção não cresce.
+        """
+        result_string = '\n'.join(text_content)
+        print(f"📊 Coletado {len(text_content)} textos de {url}, total de caracteres: {len(result_string)}")
+        
+        # Debug: mostrar amostra do conteúdo
+        if result_string:
+            print(f"🔍 Amostra do conteúdo coletado: {result_string[:300]}...")
+            
+        # Filtro de qualidade em lote: só os parágrafos aceitos seguem para o corpus e o cache de páginas
+        processed_data = self.process_collected_text(result_string, url)
+        if processed_data and keep_in_memory:
+            self.collected_data.extend(processed_data)
+            print(f"💾 Adicionados {len(processed_data)} itens válidos à coleção")
+        if processed_data:
+            print(f"✅ Exemplo de parágrafo válido: {processed_data[0]['content'][:100]}...")
+        
+        # RETORNAR LISTA DE TEXTOS VÁLIDOS (não string)
+        valid_texts = [item['content'] for item in processed_data]
+        print(f"🔄 Retornando {len(valid_texts)} textos válidos para o app.py")
+        
+        return valid_texts  # Retorna lista, não string
+
     def save_collected_data(self, texts, sources, config):
-        """Salva dados coletados em formato esperado pelo model_trainer"""
+        """Salva dados coletados em formato esperado pelo model_trainer (sem textos já presentes no corpus)"""
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             
             # Criar diretório se não existir
             os.makedirs('training_data', exist_ok=True)
             
+            # Descartar textos já gravados em coletas anteriores
+            texts, duplicates_skipped = self.content_index.filter_new(texts)
+            if duplicates_skipped:
+                print(f"♻️ {duplicates_skipped} textos já presentes no corpus foram descartados")
+            
             # Preparar dados no formato esperado pelo trainer
             training_data = []
             for i, text in enumerate(texts):
@@ -392,6 +600,7 @@ class DataCollector:
             data_to_save = {
                 'timestamp': datetime.now().isoformat(),
                 'total_texts': len(texts),
+                'duplicates_skipped': duplicates_skipped,
                 'sources': sources,
                 'config_used': config,
                 'texts': texts,  # Lista de strings para o trainer
@@ -401,6 +610,11 @@ class DataCollector:
             with open(filename, 'w', encoding='utf-8') as f:
                 json.dump(data_to_save, f, ensure_ascii=False, indent=2)
             
+            # Indexar somente após gravar o arquivo (falha na gravação não deixa hashes órfãos)
+            self.content_index.add(texts, filename)
+            self._index_for_retrieval(texts, filename, sources[0] if sources else 'unknown')
+            self._sync_retrieval_embeddings()
+            
             print(f"📁 Dados salvos em: {filename}")
             print(f"📊 Total de textos: {len(texts)}")
             print(f"📋 Fontes: {', '.join(sources)}")
@@ -411,6 +625,105 @@ class DataCollector:
             print(f"❌ Erro ao salvar dados: {e}")
             return None
 
+    def save_collected_shards(self, shard_dir, sources, config, chunk_size=1000):
+        """
+        Monta o collected_data_*.json a partir dos shards do pipeline de coleta
+        sem carregar todos os textos na memória; os shards são removidos depois
+        que o arquivo é gravado e indexado.
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f'training_data/collected_data_{timestamp}.json'
+        detailed_file = filename + '.detailed.tmp'
+        temp_file = filename + '.tmp'
+        total = 0
+        duplicates_skipped = 0
+        
+        try:
+            os.makedirs('training_data', exist_ok=True)
+            saved_at = datetime.now().isoformat()
+            
+            with open(temp_file, 'w', encoding='utf-8') as f, open(detailed_file, 'w', encoding='utf-8') as detailed:
+                f.write('{\n  "timestamp": ' + json.dumps(saved_at) + ',\n  "texts": [')
+                records = read_shards(shard_dir)
+                while True:
+                    chunk = list(itertools.islice(records, chunk_size))
+                    if not chunk:
+                        break
+                    
+                    # Outro job pode ter gravado os mesmos textos enquanto esta coleta rodava
+                    sources_by_text = {record['text']: record.get('source', 'unknown') for record in chunk}
+                    texts, skipped = self.content_index.filter_new([record['text'] for record in chunk])
+                    duplicates_skipped += skipped
+                    
+                    for text in texts:
+                        f.write((',' if total else '') + '\n    ' + json.dumps(text, ensure_ascii=False))
+                        detailed.write((',' if total else '') + '\n    ' + json.dumps({
+                            'id': total,
+                            'content': text,
+                            'source': sources_by_text[text],
+                            'timestamp': saved_at,
+                            'length': len(text),
+                            'word_count': len(text.split())
+                        }, ensure_ascii=False))
+                        total += 1
+                
+                f.write('\n  ],\n  "detailed_data": [')
+                detailed.close()
+                with open(detailed_file, 'r', encoding='utf-8') as detailed_in:
+                    shutil.copyfileobj(detailed_in, f)
+                f.write('\n  ],\n')
+                for key, value in (('total_texts', total), ('duplicates_skipped', duplicates_skipped),
+                                   ('sources', sources), ('config_used', config)):
+                    f.write(f'  "{key}": ' + json.dumps(value, ensure_ascii=False, default=str) +
+                            (',\n' if key != 'config_used' else '\n'))
+                f.write('}\n')
+            
+            os.replace(temp_file, filename)
+            
+            # Indexar somente após gravar o arquivo (falha na gravação não deixa hashes órfãos)
+            records = read_shards(shard_dir)
+            while True:
+                chunk = list(itertools.islice(records, chunk_size))
+                if not chunk:
+                    break
+                texts = [record['text'] for record in chunk]
+                self.content_index.add(texts, filename)
+                self._index_for_retrieval(texts, filename, [record.get('source', 'unknown') for record in chunk])
+            self._sync_retrieval_embeddings()
+            shutil.rmtree(shard_dir, ignore_errors=True)
+            
+            print(f"📁 Dados salvos em: {filename}")
+            print(f"📊 Total de textos: {total}")
+            print(f"📋 Fontes: {', '.join(sources)}")
+            
+            return filename
+            
+        except Exception as e:
+            print(f"❌ Erro ao salvar dados: {e}")
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            return None
+        finally:
+            if os.path.exists(detailed_file):
+                os.remove(detailed_file)
+
+    def _index_for_retrieval(self, texts, filename, sources):
+        """Atualiza o índice de busca; uma falha aqui não invalida os dados já gravados"""
+        try:
+            added = self.retrieval_index.add(texts, filename, sources)
+            print(f"🔎 Índice de busca: {added} passagens novas")
+        except Exception as e:
+            print(f"⚠️ Erro ao atualizar o índice de busca: {e}")
+
+    def _sync_retrieval_embeddings(self):
+        """Fim da gravação: passagens ainda sem embedding (o cache do serviço evita recalcular as já vistas)"""
+        try:
+            self.retrieval_index.sync_embeddings()
+            if isinstance(self.retrieval_index.encoder, EmbeddingService):
+                print(f"🧠 Embeddings: {self.retrieval_index.encoder.format_metrics()}")
+        except Exception as e:
+            print(f"⚠️ Erro ao sincronizar embeddings do índice de busca: {e}")
+
     def get_collected_data(self):
         """Retornar dados coletados"""
         return self.collected_data
@@ -500,52 +813,33 @@ class DataCollector:
         }
 
     def validate_collected_text(self, text):
-        """Valida se um texto coletado é útil para treinamento"""
-        if not text or not isinstance(text, str):
-            return False, "Texto vazio ou inválido"
-            
-        text = text.strip()
+        """Valida se um texto coletado é útil para treinamento (para lotes, use quality_filter.filter)"""
+        reason = self.quality_filter.evaluate([text])[0]
         
-        # Verificações básicas
-        if len(text) < 30:
-            return False, f"Texto muito curto ({len(text)} caracteres)"
-            
-        # Verificar se não é apenas caracteres especiais ou números
-        letters = sum(1 for c in text if c.isalpha())
-        if letters < len(text) * 0.5:  # Pelo menos 50% letras
-            return False, "Texto com poucos caracteres alfabéticos"
-            
-        # Verificar se tem palavras suficientes
-        words = text.split()
-        if len(words) < 5:
-            return False, f"Poucas palavras ({len(words)})"
-            
-        return True, "Texto válido"
+        if reason is None:
+            return True, "Texto válido"
+        return False, self.quality_filter.REASON_MESSAGES.get(reason, reason)
 
     def process_collected_text(self, raw_text, source_url):
-        """Processa texto coletado e extrai parágrafos válidos"""
+        """Processa texto coletado e extrai parágrafos válidos (filtro em lote)"""
         if not raw_text:
             return []
             
-        # Dividir em parágrafos
+        # Dividir em parágrafos e avaliar todos de uma vez
         paragraphs = raw_text.split('\n')
-        valid_paragraphs = []
+        accepted, stats = self.quality_filter.filter(paragraphs)
+        self.last_quality_stats = stats
         
-        for paragraph in paragraphs:
-            paragraph = paragraph.strip()
-            is_valid, reason = self.validate_collected_text(paragraph)
-            
-            if is_valid:
-                valid_paragraphs.append({
-                    'source': source_url,
-                    'type': 'web',
-                    'content': paragraph,
-                    'timestamp': datetime.now().isoformat(),
-                    'length': len(paragraph),
-                    'word_count': len(paragraph.split())
-                })
-            else:
-                print(f"⚠️ Parágrafo rejeitado: {reason} - '{paragraph[:50]}...'")
+        timestamp = datetime.now().isoformat()
+        valid_paragraphs = [{
+            'source': source_url,
+            'type': 'web',
+            'content': paragraph,
+            'timestamp': timestamp,
+            'length': len(paragraph),
+            'word_count': len(paragraph.split())
+        } for paragraph in accepted]
         
-        print(f"📊 Processamento completo: {len(valid_paragraphs)} parágrafos válidos de {len(paragraphs)} total")
+        print(f"📊 Processamento completo: {len(valid_paragraphs)} parágrafos válidos de {len(paragraphs)} total "
+              f"(rejeitados - {self.quality_filter.format_stats(stats)})")
         return valid_paragraphs
@@ -0,0 +1,501 @@
+import imaplib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import takewhile
+
+# Cabeçalhos baixados por mensagem (inclui os usados para reconstruir threads)
+HEADER_FIELDS = 'SUBJECT FROM TO DATE MESSAGE-ID IN-REPLY-TO REFERENCES'
+
+class EmailSyncCheckpoint:
+    """
+    Checkpoint persistente da sincronização IMAP, por conta e pasta.
+
+    Guarda o UIDVALIDITY da pasta e o maior UID já processado: enquanto o
+    UIDVALIDITY não muda, os UIDs antigos continuam válidos e a próxima
+    coleta busca apenas mensagens com UID maior.
+    """
+
+    def __init__(self, path='collected_data/email_checkpoints.json'):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def get(self, account, folder):
+        return self._load().get(self._key(account, folder))
+
+    def update(self, account, folder, uidvalidity, last_uid):
+        with self._lock:
+            checkpoints = self._load()
+            checkpoints[self._key(account, folder)] = {
+                'uidvalidity': uidvalidity,
+                'last_uid': last_uid,
+                'updated_at': datetime.now().isoformat()
+            }
+            self._save(checkpoints)
+
+    def reset(self, account, folder=None):
+        """Remove o checkpoint da pasta (ou de todas as pastas da conta)"""
+        with self._lock:
+            checkpoints = self._load()
+            prefix = self._key(account, folder) if folder else f'{account}|'
+            for key in [key for key in checkpoints if key == prefix or (not folder and key.startswith(prefix))]:
+                del checkpoints[key]
+            self._save(checkpoints)
+
+    def _key(self, account, folder):
+        return f'{account}|{folder}'
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, checkpoints):
+        temp_path = f'{self.path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoints, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+
+class MailboxSync:
+    """
+    Seleção incremental de mensagens de uma pasta IMAP por UID.
+
+    - Com checkpoint válido (mesmo UIDVALIDITY): UID SEARCH UID n:*
+    - Sem checkpoint ou com UIDVALIDITY diferente: janela de backfill com as
+      backfill_limit mensagens mais recentes (opcionalmente só dos últimos
+      backfill_days dias)
+    - max_messages limita cada execução; os UIDs vêm em ordem crescente para
+      o checkpoint avançar sem pular mensagens
+    """
+
+    def __init__(self, mail, account, checkpoint, backfill_limit=50, backfill_days=None,
+                 only_unread=False, max_messages=None, full_resync=False):
+        self.mail = mail
+        self.account = account
+        self.checkpoint = checkpoint
+        self.backfill_limit = backfill_limit
+        self.backfill_days = backfill_days
+        self.only_unread = only_unread
+        self.max_messages = max_messages
+        self.full_resync = full_resync
+
+    def select(self, folder):
+        """Seleciona a pasta somente leitura (não altera flags) e retorna o UIDVALIDITY"""
+        status, data = self.mail.select(quote_folder(folder), readonly=True)
+        if status != 'OK':
+            raise RuntimeError(f"Não foi possível selecionar a pasta {folder}: {data}")
+
+        _, values = self.mail.response('UIDVALIDITY')
+        if not values or values[0] is None:
+            raise RuntimeError(f"Servidor não informou UIDVALIDITY para {folder}")
+        return int(values[0])
+
+    def pending_uids(self, folder):
+        """
+        Seleciona a pasta e retorna (uidvalidity, uids, modo) com os UIDs
+        ainda não processados; modo é 'incremental' ou 'backfill'.
+        """
+        uidvalidity = self.select(folder)
+        checkpoint = None if self.full_resync else self.checkpoint.get(self.account, folder)
+        criteria = ['UNSEEN'] if self.only_unread else []
+
+        if checkpoint and checkpoint.get('uidvalidity') == uidvalidity:
+            last_uid = checkpoint['last_uid']
+            # n:* sempre inclui a última mensagem, mesmo com UID menor que n
+            uids = [uid for uid in self._search(f'UID {last_uid + 1}:*', *criteria) if uid > last_uid]
+            mode = 'incremental'
+        else:
+            if checkpoint:
+                print(f"⚠️ UIDVALIDITY de {folder} mudou: checkpoint descartado, refazendo backfill")
+            if self.backfill_days:
+                since_date = datetime.now() - timedelta(days=self.backfill_days)
+                # Mês em inglês exigido pelo IMAP (strftime('%b') depende do locale)
+                since = f'{since_date.day:02d}-{imaplib.Months[since_date.month]}-{since_date.year}'
+                criteria = ['SINCE', since] + criteria
+            uids = self._search(*(criteria or ['ALL']))
+            if self.backfill_limit:
+                uids = uids[-self.backfill_limit:]
+            mode = 'backfill'
+
+        if self.max_messages:
+            uids = uids[:self.max_messages]
+        return uidvalidity, uids, mode
+
+    def save(self, folder, uidvalidity, last_uid):
+        self.checkpoint.update(self.account, folder, uidvalidity, last_uid)
+
+    def fetch_messages(self, uids, batch_size=200, max_body_bytes=262144):
+        """
+        Baixa as mensagens em lotes de UIDs, sem anexos.
+
+        Por lote são dois comandos: cabeçalhos selecionados + BODYSTRUCTURE e,
+        depois, apenas a parte text/plain de cada mensagem (BODY.PEEK[seção],
+        limitada a max_body_bytes). Gera (uids_do_lote, [(uid, bytes)]), onde
+        bytes é uma mensagem RFC 822 de parte única com esse texto.
+        """
+        for start in range(0, len(uids), batch_size):
+            batch = uids[start:start + batch_size]
+            yield batch, self._fetch_batch(batch, max_body_bytes)
+
+    def _fetch_batch(self, uids, max_body_bytes):
+        headers = {}
+        text_parts = {}
+        for item in self._fetch(uids, f'(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})])'):
+            uid = int(item['UID'])
+            header = next((value for key, value in item.items() if key.startswith('BODY[HEADER')), None)
+            headers[uid] = header or b''
+            part = find_text_part(item.get('BODYSTRUCTURE'))
+            if part:
+                text_parts[uid] = part
+
+        # Um comando por seção (quase sempre "1" ou "1.1")
+        by_section = {}
+        for uid, part in text_parts.items():
+            by_section.setdefault(part['section'], []).append(uid)
+
+        bodies = {}
+        for section, section_uids in by_section.items():
+            partial = f'<0.{max_body_bytes}>' if max_body_bytes else ''
+            for item in self._fetch(section_uids, f'(UID BODY.PEEK[{section}]{partial})'):
+                body = next((value for key, value in item.items() if key.startswith(f'BODY[{section}]')), None)
+                bodies[int(item['UID'])] = body or b''
+
+        messages = []
+        for uid in uids:
+            if uid not in headers:
+                continue
+            part = text_parts.get(uid)
+            messages.append((uid, build_text_message(headers[uid], part, bodies.get(uid, b'') if part else b'')))
+        return messages
+
+    def _fetch(self, uids, items):
+        status, data = self.mail.uid('FETCH', compress_uids(uids), items)
+        if status != 'OK':
+            raise RuntimeError(f"Erro ao baixar emails: {data}")
+        return [fields for fields in parse_fetch_response(data) if 'UID' in fields]
+
+    def _search(self, *criteria):
+        status, data = self.mail.uid('SEARCH', None, *criteria)
+        if status != 'OK':
+            raise RuntimeError(f"Erro ao buscar emails: {data}")
+        return sorted(int(uid) for uid in (data[0] or b'').split())
+
+def quote_folder(folder):
+    """Nome de pasta entre aspas quando contém espaços ou caracteres especiais"""
+    if folder.startswith('"') or not any(char in folder for char in ' ()"\\{%*'):
+        return folder
+    escaped = folder.replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'
+
+class ImapConnectionPool:
+    """
+    Pool limitado de conexões IMAP autenticadas.
+
+    Conexões ficam abertas entre pastas da mesma conta (sem novo login);
+    max_connections limita o total e max_per_account o número de conexões
+    simultâneas de cada conta (servidores costumam limitar por usuário).
+    Sem vaga livre, uma conexão ociosa de outra conta é fechada.
+    """
+
+    def __init__(self, connect, max_connections=4, max_per_account=2):
+        self.connect = connect
+        self.max_connections = max(1, max_connections)
+        self.max_per_account = max(1, max_per_account)
+        self._condition = threading.Condition()
+        self._idle = {}  # conta -> [conexões ociosas]
+        self._open = {}  # conta -> conexões abertas (ociosas + em uso)
+
+    @contextmanager
+    def connection(self, account, account_config):
+        mail = self._acquire(account, account_config)
+        broken = False
+        try:
+            yield mail
+        except (imaplib.IMAP4.abort, OSError):
+            broken = True
+            raise
+        finally:
+            self._release(account, mail, broken)
+
+    def close_all(self):
+        with self._condition:
+            idle = [mail for connections in self._idle.values() for mail in connections]
+            for account, connections in self._idle.items():
+                self._open[account] -= len(connections)
+            self._idle = {}
+            self._condition.notify_all()
+        for mail in idle:
+            _logout(mail)
+
+    def _acquire(self, account, account_config):
+        with self._condition:
+            while True:
+                if self._idle.get(account):
+                    return self._idle[account].pop()
+
+                total = sum(self._open.values())
+                if self._open.get(account, 0) < self.max_per_account:
+                    if total < self.max_connections:
+                        break
+                    evicted = self._evict_idle()
+                    if evicted is not None:
+                        self._condition.release()
+                        try:
+                            _logout(evicted)
+                        finally:
+                            self._condition.acquire()
+                        continue
+                self._condition.wait()
+
+            self._open[account] = self._open.get(account, 0) + 1
+
+        try:
+            return self.connect(account_config)
+        except Exception:
+            with self._condition:
+                self._open[account] -= 1
+                self._condition.notify_all()
+            raise
+
+    def _release(self, account, mail, broken):
+        with self._condition:
+            if broken:
+                self._open[account] -= 1
+            else:
+                self._idle.setdefault(account, []).append(mail)
+            self._condition.notify_all()
+        if broken:
+            _logout(mail)
+
+    def _evict_idle(self):
+        for account, connections in self._idle.items():
+            if connections:
+                self._open[account] -= 1
+                return connections.pop()
+        return None
+
+class SyncProgress:
+    """
+    Progresso da coleta de emails por conta (pastas e mensagens).
+
+    callback(snapshot) é chamado a cada mudança com
+    {conta: {'folders_total', 'folders_done', 'messages_total', 'messages_done', 'errors'}}.
+    Se o callback levantar uma exceção (ex.: job cancelado), ela fica em
+    `error`, o callback não é mais chamado e as pastas param no próximo lote.
+    """
+
+    def __init__(self, folders_by_account, callback=None):
+        self.callback = callback
+        self.error = None
+        self._lock = threading.Lock()
+        self._accounts = {
+            account: {'folders_total': folders, 'folders_done': 0, 'messages_total': 0,
+                      'messages_done': 0, 'errors': 0}
+            for account, folders in folders_by_account.items()
+        }
+
+    def folder_started(self, account, message_count):
+        self._update(account, messages_total=message_count)
+
+    def advance(self, account, message_count):
+        self._update(account, messages_done=message_count)
+
+    def folder_finished(self, account, error=False):
+        self._update(account, folders_done=1, errors=1 if error else 0)
+
+    def snapshot(self):
+        with self._lock:
+            return {account: dict(counts) for account, counts in self._accounts.items()}
+
+    def _update(self, account, **increments):
+        with self._lock:
+            counts = self._accounts[account]
+            for key, value in increments.items():
+                counts[key] += value
+            snapshot = {name: dict(values) for name, values in self._accounts.items()}
+        if self.callback and self.error is None:
+            try:
+                self.callback(snapshot)
+            except Exception as e:
+                self.error = e
+                print(f"Erro ao reportar progresso da coleta de emails: {e}")
+
+def _logout(mail):
+    try:
+        mail.logout()
+    except Exception:
+        pass
+
+def compress_uids(uids):
+    """[1, 2, 3, 7] -> '1:3,7'"""
+    ranges = []
+    for uid in sorted(uids):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(str(low) if low == high else f'{low}:{high}' for low, high in ranges)
+
+def parse_fetch_response(data):
+    """
+    Converte a resposta de FETCH do imaplib em um dicionário por mensagem.
+
+    O imaplib devolve linhas e literais separados ((prefixo {n}, literal), b')');
+    aqui eles são remontados e interpretados: listas viram listas Python,
+    NIL vira None, strings e literais viram bytes e as chaves viram str
+    maiúsculas (ex.: 'UID', 'BODYSTRUCTURE', 'BODY[1]<0>').
+    """
+    stream = b''.join(b''.join(item) if isinstance(item, tuple) else (item or b'') for item in data)
+    parser = _ImapParser(stream)
+    messages = []
+    while True:
+        parser.skip_spaces()
+        if parser.at_end():
+            break
+        parser.read_value()  # número de sequência
+        parser.skip_spaces()
+        values = parser.read_value()
+        if not isinstance(values, list):
+            continue
+        fields = {}
+        for index in range(0, len(values) - 1, 2):
+            key = values[index]
+            fields[key.decode('ascii', 'replace').upper() if isinstance(key, bytes) else str(key)] = values[index + 1]
+        messages.append(fields)
+    return messages
+
+class _ImapParser:
+    """Leitor de valores IMAP (listas, strings, literais {n}, NIL e átomos)"""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def at_end(self):
+        return self.pos >= len(self.data)
+
+    def skip_spaces(self):
+        while self.pos < len(self.data) and self.data[self.pos] in b' \r\n':
+            self.pos += 1
+
+    def read_value(self):
+        self.skip_spaces()
+        char = self.data[self.pos:self.pos + 1]
+        if char == b'(':
+            self.pos += 1
+            values = []
+            while True:
+                self.skip_spaces()
+                if self.at_end():
+                    return values
+                if self.data[self.pos:self.pos + 1] == b')':
+                    self.pos += 1
+                    return values
+                values.append(self.read_value())
+        if char == b'"':
+            return self._read_quoted()
+        if char == b'{':
+            end = self.data.index(b'}', self.pos)
+            size = int(self.data[self.pos + 1:end])
+            self.pos = end + 1
+            literal = self.data[self.pos:self.pos + size]
+            self.pos += size
+            return literal
+        if char == b')':
+            # Parêntese sem abertura correspondente (resposta malformada)
+            self.pos += 1
+            return None
+        atom = self._read_atom()
+        return None if atom.upper() == b'NIL' else atom
+
+    def _read_quoted(self):
+        self.pos += 1
+        chunks = []
+        while self.pos < len(self.data):
+            char = self.data[self.pos:self.pos + 1]
+            if char == b'\\':
+                chunks.append(self.data[self.pos + 1:self.pos + 2])
+                self.pos += 2
+                continue
+            self.pos += 1
+            if char == b'"':
+                break
+            chunks.append(char)
+        return b''.join(chunks)
+
+    def _read_atom(self):
+        start = self.pos
+        depth = 0
+        while self.pos < len(self.data):
+            char = self.data[self.pos:self.pos + 1]
+            # BODY[HEADER.FIELDS (A B)]<0>: espaços e parênteses dentro de [] fazem parte do átomo
+            if char == b'[':
+                depth += 1
+            elif char == b']':
+                depth -= 1
+            elif depth <= 0 and char in (b' ', b'(', b')', b'\r', b'\n'):
+                break
+            self.pos += 1
+        return self.data[start:self.pos]
+
+def find_text_part(structure, section=''):
+    """
+    Primeira parte text/plain (que não seja anexo) de um BODYSTRUCTURE.
+
+    Retorna {'section', 'charset', 'encoding', 'size'} ou None.
+    """
+    if not isinstance(structure, list) or not structure:
+        return None
+
+    if isinstance(structure[0], list):
+        # Multipart: partes filhas primeiro, depois subtipo e extensões (parâmetros também são listas)
+        for index, child in enumerate(takewhile(lambda part: isinstance(part, list), structure), start=1):
+            found = find_text_part(child, f'{section}.{index}' if section else str(index))
+            if found:
+                return found
+        return None
+
+    media_type = _text(structure[0]).lower()
+    subtype = _text(structure[1] if len(structure) > 1 else b'').lower()
+    if media_type != 'text' or subtype != 'plain':
+        return None
+
+    # text: tipo, subtipo, parâmetros, id, descrição, codificação, tamanho, linhas, md5, disposição
+    disposition = structure[9] if len(structure) > 9 else None
+    if isinstance(disposition, list) and disposition and _text(disposition[0]).lower() == 'attachment':
+        return None
+
+    params = structure[2] if len(structure) > 2 and isinstance(structure[2], list) else []
+    charset = None
+    for index in range(0, len(params) - 1, 2):
+        if _text(params[index]).lower() == 'charset':
+            charset = _text(params[index + 1])
+
+    return {
+        'section': section or '1',
+        'charset': charset,
+        'encoding': _text(structure[5] if len(structure) > 5 else b'7bit').lower() or '7bit',
+        'size': int(structure[6]) if len(structure) > 6 and structure[6] and structure[6].isdigit() else None,
+    }
+
+def build_text_message(header_bytes, part, body):
+    """Mensagem RFC 822 de parte única com os cabeçalhos baixados e o texto da parte"""
+    header_bytes = header_bytes.rstrip(b'\r\n')
+    if not part:
+        return header_bytes + b'\r\n\r\n'
+
+    content_type = b'text/plain'
+    if part['charset']:
+        content_type += b'; charset="' + part['charset'].encode('ascii', 'ignore') + b'"'
+    extra = b'Content-Type: ' + content_type + b'\r\nContent-Transfer-Encoding: ' + part['encoding'].encode('ascii', 'ignore')
+    return (header_bytes + b'\r\n' if header_bytes else b'') + extra + b'\r\n\r\n' + body
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('ascii', 'replace')
+    return value or ''
@@ -0,0 +1,264 @@
+import os
+import re
+import sqlite3
+import threading
+from email.utils import parsedate_to_datetime
+
+from content_index import _ClosingConnection
+
+MESSAGE_ID_RE = re.compile(r'<[^<>\s]+>')
+SUBJECT_PREFIX_RE = re.compile(r'^\s*((re|res|fw|fwd|enc|rv|tr|aw|wg)\s*(\[\d+\])?\s*:\s*)+', re.IGNORECASE)
+
+# Cabeçalho que introduz o texto citado ("Em ..., Fulano escreveu:", "On ..., X wrote:")
+REPLY_HEADER_RE = re.compile(r'^\s*(on|em|el|le|am)\s.{0,300}(wrote|escreveu|escribió|a écrit|schrieb)\s*:\s*$',
+                             re.IGNORECASE)
+FORWARD_HEADER_RE = re.compile(r'^\s*-{2,}\s*(original message|mensagem original|forwarded message|'
+                               r'mensagem encaminhada|mensaje original)\s*-{2,}\s*$', re.IGNORECASE)
+OUTLOOK_FROM_RE = re.compile(r'^\s*\**(from|de)\s*:\**\s+\S', re.IGNORECASE)
+OUTLOOK_SENT_RE = re.compile(r'^\s*\**(sent|enviado|enviada|date|data|enviado em)\s*:', re.IGNORECASE)
+SEPARATOR_RE = re.compile(r'^\s*_{10,}\s*$')
+
+SIGNATURE_DELIMITER_RE = re.compile(r'^--\s?$')
+MOBILE_SIGNATURE_RE = re.compile(r'^\s*(enviado do meu|sent from my|enviado de meu|get outlook for)\b', re.IGNORECASE)
+SIGN_OFF_RE = re.compile(r'^\s*(atenciosamente|att\.?|atte\.?|abraços?|abs\.?|cordialmente|saudações|'
+                         r'grato|grata|obrigad[oa]s?|best regards|kind regards|regards|best|thanks|cheers)'
+                         r'\s*[,.!]?\s*$', re.IGNORECASE)
+# Despedidas só valem como início de assinatura nas últimas linhas da mensagem
+SIGN_OFF_TAIL_LINES = 8
+
+def strip_quoted_text(body):
+    """Remove o histórico citado: linhas com '>' e tudo após um cabeçalho de resposta/encaminhamento"""
+    lines = (body or '').splitlines()
+    kept = []
+    for index, line in enumerate(lines):
+        next_line = lines[index + 1] if index + 1 < len(lines) else ''
+        if REPLY_HEADER_RE.match(line) or REPLY_HEADER_RE.match(f'{line} {next_line}') and \
+                not REPLY_HEADER_RE.match(next_line):
+            break
+        if FORWARD_HEADER_RE.match(line):
+            break
+        if (OUTLOOK_FROM_RE.match(line) or SEPARATOR_RE.match(line)) and \
+                any(OUTLOOK_SENT_RE.match(following) for following in lines[index + 1:index + 5]):
+            break
+        if line.lstrip().startswith('>'):
+            continue
+        kept.append(line)
+    return '\n'.join(kept)
+
+def strip_signature(body):
+    """Remove assinatura: delimitador '-- ', 'Enviado do meu...' e despedidas nas últimas linhas"""
+    lines = (body or '').splitlines()
+    for index, line in enumerate(lines):
+        if SIGNATURE_DELIMITER_RE.match(line) or MOBILE_SIGNATURE_RE.match(line):
+            lines = lines[:index]
+            break
+
+    non_empty = [index for index, line in enumerate(lines) if line.strip()]
+    for index in non_empty[-SIGN_OFF_TAIL_LINES:]:
+        if SIGN_OFF_RE.match(lines[index]):
+            lines = lines[:index]
+            break
+    return '\n'.join(lines)
+
+def clean_email_body(body):
+    """Texto próprio da mensagem: sem citações, sem assinatura e sem linhas em branco repetidas"""
+    text = strip_signature(strip_quoted_text(body))
+    text = re.sub(r'\n\s*\n+', '\n\n', text)
+    return text.strip()
+
+def normalize_subject(subject):
+    return SUBJECT_PREFIX_RE.sub('', subject or '').strip().lower()
+
+def parse_message_ids(value):
+    return MESSAGE_ID_RE.findall(value or '')
+
+class EmailThreadStore:
+    """
+    Mensagens já processadas (texto limpo), persistidas em SQLite.
+
+    Com a sincronização incremental a resposta costuma chegar em uma coleta
+    posterior à pergunta; a loja permite encontrar a mensagem original.
+    """
+
+    QUERY_CHUNK = 500
+
+    def __init__(self, db_path='collected_data/email_threads.db'):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS messages (
+                    message_id TEXT PRIMARY KEY,
+                    thread_id TEXT,
+                    subject TEXT,
+                    sender TEXT,
+                    sent_at REAL,
+                    body TEXT
+                ) WITHOUT ROWID
+            ''')
+
+    def add(self, messages):
+        rows = [(message['message_id'], message['thread_id'], message['subject'], message['sender'],
+                 message['sent_at'], message['body']) for message in messages if message['message_id']]
+        with self._lock, self._connect() as conn:
+            conn.executemany('INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def get_many(self, message_ids):
+        found = {}
+        message_ids = list(message_ids)
+        with self._connect() as conn:
+            for start in range(0, len(message_ids), self.QUERY_CHUNK):
+                chunk = message_ids[start:start + self.QUERY_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(f'SELECT message_id, thread_id, subject, sender, sent_at, body '
+                                    f'FROM messages WHERE message_id IN ({placeholders})', chunk)
+                for row in rows:
+                    found[row[0]] = dict(zip(('message_id', 'thread_id', 'subject', 'sender', 'sent_at', 'body'), row))
+        return found
+
+    def _connect(self):
+        return _ClosingConnection(sqlite3.connect(self.db_path, timeout=30))
+
+class EmailThreadBuilder:
+    """
+    Reconstrói threads de email e gera textos de treinamento.
+
+    - Agrupa mensagens por Message-ID / In-Reply-To / References (e, sem
+      esses cabeçalhos, pelo assunto normalizado "Re: ...")
+    - Remove texto citado e assinaturas de cada mensagem
+    - Cada resposta de outro remetente vira um par pergunta/resposta no
+      formato usado nas conversas do chat ("Usuário: ...\\nAssistente: ...")
+    - Mensagens fora de pares são mantidas como texto simples
+    """
+
+    def __init__(self, store=None, min_length=20):
+        self.store = store
+        self.min_length = min_length
+        self.last_stats = None
+
+    def build_texts(self, items):
+        """items: dicionários da coleção de emails; retorna a lista de textos para o corpus"""
+        messages = []
+        by_id = {}
+        for index, item in enumerate(items):
+            message = self._prepare(item, index)
+            # A mesma mensagem pode vir de duas pastas (ex.: caixa de entrada e enviados)
+            if not message or message['message_id'] in by_id:
+                continue
+            messages.append(message)
+            if message['message_id']:
+                by_id[message['message_id']] = message
+
+        # Pais e raízes de thread que vieram em coletas anteriores
+        missing = {parent for message in messages for parent in message['parents'] if parent not in by_id}
+        missing.update(message['references'][0] for message in messages
+                       if message['references'] and message['references'][0] not in by_id)
+        known = self.store.get_many(missing) if self.store and missing else {}
+
+        # Threads: o id mais antigo conhecido da cadeia de referências
+        for message in messages:
+            message['thread_id'] = next((ref for ref in message['references'] if ref in by_id or ref in known),
+                                        message['references'][0] if message['references'] else message['key'])
+
+        self._link_by_subject(messages)
+        ordered = sorted(messages, key=lambda message: (message['sent_at'] or 0, message['order']))
+
+        # Quem pergunta é o remetente da mensagem que abriu a thread
+        askers = {}
+        for message in ordered:
+            root = by_id.get(message['thread_id']) or known.get(message['thread_id'])
+            askers.setdefault(message['thread_id'], _address((root or message)['sender']))
+
+        texts = []
+        paired = set()
+        pairs = 0
+        for message in ordered:
+            parent = self._find_parent(message, by_id, known)
+            asker = askers[message['thread_id']]
+            # Par apenas de quem pergunta para quem responde (não o contrário nem entre respostas)
+            if not parent or _address(parent['sender']) != asker or _address(message['sender']) == asker:
+                continue
+            question = parent['body']
+            if parent.get('message_id') == message['thread_id'] and parent['subject']:
+                question = f"Assunto: {SUBJECT_PREFIX_RE.sub('', parent['subject']).strip()}\n\n{question}"
+            texts.append(f"Usuário: {question}\nAssistente: {message['body']}")
+            paired.update((parent.get('key'), message['key']))
+            pairs += 1
+
+        standalone = [message for message in messages if message['key'] not in paired]
+        for message in standalone:
+            texts.append(f"Assunto: {message['subject']}\n\n{message['body']}" if message['subject'] else message['body'])
+
+        if self.store:
+            self.store.add(messages)
+
+        self.last_stats = {
+            'messages': len(items),
+            'threads': len({message['thread_id'] for message in messages}),
+            'pairs': pairs,
+            'standalone': len(standalone),
+            'discarded': len(items) - len(messages),
+            'raw_chars': sum(len(item.get('body') or item.get('content') or '') for item in items),
+            'clean_chars': sum(len(message['body']) for message in messages),
+        }
+        print(f"🧵 Emails: {self.last_stats['messages']} mensagens, {self.last_stats['threads']} threads, "
+              f"{pairs} pares pergunta/resposta, {self.last_stats['standalone']} textos avulsos "
+              f"({self.last_stats['raw_chars']} → {self.last_stats['clean_chars']} caracteres sem citações/assinaturas)")
+        return texts
+
+    def _prepare(self, item, order):
+        body = clean_email_body(item.get('body') or item.get('content') or '')
+        if len(body) < self.min_length:
+            return None
+
+        references = parse_message_ids(item.get('references'))
+        in_reply_to = parse_message_ids(item.get('in_reply_to'))
+        message_ids = parse_message_ids(item.get('message_id'))
+        message_id = message_ids[0] if message_ids else None
+
+        try:
+            sent_at = parsedate_to_datetime(item['date']).timestamp() if item.get('date') else None
+        except (TypeError, ValueError, IndexError):
+            sent_at = None
+
+        subject = item.get('subject') or ''
+        return {
+            'key': message_id or f'#{order}',
+            'order': order,
+            'message_id': message_id,
+            'subject': subject,
+            'sender': (item.get('from') or '').lower(),
+            'sent_at': sent_at,
+            'body': body,
+            'references': references,
+            # Pai direto primeiro (In-Reply-To), depois a cadeia de References do mais recente ao mais antigo
+            'parents': list(dict.fromkeys(in_reply_to + references[::-1])),
+            'is_reply': bool(in_reply_to or references) or normalize_subject(subject) != subject.strip().lower(),
+        }
+
+    def _link_by_subject(self, messages):
+        """Respostas sem cabeçalhos de thread: mesmo assunto normalizado de uma mensagem anterior"""
+        first_by_subject = {}
+        for message in sorted(messages, key=lambda message: (message['sent_at'] or 0, message['order'])):
+            subject = normalize_subject(message['subject'])
+            if not subject:
+                continue
+            first = first_by_subject.setdefault(subject, message)
+            if first is not message and not message['parents'] and message['is_reply']:
+                message['thread_id'] = first['thread_id']
+                message['subject_parent'] = first
+
+    def _find_parent(self, message, by_id, known):
+        for parent_id in message['parents']:
+            parent = by_id.get(parent_id) or known.get(parent_id)
+            if parent:
+                parent.setdefault('key', parent_id)
+                return parent
+        return message.get('subject_parent')
+
+def _address(sender):
+    match = re.search(r'[\w.+-]+@[\w.-]+', sender or '')
+    return match.group(0).lower() if match else (sender or '').strip().lower()
@@ -0,0 +1,302 @@
+import hashlib
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from content_index import _ClosingConnection
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+def content_digest(text):
+    """Chave do embedding: SHA-1 do texto exato (qualquer diferença muda o vetor)"""
+    return hashlib.sha1((text or '').encode('utf-8')).digest()
+
+class EmbeddingStore:
+    """
+    Embeddings persistidos por hash do conteúdo.
+
+    Os vetores ficam em float16 em um arquivo mapeado em memória (linha n do
+    arquivo = vetor n) e o mapa hash -> linha em SQLite. A linha é gravada e
+    descarregada antes de o mapa ser confirmado, então quem lê (inclusive
+    outro processo) nunca encontra um hash apontando para um vetor incompleto;
+    gravações de processos diferentes são serializadas pela transação.
+    """
+
+    QUERY_CHUNK = 500
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, 'vectors.f16')
+        self.db_path = os.path.join(directory, 'embeddings.db')
+        self.dim = None
+
+        self._lock = threading.RLock()
+        self._vectors = None
+        os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS embeddings (digest BLOB PRIMARY KEY, row INTEGER) WITHOUT ROWID')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+            self.dim = int(row[0]) if row else None
+
+    def get(self, digests):
+        """{hash: vetor float32} dos hashes já calculados"""
+        digests = list(digests)
+        rows = {}
+        with self._connect() as conn:
+            for start in range(0, len(digests), self.QUERY_CHUNK):
+                chunk = digests[start:start + self.QUERY_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows.update(conn.execute(f'SELECT digest, row FROM embeddings WHERE digest IN ({placeholders})', chunk))
+            if rows and self.dim is None:
+                # Armazenamento criado por outro processo depois que este o abriu
+                self.dim = int(conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()[0])
+        if not rows:
+            return {}
+
+        with self._lock:
+            vectors = self._mapped(max(rows.values()) + 1)
+            positions = np.fromiter(rows.values(), dtype=np.int64, count=len(rows))
+            found = np.asarray(vectors[positions], dtype=np.float32)
+        return dict(zip(rows, found))
+
+    def put(self, digests, vectors):
+        """Grava vetores novos (hashes já presentes são ignorados); retorna quantos foram gravados"""
+        vectors = np.asarray(vectors, dtype=np.float16)
+        if not len(digests):
+            return 0
+
+        with self._lock, self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if self.dim is None:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+                self.dim = int(row[0]) if row else vectors.shape[1]
+                conn.execute("INSERT OR IGNORE INTO meta VALUES ('dim', ?)", (str(self.dim),))
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f'Dimensão {vectors.shape[1]} diferente da do armazenamento ({self.dim})')
+
+            known = set()
+            for start in range(0, len(digests), self.QUERY_CHUNK):
+                chunk = list(digests[start:start + self.QUERY_CHUNK])
+                placeholders = ','.join('?' * len(chunk))
+                known.update(row[0] for row in conn.execute(f'SELECT digest FROM embeddings '
+                                                            f'WHERE digest IN ({placeholders})', chunk))
+            new = [position for position, digest in enumerate(digests) if digest not in known]
+            new = list({digests[position]: position for position in new}.values())
+            if not new:
+                return 0
+
+            last_row = conn.execute('SELECT MAX(row) FROM embeddings').fetchone()[0]
+            first_row = 0 if last_row is None else last_row + 1
+            end_row = first_row + len(new)
+
+            self._grow(end_row)
+            mapped = self._mapped(end_row)
+            mapped[first_row:end_row] = vectors[new]
+            mapped.flush()
+            conn.executemany('INSERT INTO embeddings VALUES (?, ?)',
+                             [(digests[position], first_row + offset) for offset, position in enumerate(new)])
+            return len(new)
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+
+    def _grow(self, rows):
+        """Aumenta o arquivo (dobrando) para caber `rows` linhas"""
+        row_bytes = self.dim * 2
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        if size >= rows * row_bytes:
+            return
+        with open(self.vectors_path, 'ab') as f:
+            f.truncate(max(rows, 2 * size // row_bytes, 1024) * row_bytes)
+
+    def _mapped(self, rows):
+        """Mapeamento do arquivo com pelo menos `rows` linhas (refeito quando o arquivo cresceu)"""
+        if self._vectors is None or len(self._vectors) < rows:
+            capacity = os.path.getsize(self.vectors_path) // (self.dim * 2)
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='r+', shape=(capacity, self.dim))
+        return self._vectors
+
+    def _connect(self):
+        return _ClosingConnection(sqlite3.connect(self.db_path, timeout=30))
+
+_STOP = object()
+
+class EmbeddingService:
+    """
+    Serviço de embeddings compartilhado pelos componentes do processo.
+
+    - encode(textos) tem a mesma interface do SentenceTransformer e pode ser
+      usado como encoder do índice de busca
+    - Textos já calculados vêm do EmbeddingStore (chave: hash do conteúdo), então
+      recalcular o corpus depois de cada coleta só processa os textos novos
+    - Os textos que faltam, de todos os chamadores, entram em uma fila única;
+      enquanto os workers estão ocupados a fila acumula e o próximo lote sai
+      com até batch_size textos (sem espera extra quando há worker livre)
+    - O encoder roda na CPU em um pool de `workers` threads; um texto pedido
+      por dois chamadores ao mesmo tempo é calculado uma vez só
+    """
+
+    def __init__(self, model, store, batch_size=64, workers=None):
+        self.model = model
+        self.store = store
+        self.batch_size = batch_size
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) // 2))
+
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._pending = {}  # hash -> Future de textos na fila ou sendo calculados
+        self._slots = threading.Semaphore(self.workers)
+        self._executor = None
+        self._dispatcher = None
+        self._metrics = Counter()
+
+    def encode(self, texts, **kwargs):
+        """Matriz float32 (len(texts) x dim) com o embedding de cada texto, na mesma ordem"""
+        texts = [text if isinstance(text, str) else str(text) for text in texts]
+        if not texts:
+            return np.zeros((0, self.store.dim or 0), dtype=np.float32)
+
+        digests = [content_digest(text) for text in texts]
+        vectors = self.store.get(set(digests))
+        missing = {digest: text for digest, text in zip(digests, texts) if digest not in vectors}
+        self._count(requests=1, texts=len(texts), cache_hits=sum(digest not in missing for digest in digests))
+
+        if missing:
+            futures = self._submit(missing)
+            for digest, future in futures.items():
+                vectors[digest] = future.result()
+
+        return np.stack([vectors[digest] for digest in digests]).astype(np.float32)
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics['stored'] = self.store.count()
+        metrics['mean_batch'] = round(metrics.get('encoded', 0) / metrics['batches'], 1) if metrics.get('batches') else 0.0
+        metrics['texts_per_second'] = round(metrics.get('encoded', 0) / metrics['encode_seconds'], 1) \
+            if metrics.get('encode_seconds') else 0.0
+        return metrics
+
+    def format_metrics(self):
+        metrics = self.metrics()
+        return (f"{metrics.get('texts', 0)} textos pedidos, {metrics.get('cache_hits', 0)} do cache, "
+                f"{metrics.get('encoded', 0)} calculados em {metrics.get('batches', 0)} lotes "
+                f"(média {metrics['mean_batch']}, {metrics['texts_per_second']} textos/s), "
+                f"{metrics['stored']} armazenados")
+
+    def close(self):
+        with self._lock:
+            dispatcher, self._dispatcher = self._dispatcher, None
+        if dispatcher is not None:
+            self._queue.put(_STOP)
+            dispatcher.join()
+            self._executor.shutdown(wait=True)
+
+    def _submit(self, missing):
+        futures = {}
+        with self._lock:
+            for digest, text in missing.items():
+                future = self._pending.get(digest)
+                if future is None:
+                    future = Future()
+                    self._pending[digest] = future
+                    self._queue.put((digest, text, future))
+                futures[digest] = future
+
+            if self._dispatcher is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='embeddings')
+                self._dispatcher = threading.Thread(target=self._dispatch, name='embeddings-dispatch', daemon=True)
+                self._dispatcher.start()
+        return futures
+
+    def _dispatch(self):
+        while True:
+            # Espera um worker livre antes de montar o lote: enquanto isso os pedidos se acumulam na fila
+            self._slots.acquire()
+            item = self._queue.get()
+            if item is _STOP:
+                self._slots.release()
+                return
+
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._executor.submit(self._encode_batch, batch)
+            if stop:
+                return
+
+    def _encode_batch(self, batch):
+        digests = [item[0] for item in batch]
+        try:
+            started = time.perf_counter()
+            vectors = np.asarray(self.model.encode([item[1] for item in batch]), dtype=np.float32)
+            self._count(batches=1, encoded=len(batch), encode_seconds=time.perf_counter() - started)
+
+            # Mesmo valor que será lido do armazenamento depois
+            vectors = vectors.astype(np.float16)
+            self.store.put(digests, vectors)
+            for (_, _, future), vector in zip(batch, vectors.astype(np.float32)):
+                future.set_result(vector)
+        except Exception as e:
+            self._count(errors=1)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            with self._lock:
+                for digest in digests:
+                    self._pending.pop(digest, None)
+            self._slots.release()
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._metrics[key] += value
+
+_services = {}
+_services_lock = threading.Lock()
+
+def shared_embedding_service(model_name, store_dir='training_data/embeddings'):
+    """
+    Serviço único por modelo no processo (None se o modelo não carregar).
+    Cada modelo tem seu próprio armazenamento em store_dir/<modelo>.
+    """
+    with _services_lock:
+        if model_name in _services:
+            return _services[model_name]
+
+        service = None
+        if SentenceTransformer is None:
+            print("⚠️ sentence-transformers não instalado: busca sem embeddings")
+        else:
+            try:
+                model = SentenceTransformer(model_name, device='cpu')
+                store = EmbeddingStore(os.path.join(store_dir, re.sub(r'[^\w.-]+', '_', model_name)))
+                service = EmbeddingService(model, store)
+            except Exception as e:
+                print(f"⚠️ Erro ao carregar o modelo de embeddings {model_name}: {e}")
+        _services[model_name] = service
+        return service
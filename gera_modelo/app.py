@@ -15,6 +15,9 @@ def create_gera_modelo_app():
     from .core.config_manager import ConfigManager
     from .core.data_collector import DataCollector
     from .core.model_trainer import ModelTrainer
+    from .core.job_scheduler import TrainingJobScheduler
+    from .core.model_registry import ModelRegistry
+    from .core.near_duplicates import NearDuplicateDetector
     from .services.training_service import TrainingService
     from .services.chat_service import ChatService
     from .services.data_service import DataService
@@ -26,10 +29,15 @@ def create_gera_modelo_app():
     config_manager = ConfigManager()
     data_collector = DataCollector(config_manager)
     model_trainer = ModelTrainer(config_manager)
+    job_scheduler = TrainingJobScheduler()
+    model_trainer.attach_scheduler(job_scheduler)
+    model_registry = ModelRegistry()
+    near_duplicate_detector = NearDuplicateDetector()
     
     # Criar serviços
-    training_service = TrainingService(config_manager, data_collector, model_trainer)
-    chat_service = ChatService(config_manager, data_collector, model_trainer)
+    training_service = TrainingService(config_manager, data_collector, model_trainer, job_scheduler, model_registry,
+                                       near_duplicate_detector)
+    chat_service = ChatService(config_manager, data_collector, model_trainer, job_scheduler, near_duplicate_detector)
     data_service = DataService(config_manager, data_collector)
     
     # Dicionário de serviços para passar para as rotas
@@ -37,6 +45,9 @@ def create_gera_modelo_app():
         'config_manager': config_manager,
         'data_collector': data_collector,
         'model_trainer': model_trainer,
+        'job_scheduler': job_scheduler,
+        'model_registry': model_registry,
+        'near_duplicate_detector': near_duplicate_detector,
         'training_service': training_service,
         'chat_service': chat_service,
         'data_service': data_service
@@ -54,6 +65,12 @@ def create_gera_modelo_app():
     register_training_routes(app, services)
     register_data_routes(app, services)
     
+    # Iniciar fila de treinamento no primeiro request (evita que o processo
+    # monitor do reloader do Flask também execute jobs da fila persistida)
+    @app.before_request
+    def start_job_scheduler():
+        job_scheduler.start()
+    
     return app, services
 
 if __name__ == '__main__':
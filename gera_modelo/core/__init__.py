@@ -5,3 +5,6 @@ Componentes centrais do sistema de treinamento
 from .config_manager import ConfigManager
 from .data_collector import DataCollector
 from .model_trainer import ModelTrainer
+from .job_scheduler import TrainingJobScheduler, TrainingCancelled
+from .model_registry import ModelRegistry
+from .near_duplicates import NearDuplicateDetector
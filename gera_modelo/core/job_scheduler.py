@@ -0,0 +1,392 @@
+import json
+import os
+import sys
+import threading
+import uuid
+from datetime import datetime
+
+class TrainingCancelled(Exception):
+    """Sinaliza que o job de treinamento foi cancelado pelo usuário"""
+
+class _JobLogRouter:
+    """Encaminha o stdout da thread de cada job também para o log do job"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+    
+    def write(self, data):
+        log_file = getattr(self.local, 'log_file', None)
+        if log_file is not None:
+            try:
+                log_file.write(data)
+                log_file.flush()
+            except Exception:
+                pass
+        return self.stream.write(data)
+    
+    def flush(self):
+        self.stream.flush()
+    
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class TrainingJobScheduler:
+    """
+    Fila persistente de jobs de treinamento com limite de concorrência.
+    
+    Cada job possui id, tipo, parâmetros (JSON), prioridade, status e log
+    próprio. Os tipos de job são associados a funções via register_handler.
+    """
+    
+    FINAL_STATUSES = ('completed', 'error', 'cancelled', 'interrupted')
+    
+    def __init__(self, jobs_dir='training_jobs', max_concurrent_jobs=None, resume_interrupted=None):
+        self.jobs_dir = jobs_dir
+        self.logs_dir = os.path.join(jobs_dir, 'logs')
+        self.state_file = os.path.join(jobs_dir, 'jobs.json')
+        os.makedirs(self.logs_dir, exist_ok=True)
+        
+        if max_concurrent_jobs is None:
+            max_concurrent_jobs = int(os.environ.get('TRAINING_MAX_CONCURRENT_JOBS', 1))
+        self.max_concurrent_jobs = max(1, max_concurrent_jobs)
+        
+        if resume_interrupted is None:
+            resume_interrupted = os.environ.get('TRAINING_RESUME_INTERRUPTED', 'true').lower() != 'false'
+        self.resume_interrupted = resume_interrupted
+        
+        self.jobs = {}
+        self.handlers = {}
+        self.cancel_events = {}
+        self.running_jobs = 0
+        
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        self._context = threading.local()
+        self._dispatcher = None
+        
+        self._load_state()
+    
+    def register_handler(self, job_type, handler):
+        """Associa um tipo de job à função que o executa"""
+        self.handlers[job_type] = handler
+    
+    def start(self):
+        """Inicia a thread que despacha os jobs da fila"""
+        if self._dispatcher is not None:
+            return
+        
+        with self._lock:
+            if self._dispatcher is not None:
+                return
+            
+            if not isinstance(sys.stdout, _JobLogRouter):
+                sys.stdout = _JobLogRouter(sys.stdout)
+            
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+            self._dispatcher.start()
+        
+        print(f"🗂️ Agendador de treinamento iniciado (máx. {self.max_concurrent_jobs} job(s) simultâneo(s))")
+    
+    def submit(self, job_type, params, priority=0, description=''):
+        """Adiciona um job à fila e retorna seus dados"""
+        if job_type not in self.handlers:
+            raise ValueError(f"Tipo de job não registrado: {job_type}")
+        
+        job_id = f"job_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        job = {
+            'id': job_id,
+            'type': job_type,
+            'description': description,
+            'params': params,
+            'priority': int(priority),
+            'status': 'queued',
+            'progress': 0,
+            'message': 'Aguardando na fila de treinamento',
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'metrics': {},
+            'log_file': os.path.join(self.logs_dir, f'{job_id}.log')
+        }
+        
+        with self._lock:
+            self.jobs[job_id] = job
+            self.cancel_events[job_id] = threading.Event()
+            self._save_state()
+            self._wakeup.notify_all()
+        
+        print(f"📥 Job {job_id} ({job_type}) adicionado à fila - posição {self.get_queue_position(job_id)}")
+        return self._public_job(job)
+    
+    def cancel(self, job_id):
+        """Cancela um job na fila ou solicita a parada de um job em execução"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return {'status': 'error', 'message': 'Job não encontrado'}
+            
+            if job['status'] in self.FINAL_STATUSES:
+                return {'status': 'error', 'message': f"Job já finalizado ({job['status']})"}
+            
+            if job['status'] == 'queued':
+                job['status'] = 'cancelled'
+                job['message'] = 'Job cancelado antes do início'
+                job['finished_at'] = datetime.now().isoformat()
+                self._save_state()
+                return {'status': 'success', 'message': 'Job removido da fila'}
+            
+            self.cancel_events[job_id].set()
+            job['message'] = 'Cancelamento solicitado...'
+            self._save_state()
+        
+        self._append_log(job_id, 'Cancelamento solicitado pelo usuário\n')
+        return {'status': 'success', 'message': 'Cancelamento solicitado; o job será interrompido no próximo ponto seguro'}
+    
+    def set_priority(self, job_id, priority):
+        """Altera a prioridade de um job ainda na fila"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return {'status': 'error', 'message': 'Job não encontrado'}
+            
+            if job['status'] != 'queued':
+                return {'status': 'error', 'message': 'Somente jobs na fila podem ter a prioridade alterada'}
+            
+            job['priority'] = int(priority)
+            self._save_state()
+            self._wakeup.notify_all()
+        
+        return {'status': 'success', 'message': 'Prioridade atualizada', 'queue_position': self.get_queue_position(job_id)}
+    
+    def requeue(self, job_id):
+        """Recoloca na fila um job interrompido, com erro ou cancelado (retoma do último checkpoint)"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return {'status': 'error', 'message': 'Job não encontrado'}
+            
+            if job['status'] not in ('interrupted', 'error', 'cancelled'):
+                return {'status': 'error', 'message': f"Job não pode ser retomado ({job['status']})"}
+            
+            self._mark_for_resume(job, 'Job recolocado na fila para retomada')
+            self._save_state()
+            self._wakeup.notify_all()
+        
+        return {'status': 'success', 'message': 'Job recolocado na fila', 'queue_position': self.get_queue_position(job_id)}
+    
+    def get_job(self, job_id):
+        """Retorna os dados de um job (ou None)"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return None
+            result = self._public_job(job)
+        
+        if result['status'] == 'queued':
+            result['queue_position'] = self.get_queue_position(job_id)
+        return result
+    
+    def list_jobs(self, status=None):
+        """Lista jobs, mais recentes primeiro"""
+        with self._lock:
+            jobs = [self._public_job(job) for job in self.jobs.values()
+                    if status is None or job['status'] == status]
+        
+        jobs.sort(key=lambda x: x['created_at'], reverse=True)
+        return jobs
+    
+    def get_queue_position(self, job_id):
+        """Posição do job na fila (1 = próximo a executar)"""
+        with self._lock:
+            queued = self._queued_jobs()
+            for position, job in enumerate(queued, start=1):
+                if job['id'] == job_id:
+                    return position
+        return None
+    
+    def get_job_log(self, job_id, tail=200):
+        """Retorna as últimas linhas do log de um job"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+        
+        if not os.path.exists(job['log_file']):
+            return []
+        
+        with open(job['log_file'], 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.readlines()
+        
+        return [line.rstrip('\n') for line in lines[-tail:]]
+    
+    def current_job_id(self):
+        """Id do job executado pela thread atual (ou None)"""
+        return getattr(self._context, 'job_id', None)
+    
+    def is_cancel_requested(self, job_id):
+        """Indica se o cancelamento do job foi solicitado"""
+        event = self.cancel_events.get(job_id)
+        return bool(event and event.is_set())
+    
+    def update_job(self, job_id, status, progress, message, metrics=None):
+        """Atualiza status/progresso (e telemetria, se informada) de um job em execução"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job or job['status'] in self.FINAL_STATUSES:
+                return
+            
+            status_changed = job['status'] != status
+            job['status'] = status
+            job['progress'] = progress
+            job['message'] = message
+            if metrics is not None:
+                job['metrics'] = metrics
+            
+            if status_changed:
+                self._save_state()
+        
+        self._append_log(job_id, f"[{datetime.now().strftime('%H:%M:%S')}] {status} ({progress}%): {message}\n")
+    
+    def _mark_for_resume(self, job, message):
+        """Volta o job para a fila mantendo parâmetros (e diretório de saída)"""
+        job['status'] = 'queued'
+        job['message'] = message
+        job['finished_at'] = None
+        job['resume_count'] = job.get('resume_count', 0) + 1
+        self.cancel_events[job['id']] = threading.Event()
+    
+    def _queued_jobs(self):
+        """Jobs na fila ordenados por prioridade (maior primeiro) e chegada"""
+        queued = [job for job in self.jobs.values() if job['status'] == 'queued']
+        queued.sort(key=lambda x: (-x['priority'], x['created_at']))
+        return queued
+    
+    def _dispatch_loop(self):
+        """Despacha jobs respeitando o limite de concorrência"""
+        while True:
+            with self._wakeup:
+                while self.running_jobs >= self.max_concurrent_jobs or not self._queued_jobs():
+                    self._wakeup.wait()
+                
+                job = self._queued_jobs()[0]
+                job['status'] = 'running'
+                job['message'] = 'Job iniciado'
+                job['started_at'] = datetime.now().isoformat()
+                self.running_jobs += 1
+                self._save_state()
+            
+            worker = threading.Thread(target=self._run_job, args=(job['id'],), daemon=True)
+            worker.start()
+    
+    def _run_job(self, job_id):
+        """Executa um job na thread atual, com log e contexto próprios"""
+        job = self.jobs[job_id]
+        handler = self.handlers.get(job['type'])
+        self._context.job_id = job_id
+        
+        log_file = open(job['log_file'], 'a', encoding='utf-8')
+        router = sys.stdout if isinstance(sys.stdout, _JobLogRouter) else None
+        if router:
+            router.local.log_file = log_file
+        
+        final_status = None
+        final_message = None
+        try:
+            print(f"\n=== JOB {job_id} ({job['type']}) INICIADO ===")
+            if handler is None:
+                raise ValueError(f"Tipo de job não registrado: {job['type']}")
+            
+            handler(**job['params'])
+        
+        except TrainingCancelled:
+            final_status = 'cancelled'
+        except Exception as e:
+            final_status = 'error'
+            final_message = f'Erro durante o job: {str(e)}'
+            print(f"❌ {final_message}")
+        finally:
+            with self._lock:
+                if self.is_cancel_requested(job_id):
+                    final_status = 'cancelled'
+                    final_message = 'Job cancelado pelo usuário'
+                elif final_status is None:
+                    final_status = 'error' if job['status'] == 'error' else 'completed'
+                
+                job['status'] = final_status
+                if final_message:
+                    job['message'] = final_message
+                if final_status == 'completed':
+                    job['progress'] = 100
+                job['finished_at'] = datetime.now().isoformat()
+                
+                self.running_jobs -= 1
+                self._save_state()
+                self._wakeup.notify_all()
+            
+            print(f"=== JOB {job_id} FINALIZADO: {final_status} ===")
+            
+            if router:
+                router.local.log_file = None
+            log_file.close()
+            self._context.job_id = None
+    
+    def _append_log(self, job_id, text):
+        """Acrescenta uma linha ao log do job"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+        
+        # A thread do próprio job já espelha o stdout no log
+        if self.current_job_id() == job_id:
+            return
+        
+        try:
+            with open(job['log_file'], 'a', encoding='utf-8') as f:
+                f.write(text)
+        except Exception as e:
+            print(f"Erro ao escrever log do job {job_id}: {e}")
+    
+    def _public_job(self, job):
+        """Cópia dos dados do job sem os parâmetros completos"""
+        result = {key: value for key, value in job.items() if key != 'params'}
+        result['cancel_requested'] = self.is_cancel_requested(job['id'])
+        return result
+    
+    def _load_state(self):
+        """Carrega a fila persistida; jobs em execução no desligamento são marcados como interrompidos"""
+        if not os.path.exists(self.state_file):
+            return
+        
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                jobs = json.load(f)
+        except Exception as e:
+            print(f"Erro ao carregar fila de jobs: {e}")
+            return
+        
+        for job in jobs:
+            self.jobs[job['id']] = job
+            self.cancel_events[job['id']] = threading.Event()
+            
+            if job['status'] == 'running':
+                if self.resume_interrupted:
+                    self._mark_for_resume(job, 'Retomando após reinício do servidor')
+                else:
+                    job['status'] = 'interrupted'
+                    job['message'] = 'Job interrompido pelo desligamento do servidor'
+                    job['finished_at'] = datetime.now().isoformat()
+        
+        queued = len(self._queued_jobs())
+        if queued:
+            print(f"📂 {queued} job(s) pendente(s) restaurado(s) da fila")
+        self._save_state()
+    
+    def _save_state(self):
+        """Persiste a fila de jobs em disco (escrita atômica)"""
+        tmp_file = self.state_file + '.tmp'
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(list(self.jobs.values()), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.state_file)
+        except Exception as e:
+            print(f"Erro ao salvar fila de jobs: {e}")
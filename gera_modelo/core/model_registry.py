@@ -0,0 +1,62 @@
+import json
+import os
+
+class ModelRegistry:
+    """
+    Registro dos modelos treinados em ./models.
+    
+    Cada treinamento concluído grava um training_info.json no diretório do
+    modelo; o registro indexa esses arquivos (data, modo, corte dos dados).
+    """
+    
+    def __init__(self, models_dir='./models'):
+        self.models_dir = models_dir
+    
+    def list_models(self):
+        """Lista modelos registrados, mais recentes primeiro"""
+        models = []
+        
+        if not os.path.exists(self.models_dir):
+            return models
+        
+        for folder in os.listdir(self.models_dir):
+            if not folder.startswith('trained_'):
+                continue
+            
+            model_path = os.path.join(self.models_dir, folder)
+            info_file = os.path.join(model_path, 'training_info.json')
+            if not os.path.exists(info_file):
+                # Treinamento não concluído (sem modelo final salvo)
+                continue
+            
+            try:
+                with open(info_file, 'r', encoding='utf-8') as f:
+                    info = json.load(f)
+            except Exception as e:
+                print(f"Erro ao ler {info_file}: {e}")
+                continue
+            
+            info['name'] = folder
+            info['path'] = model_path
+            # Modelos antigos não registravam o corte dos dados
+            info.setdefault('data_cutoff', info.get('training_date'))
+            # Métricas de validação (modelos treinados sem conjunto de validação não têm)
+            evaluation = info.get('evaluation') or {}
+            info['eval_loss'] = evaluation.get('best_eval_loss')
+            info['eval_perplexity'] = evaluation.get('best_perplexity')
+            models.append(info)
+        
+        models.sort(key=lambda x: x.get('training_date') or '', reverse=True)
+        return models
+    
+    def get_latest_model(self):
+        """Retorna o modelo registrado mais recente (ou None)"""
+        models = self.list_models()
+        return models[0] if models else None
+    
+    def get_model(self, name):
+        """Retorna um modelo registrado pelo nome do diretório (ou None)"""
+        for model in self.list_models():
+            if model['name'] == name:
+                return model
+        return None
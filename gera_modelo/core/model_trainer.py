@@ -1,7 +1,9 @@
 # ...existing code from model_trainer.py...
 # (Mover o código existente do model_trainer.py para aqui)
 
+import os
 from model_trainer import ModelTrainer as BaseModelTrainer
+from .job_scheduler import TrainingCancelled
 
 class ModelTrainer(BaseModelTrainer):
     """
@@ -12,3 +14,44 @@ class ModelTrainer(BaseModelTrainer):
     def __init__(self, config_manager):
         super().__init__(config_manager)
         self.config_manager = config_manager
+        self.job_scheduler = None
+    
+    def attach_scheduler(self, job_scheduler):
+        """Associa o agendador de jobs para status e cancelamento por job"""
+        self.job_scheduler = job_scheduler
+    
+    def train_model(self, config):
+        """Treina o modelo; jobs usam um diretório de saída estável para poder retomar"""
+        job_id = self.job_scheduler.current_job_id() if self.job_scheduler else None
+        
+        if job_id and not config.get('output_dir'):
+            # config pertence aos parâmetros persistidos do job
+            config['output_dir'] = os.path.join('./models', f"trained_{job_id[len('job_'):]}")
+        
+        return super().train_model(config)
+    
+    def update_status(self, status, progress, message, metrics=None, job_id=None):
+        """
+        Atualiza status global e do job em execução na thread atual (ou do
+        job_id informado, para chamadas feitas de outras threads do job)
+        """
+        if job_id is None and self.job_scheduler:
+            job_id = self.job_scheduler.current_job_id()
+        
+        if job_id and self.job_scheduler.is_cancel_requested(job_id):
+            if status == 'error':
+                status, message = 'cancelled', 'Treinamento cancelado pelo usuário'
+            elif status != 'cancelled':
+                raise TrainingCancelled(f'Job {job_id} cancelado pelo usuário')
+        
+        super().update_status(status, progress, message, metrics)
+        
+        if job_id:
+            self.job_scheduler.update_job(job_id, status, progress, message, metrics)
+    
+    def get_status(self, job_id=None):
+        """Retorna status de um job específico ou o último status global"""
+        if job_id and self.job_scheduler:
+            return self.job_scheduler.get_job(job_id)
+        
+        return super().get_status()
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from content_index import _ClosingConnection
+
+class NearDuplicateDetector:
+    """
+    Remoção de quase-duplicatas com MinHash + LSH (locality-sensitive hashing).
+
+    Cada texto vira um conjunto de shingles de caracteres; a assinatura MinHash
+    estima a similaridade de Jaccard entre dois textos e o LSH por bandas só
+    compara textos que colidem em alguma banda, mantendo o custo quase linear.
+
+    As assinaturas ficam em cache em disco (SQLite, por hash do texto
+    normalizado), então execuções seguintes só calculam assinaturas de textos
+    novos; cada sessão grava apenas as assinaturas que calculou.
+    """
+
+    def __init__(self, threshold=None, num_perm=128, shingle_size=5,
+                 signatures_file='training_data/minhash_signatures.db',
+                 max_cached_signatures=500000, seed=1):
+        if threshold is None:
+            threshold = float(os.environ.get('DEDUP_JACCARD_THRESHOLD', 0.8))
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.signatures_file = signatures_file
+        self.max_cached_signatures = max_cached_signatures
+        self.seed = seed
+
+        # Funções de hash (multiply-shift) fixas pela semente: assinaturas persistidas continuam comparáveis
+        rng = np.random.default_rng(seed)
+        self._hash_a = (rng.integers(1, 2**63, size=(num_perm, 1), dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+        self._hash_b = rng.integers(0, 2**63, size=(num_perm, 1), dtype=np.uint64)
+
+        self._cache = None
+        self._unsaved = {}
+        self._lock = threading.Lock()
+
+    def deduplicate(self, texts, threshold=None):
+        """
+        Remove duplicatas exatas e quase-duplicatas mantendo a primeira ocorrência.
+
+        Retorna (textos_unicos, estatisticas).
+        """
+        session = self.session(threshold)
+        unique_texts = [text for text in texts if session.add(text)]
+        session.close()
+
+        stats = session.stats()
+        print(f"🧹 Deduplicação MinHash (Jaccard ≥ {stats['threshold']}): {stats['exact_duplicates']} exatas, "
+              f"{stats['near_duplicates']} quase-duplicatas removidas, {len(unique_texts)} textos mantidos "
+              f"({stats['new_signatures']} assinaturas novas, {stats['seconds']}s)")
+
+        return unique_texts, stats
+
+    def session(self, threshold=None):
+        """Deduplicação incremental (textos chegando aos poucos, ex.: pipeline de coleta)"""
+        return DeduplicationSession(self, self.threshold if threshold is None else threshold)
+
+    def signature(self, text):
+        """Assinatura MinHash (num_perm valores uint32) do texto"""
+        shingles = self._shingle_hashes(text)
+        signature = np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+
+        # Em blocos para limitar a matriz num_perm x shingles em textos longos
+        for start in range(0, len(shingles), 4096):
+            block = shingles[start:start + 4096][np.newaxis, :]
+            hashed = (self._hash_a * block + self._hash_b) >> np.uint64(32)
+            signature = np.minimum(signature, hashed.min(axis=1).astype(np.uint32))
+
+        return signature
+
+    def estimate_jaccard(self, signature_a, signature_b):
+        """Similaridade de Jaccard estimada pela fração de posições iguais"""
+        return float(np.count_nonzero(signature_a == signature_b)) / self.num_perm
+
+    def lsh_params(self, threshold):
+        """
+        Escolhe (bandas, linhas) com bandas x linhas <= num_perm minimizando a soma
+        das probabilidades de falso positivo e falso negativo em torno do limiar.
+        """
+        grid = np.linspace(0, 1, 101)
+        best, best_error = (1, self.num_perm), None
+
+        for bands in range(1, self.num_perm + 1):
+            for rows in range(1, self.num_perm // bands + 1):
+                # Probabilidade de dois textos com similaridade s colidirem em alguma banda
+                collision = 1 - (1 - grid ** rows) ** bands
+                false_positive = collision[grid < threshold].mean() if threshold > 0 else 0
+                false_negative = (1 - collision[grid >= threshold]).mean()
+                error = false_positive + false_negative
+                if best_error is None or error < best_error:
+                    best, best_error = (bands, rows), error
+
+        return best
+
+    def _normalize(self, text):
+        return re.sub(r'\s+', ' ', text.lower()).strip()
+
+    def _text_key(self, text):
+        return hashlib.sha1(self._normalize(text).encode('utf-8')).hexdigest()
+
+    def _shingle_hashes(self, text):
+        """Hashes (32 bits) dos shingles de caracteres, calculados de forma vetorizada"""
+        data = np.frombuffer(self._normalize(text).encode('utf-8'), dtype=np.uint8).astype(np.uint64)
+        size = min(self.shingle_size, max(len(data), 1))
+        count = max(len(data) - size + 1, 1)
+
+        # Hash polinomial de cada janela de `size` bytes (overflow em 64 bits é intencional)
+        hashes = np.zeros(count, dtype=np.uint64)
+        for offset in range(size):
+            window = data[offset:offset + count]
+            hashes[:len(window)] = hashes[:len(window)] * np.uint64(257) + window
+
+        # Espalhar os bits (Fibonacci hashing) e reduzir para 32 bits
+        hashes = (hashes * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)
+        return np.unique(hashes)
+
+    def _cached_signature(self, key, text):
+        """(assinatura, calculada_agora) do texto, do cache ou calculada (chamar com _lock)"""
+        cache = self._load_cache()
+        signature = cache.get(key)
+        if signature is not None:
+            return signature, False
+
+        signature = self.signature(text)
+        cache[key] = signature
+        self._unsaved[key] = signature
+        # Manter na memória só as mais recentes (dicionário preserva a ordem de inserção)
+        if len(cache) > self.max_cached_signatures:
+            del cache[next(iter(cache))]
+        return signature, True
+
+    def _load_cache(self):
+        if self._cache is not None:
+            return self._cache
+
+        self._cache = {}
+        try:
+            os.makedirs(os.path.dirname(self.signatures_file) or '.', exist_ok=True)
+            with self._connect() as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('CREATE TABLE IF NOT EXISTS signatures (key TEXT PRIMARY KEY, signature BLOB)')
+                conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+                # Assinaturas de outra configuração não são comparáveis
+                params = json.dumps([self.num_perm, self.shingle_size, self.seed])
+                stored = conn.execute("SELECT value FROM meta WHERE key = 'params'").fetchone()
+                if stored is None or stored[0] != params:
+                    conn.execute('DELETE FROM signatures')
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('params', ?)", (params,))
+
+                for key, blob in conn.execute('SELECT key, signature FROM signatures ORDER BY rowid'):
+                    self._cache[key] = np.frombuffer(blob, dtype=np.uint32)
+        except Exception as e:
+            print(f"Erro ao ler assinaturas MinHash: {e}")
+
+        if not self._cache:
+            self._import_legacy_cache()
+        return self._cache
+
+    def _import_legacy_cache(self):
+        """Cache de versões anteriores (um .npz regravado inteiro a cada execução)"""
+        legacy_file = os.path.splitext(self.signatures_file)[0] + '.npz'
+        if not os.path.exists(legacy_file):
+            return
+
+        try:
+            with np.load(legacy_file) as stored:
+                if stored['params'].tolist() == [self.num_perm, self.shingle_size, self.seed]:
+                    self._unsaved.update(zip(stored['keys'].tolist(), stored['signatures']))
+                    self._cache.update(self._unsaved)
+            self._save_cache()
+            os.remove(legacy_file)
+            print(f"📦 {len(self._cache)} assinaturas MinHash importadas de {legacy_file}")
+        except Exception as e:
+            print(f"Erro ao importar assinaturas MinHash de {legacy_file}: {e}")
+
+    def _save_cache(self):
+        """Grava só as assinaturas calculadas desde a última gravação (chamar com _lock)"""
+        unsaved, self._unsaved = self._unsaved, {}
+        if not unsaved:
+            return
+
+        try:
+            with self._connect() as conn:
+                conn.executemany('INSERT OR REPLACE INTO signatures (key, signature) VALUES (?, ?)',
+                                 [(key, np.asarray(signature, dtype=np.uint32).tobytes())
+                                  for key, signature in unsaved.items()])
+                # Manter apenas as assinaturas mais recentes
+                conn.execute('DELETE FROM signatures WHERE rowid <= (SELECT MAX(rowid) FROM signatures) - ?',
+                             (self.max_cached_signatures,))
+        except Exception as e:
+            print(f"Erro ao salvar assinaturas MinHash: {e}")
+
+    def _connect(self):
+        return _ClosingConnection(sqlite3.connect(self.signatures_file, timeout=30))
+
+class DeduplicationSession:
+    """
+    Estado de uma deduplicação incremental: add(texto) indica se o texto deve
+    ser mantido, comparando-o com os textos já mantidos na sessão.
+
+    Guarda só as chaves e as assinaturas dos textos mantidos (não os textos);
+    close() persiste as assinaturas novas no cache do detector.
+    """
+
+    def __init__(self, detector, threshold):
+        self.detector = detector
+        self.threshold = threshold
+        self.bands, self.rows = detector.lsh_params(threshold)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._kept_signatures = []
+        self._keys = set()
+        self._started = time.time()
+        self._counts = {'input': 0, 'exact_duplicates': 0, 'near_duplicates': 0, 'new_signatures': 0}
+
+    def add(self, text):
+        self._counts['input'] += 1
+        key = self.detector._text_key(text)
+        if key in self._keys:
+            self._counts['exact_duplicates'] += 1
+            return False
+        self._keys.add(key)
+
+        with self.detector._lock:
+            signature, computed = self.detector._cached_signature(key, text)
+        if computed:
+            self._counts['new_signatures'] += 1
+
+        rows = self.rows
+        band_keys = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+
+        # Candidatos: textos já mantidos que colidem em alguma banda
+        candidates = set()
+        for band, band_key in enumerate(band_keys):
+            candidates.update(self._buckets[band].get(band_key, ()))
+
+        if any(self.detector.estimate_jaccard(signature, self._kept_signatures[index]) >= self.threshold
+               for index in candidates):
+            self._counts['near_duplicates'] += 1
+            return False
+
+        index = len(self._kept_signatures)
+        self._kept_signatures.append(signature)
+        for band, band_key in enumerate(band_keys):
+            self._buckets[band].setdefault(band_key, []).append(index)
+        return True
+
+    def close(self):
+        if self._counts['new_signatures']:
+            with self.detector._lock:
+                self.detector._save_cache()
+
+    def stats(self):
+        counts = self._counts
+        return {
+            'input': counts['input'],
+            'exact_duplicates': counts['exact_duplicates'],
+            'near_duplicates': counts['near_duplicates'],
+            'unique': len(self._kept_signatures),
+            'threshold': self.threshold,
+            'new_signatures': counts['new_signatures'],
+            'cached_signatures': len(self._keys) - counts['new_signatures'],
+            'seconds': round(time.time() - self._started, 3)
+        }
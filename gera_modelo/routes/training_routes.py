@@ -1,10 +1,13 @@
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context
+import json
+import time
 
 def register_training_routes(app, services):
     """Registra rotas relacionadas ao treinamento de modelos"""
     
     training_service = services['training_service']
     model_trainer = services['model_trainer']
+    job_scheduler = services['job_scheduler']
     
     @app.route('/api/start_training', methods=['POST'])
     def start_training():
@@ -14,8 +17,112 @@ def register_training_routes(app, services):
     
     @app.route('/api/training_status')
     def training_status():
+        """Status de um job (?job_id=...) ou o último status global"""
+        job_id = request.args.get('job_id')
+        
+        if job_id:
+            job = model_trainer.get_status(job_id)
+            if not job:
+                return jsonify({'error': 'Job não encontrado'}), 404
+            return jsonify(job)
+        
         return jsonify(model_trainer.get_status())
     
+    @app.route('/api/training_stream')
+    def training_stream():
+        """Stream SSE com status e telemetria do treinamento (?job_id=...)"""
+        job_id = request.args.get('job_id')
+        
+        def generate():
+            last_payload = None
+            idle_ticks = 0
+            
+            while True:
+                status = model_trainer.get_status(job_id) if job_id else model_trainer.get_status()
+                if status is None:
+                    yield 'event: error\ndata: {"error": "Job não encontrado"}\n\n'
+                    return
+                
+                payload = json.dumps(status, ensure_ascii=False)
+                if payload != last_payload:
+                    yield f'data: {payload}\n\n'
+                    last_payload = payload
+                    idle_ticks = 0
+                else:
+                    idle_ticks += 1
+                    if idle_ticks % 15 == 0:
+                        yield ': keep-alive\n\n'
+                
+                if status.get('status') in job_scheduler.FINAL_STATUSES:
+                    return
+                
+                time.sleep(1)
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
+    @app.route('/api/training_jobs')
+    def list_training_jobs():
+        """Lista jobs de treinamento (filtro opcional ?status=...)"""
+        jobs = job_scheduler.list_jobs(request.args.get('status'))
+        return jsonify({
+            'jobs': jobs,
+            'total_jobs': len(jobs),
+            'running_jobs': job_scheduler.running_jobs,
+            'max_concurrent_jobs': job_scheduler.max_concurrent_jobs
+        })
+    
+    @app.route('/api/training_jobs/<job_id>/cancel', methods=['POST'])
+    def cancel_training_job(job_id):
+        """Cancela um job na fila ou em execução"""
+        result = job_scheduler.cancel(job_id)
+        
+        if result.get('status') == 'error':
+            return jsonify(result), 400
+        
+        return jsonify(result)
+    
+    @app.route('/api/training_jobs/<job_id>/resume', methods=['POST'])
+    def resume_training_job(job_id):
+        """Recoloca na fila um job interrompido (retoma do último checkpoint)"""
+        result = job_scheduler.requeue(job_id)
+        
+        if result.get('status') == 'error':
+            return jsonify(result), 400
+        
+        return jsonify(result)
+    
+    @app.route('/api/training_jobs/<job_id>/priority', methods=['POST'])
+    def set_training_job_priority(job_id):
+        """Altera a prioridade de um job na fila"""
+        data = request.json or {}
+        
+        try:
+            priority = int(data.get('priority', 0))
+        except (TypeError, ValueError):
+            return jsonify({'status': 'error', 'message': 'Prioridade inválida'}), 400
+        
+        result = job_scheduler.set_priority(job_id, priority)
+        
+        if result.get('status') == 'error':
+            return jsonify(result), 400
+        
+        return jsonify(result)
+    
+    @app.route('/api/training_jobs/<job_id>/log')
+    def get_training_job_log(job_id):
+        """Retorna as últimas linhas do log de um job"""
+        tail = request.args.get('tail', 200, type=int)
+        lines = job_scheduler.get_job_log(job_id, tail)
+        
+        if lines is None:
+            return jsonify({'error': 'Job não encontrado'}), 404
+        
+        return jsonify({'job_id': job_id, 'lines': lines})
+    
     @app.route('/api/retrain_model', methods=['POST'])
     def retrain_model():
         """Retreina o modelo usando configurações de treinamentos anteriores"""
@@ -23,17 +130,26 @@ def register_training_routes(app, services):
         previous_config_file = data.get('config_file')
         use_chat_data = data.get('use_chat_data', True)
         merge_strategy = data.get('merge_strategy', 'append')
+        continued_training = data.get('continued_training', False)
+        replay_ratio = data.get('replay_ratio', 0.0)
         
         if not previous_config_file:
             return jsonify({'error': 'Arquivo de configuração não especificado'}), 400
         
-        result = training_service.retrain_model(previous_config_file, use_chat_data, merge_strategy)
+        result = training_service.retrain_model(previous_config_file, use_chat_data, merge_strategy,
+                                                continued_training, replay_ratio)
         
         if result.get('status') == 'error':
             return jsonify(result), 400
         
         return jsonify(result)
     
+    @app.route('/api/models')
+    def list_models():
+        """Lista modelos treinados registrados"""
+        models = services['model_registry'].list_models()
+        return jsonify({'models': models, 'total_models': len(models)})
+    
     @app.route('/api/train_with_chat_data', methods=['POST'])
     def train_with_chat_data():
         """Treina modelo usando dados de conversas do chat"""
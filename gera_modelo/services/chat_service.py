@@ -1,15 +1,18 @@
 import requests
-import threading
 import json
 import os
 from datetime import datetime
 
 class ChatService:
-    def __init__(self, config_manager, data_collector, model_trainer):
+    def __init__(self, config_manager, data_collector, model_trainer, job_scheduler, near_duplicate_detector):
         self.config_manager = config_manager
         self.data_collector = data_collector
         self.model_trainer = model_trainer
+        self.job_scheduler = job_scheduler
+        self.near_duplicate_detector = near_duplicate_detector
         self.chat_service_url = 'http://localhost:5001'
+        
+        self.job_scheduler.register_handler('chat_training', self._run_training_process)
     
     def get_chat_training_data_info(self):
         """Retorna informações sobre dados de treinamento do chat"""
@@ -132,6 +135,9 @@ class ChatService:
                 except Exception as e:
                     print(f"Erro ao processar {filename}: {e}")
         
+        # Corte depois da leitura: conversas encerradas durante ela também ficam antes dele
+        config['data_cutoff'] = datetime.now().isoformat()
+        
         # Verificar se há dados suficientes
         if len(all_texts) == 0:
             return {
@@ -140,9 +146,12 @@ class ChatService:
                 'details': 'Verifique os filtros aplicados ou se há conversas salvas'
             }
         
-        # Remover duplicatas
-        unique_texts = list(set(all_texts))
-        print(f"Dados do chat coletados: {len(unique_texts)} textos únicos de {conversation_count} conversas")
+        # Remover duplicatas e transcrições quase idênticas (MinHash/LSH)
+        unique_texts, dedup_stats = self.near_duplicate_detector.deduplicate(
+            all_texts, training_options.get('dedup_threshold')
+        )
+        print(f"Dados do chat coletados: {len(unique_texts)} textos únicos de {conversation_count} conversas "
+              f"({dedup_stats['near_duplicates']} quase-duplicatas removidas)")
         
         if len(unique_texts) < 5:
             return {
@@ -157,7 +166,8 @@ class ChatService:
                 'unique_texts': unique_texts,
                 'total_sources': total_sources,
                 'conversation_count': conversation_count,
-                'original_count': len(all_texts)
+                'original_count': len(all_texts),
+                'near_duplicates_removed': dedup_stats['near_duplicates']
             }
         }
     
@@ -197,17 +207,19 @@ class ChatService:
         with open(config_filename, 'w', encoding='utf-8') as f:
             json.dump(config, f, ensure_ascii=False, indent=2)
         
-        # Iniciar treinamento
-        training_thread = threading.Thread(
-            target=self._run_training_process,
-            args=(config, config_filename),
-            daemon=True
+        # Enfileirar treinamento
+        job = self.job_scheduler.submit(
+            'chat_training',
+            {'config': config, 'config_filename': config_filename},
+            priority=training_options.get('priority', 0),
+            description='Treinamento com dados do chat'
         )
-        training_thread.start()
         
         return {
             'status': 'success',
-            'message': 'Treinamento com dados do chat iniciado',
+            'message': 'Treinamento com dados do chat adicionado à fila',
+            'job_id': job['id'],
+            'queue_position': self.job_scheduler.get_queue_position(job['id']),
             'config_file': config_filename,
             'data_file': data_filename,
             'stats': {
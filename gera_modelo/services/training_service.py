@@ -1,13 +1,25 @@
-import threading
 import json
 import os
+import random
+import shutil
 from datetime import datetime
 
+from collection_pipeline import StreamingPipeline, PipelineStopped, ShardWriter, read_shards
+
 class TrainingService:
-    def __init__(self, config_manager, data_collector, model_trainer):
+    def __init__(self, config_manager, data_collector, model_trainer, job_scheduler, model_registry,
+                 near_duplicate_detector):
         self.config_manager = config_manager
         self.data_collector = data_collector
         self.model_trainer = model_trainer
+        self.job_scheduler = job_scheduler
+        self.model_registry = model_registry
+        self.near_duplicate_detector = near_duplicate_detector
+        
+        # Tipos de job executados pela fila de treinamento
+        self.job_scheduler.register_handler('collect_and_train', self._collect_and_train)
+        self.job_scheduler.register_handler('collect_and_retrain', self._collect_and_retrain)
+        self.job_scheduler.register_handler('retrain', self._run_training_process)
     
     def start_training(self, config):
         """Inicia o processo de treinamento (versão modular)"""
@@ -25,18 +37,37 @@ class TrainingService:
                 if validation_result['status'] == 'error':
                     return validation_result
             
-            # Iniciar coleta e treinamento em thread separada
-            thread = threading.Thread(target=self._collect_and_train, args=(config,))
-            thread.daemon = True
-            thread.start()
+            # Enfileirar coleta e treinamento
+            job = self.job_scheduler.submit(
+                'collect_and_train',
+                {'config': config},
+                priority=config.get('priority', 0),
+                description=f"Coleta e treinamento ({config.get('base_model', 'microsoft/DialoGPT-small')})"
+            )
             
-            return {'status': 'success', 'message': 'Treinamento iniciado com sucesso!'}
+            return {
+                'status': 'success',
+                'message': 'Treinamento adicionado à fila com sucesso!',
+                'job_id': job['id'],
+                'queue_position': self.job_scheduler.get_queue_position(job['id'])
+            }
             
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
     
     def _validate_email_config(self, email_config):
         """Valida configurações de email"""
+        # Várias contas: cada uma herda os campos ausentes da configuração principal
+        if email_config.get('accounts'):
+            shared = {key: value for key, value in email_config.items() if key != 'accounts'}
+            for index, account in enumerate(email_config['accounts']):
+                merged = {**shared, **account}
+                result = self._validate_email_config(merged)
+                if result['status'] == 'error':
+                    return result
+                email_config['accounts'][index] = merged
+            return {'status': 'success'}
+        
         required_fields = ['provider', 'username', 'password']
         
         for field in required_fields:
@@ -85,73 +116,65 @@ class TrainingService:
     def _collect_and_train(self, config):
         """Coleta dados e treina modelo (processo interno)"""
         try:
-            print("\n=== INICIANDO COLETA DE DADOS ===")
-            
-            # Coletar dados primeiro
-            all_texts = []
-            total_sources = set()
+            # Job retomado após interrupção: dados já coletados, seguir para o treino
+            if config.get('data_file') and os.path.exists(config['data_file']):
+                print(f"\n♻️ Retomando job: dados já coletados em {config['data_file']}")
+                self.model_trainer.train_model(config)
+                return
             
-            # Coleta web
-            if config.get('web_sources'):
-                for url in config['web_sources']:
-                    try:
-                        web_texts = self.data_collector.collect_web_data(url, config.get('keywords', []))
-                        if web_texts and len(web_texts) > 0:
-                            all_texts.extend(web_texts)
-                            total_sources.add(url)
-                            print(f"✅ Coletados {len(web_texts)} textos de {url}")
-                        else:
-                            print(f"⚠️ Nenhum texto válido coletado de {url}")
-                    except Exception as e:
-                        print(f"❌ Erro ao coletar de {url}: {e}")
+            print("\n=== INICIANDO COLETA DE DADOS ===")
+            # Shards da coleta: um job interrompido e retomado continua do que já foi gravado
+            if not config.get('collection_shards'):
+                config['collection_shards'] = os.path.join(
+                    'training_data', 'collection_shards', datetime.now().strftime('%Y%m%d_%H%M%S_%f'))
             
-            # Coleta email
-            if config.get('email_config'):
-                try:
-                    email_texts = self.data_collector.collect_email_data(config['email_config'])
-                    if email_texts and len(email_texts) > 0:
-                        all_texts.extend(email_texts)
-                        total_sources.add(f"Email: {config['email_config']['username']}")
-                        print(f"✅ Coletados {len(email_texts)} textos de email")
-                    else:
-                        print("⚠️ Nenhum texto de email coletado")
-                except Exception as e:
-                    print(f"❌ Erro ao coletar emails: {e}")
+            # Checkpoints IMAP só avançam depois que os textos chegam ao corpus
+            email_checkpoints = {}
+            collection = self._run_collection_pipeline(config, email_checkpoints)
+            total_sources = collection['sources']
+            total_texts = collection['texts']
             
             print(f"\n📊 RESUMO DA COLETA:")
-            print(f"   - Total de textos brutos: {len(all_texts)}")
+            print(f"   - Total de textos brutos: {collection['counts']['raw']}")
+            print(f"   - Textos válidos (≥25 chars): {collection['counts']['valid']}")
+            print(f"   - Repetidos ou já presentes no corpus: {collection['counts']['repeated']}")
+            print(f"   - Textos únicos gravados: {total_texts}")
             print(f"   - Total de fontes: {len(total_sources)}")
             
             # Verificar se há dados válidos
-            if not all_texts or len(all_texts) == 0:
+            if total_texts == 0 and collection['counts']['raw'] == 0:
                 print("❌ Nenhum texto coletado - abortando treinamento")
+                shutil.rmtree(config['collection_shards'], ignore_errors=True)
                 self.model_trainer.update_status('error', 0, 'Nenhum dado foi coletado para treinamento. Verifique as fontes configuradas.')
                 return
             
-            # Processar e validar textos
-            valid_texts = self._process_texts(all_texts)
-            
-            if len(valid_texts) < 5:
+            if total_texts < 5:
                 print("❌ Poucos textos únicos - abortando")
-                self.model_trainer.update_status('error', 0, f'Dados insuficientes: apenas {len(valid_texts)} textos únicos válidos.')
+                shutil.rmtree(config['collection_shards'], ignore_errors=True)
+                self.model_trainer.update_status('error', 0, f'Dados insuficientes: apenas {total_texts} textos únicos válidos.')
                 return
             
-            print(f"\n✅ DADOS VÁLIDOS PARA TREINAMENTO: {len(valid_texts)} textos")
+            print(f"\n✅ DADOS VÁLIDOS PARA TREINAMENTO: {total_texts} textos")
             
             # Salvar dados
-            config['total_texts'] = len(valid_texts)
+            config['total_texts'] = total_texts
             config['total_sources'] = len(total_sources)
             config_filename = self.config_manager.save_training_config(config)
             
-            data_filename = self.data_collector.save_collected_data(valid_texts, list(total_sources), config)
+            data_filename = self.data_collector.save_collected_shards(config['collection_shards'],
+                                                                      sorted(total_sources), config)
             
             if not data_filename:
                 print("❌ Erro ao salvar dados coletados")
                 self.model_trainer.update_status('error', 0, 'Erro ao salvar dados coletados.')
                 return
             
+            self.data_collector.commit_email_checkpoints(email_checkpoints)
+            # Corte depois da gravação: o próprio arquivo de dados fica antes dele
+            config['data_cutoff'] = datetime.now().isoformat()
             print(f"\n💾 Dados salvos em: {data_filename}")
             print(f"⚙️ Configuração salva em: {config_filename}")
+            config['data_file'] = data_filename
             
             print("\n🚀 INICIANDO TREINAMENTO DO MODELO...")
             self.model_trainer.train_model(config)
@@ -162,8 +185,143 @@ class TrainingService:
             traceback.print_exc()
             self.model_trainer.update_status('error', 0, f'Erro durante o processo: {str(e)}')
     
-    def _process_texts(self, all_texts):
-        """Processa e filtra textos válidos"""
+    def _run_collection_pipeline(self, config, email_checkpoints=None):
+        """
+        Coleta em estágios concorrentes ligados por filas limitadas:
+        fetch (downloads/IMAP, com extração no pool de parsing) → extract
+        (limpeza dos textos de cada página) → filter (tamanho mínimo e textos
+        já presentes no corpus) → dedup (MinHash incremental) → write (shards
+        JSONL gravados progressivamente em config['collection_shards']).
+        Os checkpoints IMAP da coleta ficam reservados em email_checkpoints.
+        """
+        shard_dir = config['collection_shards']
+        # Os produtores rodam em threads do pipeline: o job é capturado aqui, na thread do job
+        job_id = self.job_scheduler.current_job_id()
+        writer = ShardWriter(shard_dir, shard_size=config.get('shard_size', 1000))
+        dedup = self.near_duplicate_detector.session(config.get('dedup_threshold'))
+        total_sources = set()
+        counts = {'raw': 0, 'valid': 0, 'repeated': 0, 'unique': 0, 'written': 0}
+        # Atualizado pelas threads de email e pelo pipeline: chaves fixas desde o início (cópias seguras)
+        metrics = {'collection_pipeline': {}, 'email_collection': {}, 'email_decoding': {}}
+        
+        # Job retomado: textos gravados antes da interrupção participam da deduplicação
+        resumed = 0
+        for record in read_shards(shard_dir):
+            dedup.add(record['text'])
+            source = record.get('source') or 'unknown'
+            total_sources.update(source.split('; ') if source.startswith('Email: ') else [source])
+            resumed += 1
+        if resumed:
+            print(f"♻️ Retomando coleta: {resumed} textos já gravados em {shard_dir}")
+        
+        producers = {}
+        if config.get('web_sources'):
+            def collect_web(emit):
+                def on_texts(url, web_texts):
+                    if web_texts:
+                        total_sources.add(url)
+                        print(f"✅ Coletados {len(web_texts)} textos de {url}")
+                        emit((url, web_texts))
+                    else:
+                        print(f"⚠️ Nenhum texto válido coletado de {url}")
+                
+                # Coleta web (downloads e parsing concorrentes; cada página segue no pipeline ao terminar)
+                self.data_collector.collect_web_sources(
+                    config['web_sources'], config.get('keywords', []), config.get('fetch_config'),
+                    config.get('crawl_config'), on_texts=on_texts
+                )
+            producers['web'] = collect_web
+        
+        if config.get('email_config'):
+            def collect_email(emit):
+                def on_progress(snapshot):
+                    # Pipeline interrompido (erro ou cancelamento): a sincronização IMAP para no próximo lote
+                    if pipeline.stopped:
+                        raise PipelineStopped('Pipeline interrompido')
+                    self._report_email_progress(snapshot, metrics, job_id)
+                
+                email_texts = self.data_collector.collect_email_data(config['email_config'], on_progress,
+                                                                     email_checkpoints, keep_in_memory=False)
+                if not email_texts:
+                    print("⚠️ Nenhum texto de email coletado")
+                    return
+                email_sources = self._email_sources(config['email_config'])
+                total_sources.update(email_sources)
+                print(f"✅ Coletados {len(email_texts)} textos de email")
+                # Threads de email precisam da coleção inteira: os textos entram no pipeline em lotes
+                for start in range(0, len(email_texts), 100):
+                    emit(('; '.join(sorted(email_sources)), email_texts[start:start + 100]))
+            producers['email'] = collect_email
+        
+        def extract(item):
+            source, texts = item
+            cleaned = [text.strip() for text in texts if isinstance(text, str)]
+            counts['raw'] += len(cleaned)
+            return [(source, cleaned)]
+        
+        def filter_texts(item):
+            source, texts = item
+            valid = [text for text in texts if len(text) >= 25]  # Mínimo 25 caracteres
+            counts['valid'] += len(valid)
+            new_texts, repeated = self.data_collector.content_index.filter_new(valid)
+            counts['repeated'] += repeated
+            return [(source, new_texts)] if new_texts else None
+        
+        def deduplicate(item):
+            source, texts = item
+            unique = [text for text in texts if dedup.add(text)]
+            counts['unique'] += len(unique)
+            return [(source, unique)] if unique else None
+        
+        def write(item):
+            source, texts = item
+            counts['written'] += writer.write({'text': text, 'source': source} for text in texts)
+        
+        pipeline = StreamingPipeline(queue_size=config.get('pipeline_queue_size', 64))
+        pipeline.add_stage('extract', extract).add_stage('filter', filter_texts) \
+            .add_stage('dedup', deduplicate).add_stage('write', write)
+        
+        def report(stats):
+            metrics['collection_pipeline'] = {'stages': stats, 'texts': dict(counts)}
+            self.model_trainer.update_status('preparing', 0,
+                                             f"Coletando dados - {resumed + counts['written']} textos gravados",
+                                             metrics=dict(metrics))
+        
+        try:
+            stats = pipeline.run(producers, report, config.get('pipeline_progress_interval', 2.0))
+        finally:
+            writer.close()
+            dedup.close()
+        
+        dedup_stats = dedup.stats()
+        print(f"🧹 Deduplicação MinHash (Jaccard ≥ {dedup_stats['threshold']}): {dedup_stats['exact_duplicates']} exatas, "
+              f"{dedup_stats['near_duplicates']} quase-duplicatas removidas")
+        print(f"🚰 Pipeline de coleta: {pipeline.format_stats(stats)}")
+        
+        return {'texts': resumed + counts['written'], 'sources': total_sources, 'counts': counts, 'stats': stats}
+    
+    def _report_email_progress(self, snapshot, metrics=None, job_id=None):
+        """
+        Progresso da coleta de emails por conta no status do treinamento.
+        Roda nas threads IMAP: job_id identifica o job (status e cancelamento).
+        """
+        accounts = '; '.join(
+            f"{account}: {counts['messages_done']}/{counts['messages_total']} emails, "
+            f"{counts['folders_done']}/{counts['folders_total']} pastas"
+            for account, counts in snapshot.items()
+        )
+        # metrics: telemetria da coleta em andamento (ex.: contadores do pipeline)
+        metrics = metrics if metrics is not None else {}
+        metrics['email_collection'] = snapshot
+        metrics['email_decoding'] = self.data_collector.charset_decoder.metrics()
+        self.model_trainer.update_status('preparing', 0, f'Coletando emails - {accounts}', metrics=dict(metrics),
+                                         job_id=job_id)
+    
+    def _email_sources(self, email_config):
+        return {f"Email: {account['username']}" for account in self.data_collector.email_accounts(email_config)}
+    
+    def _process_texts(self, all_texts, dedup_threshold=None):
+        """Processa e filtra textos válidos (sem duplicatas nem quase-duplicatas)"""
         # Remover textos vazios ou muito curtos
         valid_texts = []
         for text in all_texts:
@@ -174,9 +332,9 @@ class TrainingService:
         
         print(f"   - Textos válidos (≥25 chars): {len(valid_texts)}")
         
-        # Remover duplicatas
-        unique_texts = list(set(valid_texts))
-        print(f"   - Textos únicos: {len(unique_texts)}")
+        # Remover duplicatas exatas e quase-duplicatas (MinHash/LSH)
+        unique_texts, dedup_stats = self.near_duplicate_detector.deduplicate(valid_texts, dedup_threshold)
+        print(f"   - Textos únicos: {len(unique_texts)} ({dedup_stats['near_duplicates']} quase-duplicatas removidas)")
         
         # Mostrar amostra dos dados
         if unique_texts:
@@ -186,8 +344,9 @@ class TrainingService:
         
         return unique_texts
     
-    def retrain_model(self, previous_config_file, use_chat_data=True, merge_strategy='append'):
-        """Retreina modelo usando configurações anteriores"""
+    def retrain_model(self, previous_config_file, use_chat_data=True, merge_strategy='append',
+                      continued_training=False, replay_ratio=0.0):
+        """Retreina modelo usando configurações anteriores (opcionalmente a partir do último modelo)"""
         try:
             # Carregar configuração anterior
             config_path = f'training_data/{previous_config_file}'
@@ -202,19 +361,81 @@ class TrainingService:
             # Preparar nova configuração
             new_config = self._prepare_retrain_config(previous_config, use_chat_data, merge_strategy)
             
-            # Coletar dados para retreinamento
-            collected_data = self._collect_retrain_data(new_config)
+            # Treinamento contínuo: inicializar do último modelo e usar só dados novos
+            if continued_training:
+                latest_model = self.model_registry.get_latest_model()
+                if latest_model:
+                    new_config.update({
+                        'continued_training': True,
+                        'init_model_path': latest_model['path'],
+                        'continued_from_cutoff': latest_model['data_cutoff'],
+                        # Arquivos com que o último modelo já treinou (vão para o replay, nunca como dados novos)
+                        'continued_from_files': latest_model.get('data_files') or [],
+                        'replay_ratio': max(0.0, float(replay_ratio or 0.0))
+                    })
+                    print(f"Treinamento contínuo a partir de {latest_model['name']} "
+                          f"(dados após {latest_model['data_cutoff']})")
+                else:
+                    print("Nenhum modelo treinado registrado - retreinamento completo a partir do modelo base")
             
-            if collected_data['status'] == 'error':
-                return collected_data
+            # Coleta e treino rodam no job: a requisição só enfileira
+            job = self.job_scheduler.submit(
+                'collect_and_retrain',
+                {'config': new_config, 'previous_config_file': previous_config_file,
+                 'use_chat_data': use_chat_data, 'merge_strategy': merge_strategy},
+                priority=new_config.get('priority', 0),
+                description=f'Retreinamento a partir de {previous_config_file}'
+            )
             
-            # Salvar e iniciar treinamento
-            return self._save_and_start_retrain(new_config, collected_data['data'], previous_config_file, use_chat_data, merge_strategy)
+            return {
+                'status': 'success',
+                'message': 'Retreinamento adicionado à fila com base na configuração anterior',
+                'job_id': job['id'],
+                'queue_position': self.job_scheduler.get_queue_position(job['id']),
+                'stats': {
+                    'previous_config': previous_config_file,
+                    'merge_strategy': merge_strategy,
+                    'used_chat_data': use_chat_data,
+                    'continued_from': new_config.get('init_model_path')
+                }
+            }
             
         except Exception as e:
             print(f"Erro no retreinamento: {e}")
             return {'error': f'Erro no retreinamento: {str(e)}', 'status': 'error'}
     
+    def _collect_and_retrain(self, config, previous_config_file, use_chat_data=True, merge_strategy='append'):
+        """Coleta dados de retreinamento e treina modelo (processo interno)"""
+        try:
+            # Job retomado após interrupção: dados já coletados, seguir para o treino
+            data_files = config.get('collected_data') or []
+            if data_files and all(os.path.exists(path) for path in data_files):
+                print(f"\n♻️ Retomando job: dados já coletados em {', '.join(data_files)}")
+                self._run_training_process(config, config.get('config_file'))
+                return
+            
+            print("\n=== COLETANDO DADOS PARA RETREINAMENTO ===")
+            # Checkpoints IMAP só avançam depois que os dados são gravados
+            email_checkpoints = {}
+            collected_data = self._collect_retrain_data(config, email_checkpoints)
+            
+            if collected_data['status'] == 'error':
+                print(f"❌ {collected_data['error']}")
+                self.model_trainer.update_status('error', 0, collected_data['error'])
+                return
+            
+            config_filename = self._save_retrain_data(config, collected_data['data'], previous_config_file,
+                                                      use_chat_data, merge_strategy)
+            self.data_collector.commit_email_checkpoints(email_checkpoints)
+            
+            self._run_training_process(config, config_filename)
+            
+        except Exception as e:
+            print(f"\n❌ ERRO NO RETREINAMENTO: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            self.model_trainer.update_status('error', 0, f'Erro no retreinamento: {str(e)}')
+    
     def _prepare_retrain_config(self, previous_config, use_chat_data, merge_strategy):
         """Prepara configuração para retreinamento"""
         return {
@@ -223,6 +444,14 @@ class TrainingService:
             'batch_size': previous_config.get('batch_size', 1),
             'max_length': previous_config.get('max_length', 256),
             'learning_rate': previous_config.get('learning_rate', 5e-5),
+            'training_mode': previous_config.get('training_mode', 'full'),
+            'lora_config': previous_config.get('lora_config', {}),
+            'distributed_config': previous_config.get('distributed_config'),
+            'memory_config': previous_config.get('memory_config'),
+            'fetch_config': previous_config.get('fetch_config'),
+            'crawl_config': previous_config.get('crawl_config'),
+            'memory_budget_mb': previous_config.get('memory_budget_mb'),
+            'eval_config': previous_config.get('eval_config'),
             'web_sources': previous_config.get('web_sources', []),
             'keywords': previous_config.get('keywords', []),
             'email_config': previous_config.get('email_config'),
@@ -232,35 +461,64 @@ class TrainingService:
             'use_chat_data': use_chat_data
         }
     
-    def _collect_retrain_data(self, config):
+    def _collect_retrain_data(self, config, email_checkpoints=None):
         """Coleta dados para retreinamento"""
         all_texts = []
+        corpus_texts = []
         total_sources = set()
         
-        # 1. Dados dos treinamentos anteriores
-        if config['merge_strategy'] in ['append', 'merge']:
-            self._load_previous_training_data(all_texts, total_sources)
+        # No treinamento contínuo, dados anteriores ao corte do último modelo vão para o replay
+        since = config.get('continued_from_cutoff') if config.get('continued_training') else None
+        trained_files = config.get('continued_from_files') if since else None
+        older_texts = [] if since else None
+        
+        # 1. Dados dos treinamentos anteriores (corpus já único pelo índice de hashes)
+        use_corpus = since or config['merge_strategy'] in ['append', 'merge']
+        if use_corpus:
+            self._load_previous_training_data(corpus_texts, total_sources, since, older_texts, trained_files)
         
         # 2. Dados do chat
         if config['use_chat_data']:
-            self._load_chat_data(all_texts, total_sources)
+            self._load_chat_data(all_texts, total_sources, since, older_texts)
+        
+        # Corte depois de ler corpus e chat: tudo o que foi lido fica antes dele
+        config['data_cutoff'] = datetime.now().isoformat()
         
         # 3. Novos dados das fontes
         if config['web_sources'] or config['email_config']:
-            self._collect_new_data(config, all_texts, total_sources)
+            self._collect_new_data(config, all_texts, total_sources, email_checkpoints)
         
         # Validar dados coletados
-        if len(all_texts) == 0:
+        if len(all_texts) == 0 and len(corpus_texts) == 0:
             return {
                 'status': 'error',
-                'error': 'Nenhum dado foi coletado para o retreinamento',
+                'error': 'Nenhum dado novo foi coletado para o retreinamento' if since else 'Nenhum dado foi coletado para o retreinamento',
                 'details': 'Verifique as fontes de dados ou configurações anteriores'
             }
         
-        # Processar textos
-        valid_texts = self._process_texts(all_texts)
+        new_texts_count = len(corpus_texts) + len(all_texts)
+        original_count = new_texts_count
+        
+        # Chat e novas coletas: descartar o que já está no corpus antes de deduplicar
+        fresh_texts = all_texts
+        if use_corpus:
+            fresh_texts, corpus_duplicates = self.data_collector.content_index.filter_new(all_texts)
+            if corpus_duplicates:
+                print(f"Descartados {corpus_duplicates} textos já presentes no corpus")
+        
+        # 4. Replay: amostra de dados antigos para evitar esquecimento
+        replay_count = 0
+        if since and older_texts and config.get('replay_ratio', 0) > 0:
+            replay_count = min(len(older_texts), int(round(new_texts_count * config['replay_ratio'])))
+            fresh_texts.extend(random.sample(older_texts, replay_count))
+            original_count += replay_count
+            print(f"Replay: {replay_count} textos antigos amostrados de {len(older_texts)}")
         
-        if len(valid_texts) < 10:
+        # Processar textos: apenas os de fora do corpus passam pela deduplicação
+        valid_texts = corpus_texts + self._process_texts(fresh_texts, config.get('dedup_threshold'))
+        
+        min_texts = 1 if since else 10
+        if len(valid_texts) < min_texts:
             return {
                 'status': 'error',
                 'error': f'Dados insuficientes para retreinamento. Encontrados apenas {len(valid_texts)} textos únicos.',
@@ -273,15 +531,35 @@ class TrainingService:
                 'valid_texts': valid_texts,
                 'total_sources': total_sources,
                 'stats': {
-                    'original_count': len(all_texts),
+                    'original_count': original_count,
                     'valid_count': len(valid_texts),
-                    'sources_count': len(total_sources)
+                    'sources_count': len(total_sources),
+                    'new_texts_count': new_texts_count,
+                    'replay_texts_count': replay_count
                 }
             }
         }
     
-    def _load_previous_training_data(self, all_texts, total_sources):
-        """Carrega dados de treinamentos anteriores"""
+    def _is_before_cutoff(self, timestamp, since):
+        """Indica se um timestamp ISO é anterior (ou igual) ao corte informado"""
+        if not since:
+            return False
+        if not timestamp:
+            return True
+        
+        try:
+            return datetime.fromisoformat(timestamp) <= datetime.fromisoformat(since)
+        except ValueError:
+            return timestamp <= since
+    
+    def _load_previous_training_data(self, all_texts, total_sources, since=None, older_texts=None,
+                                     trained_files=None):
+        """
+        Carrega dados de treinamentos anteriores (com corte, dados antigos vão para older_texts).
+        Arquivos em trained_files (data_files do último modelo) também são antigos, qualquer que
+        seja o timestamp gravado neles.
+        """
+        trained_files = {os.path.normpath(path) for path in trained_files or []}
         training_data_dir = 'training_data'
         if os.path.exists(training_data_dir):
             for filename in os.listdir(training_data_dir):
@@ -290,6 +568,12 @@ class TrainingService:
                     try:
                         with open(file_path, 'r', encoding='utf-8') as f:
                             file_data = json.load(f)
+                            if os.path.normpath(file_path) in trained_files or \
+                                    self._is_before_cutoff(file_data.get('timestamp'), since):
+                                if older_texts is not None:
+                                    older_texts.extend(file_data.get('texts', []))
+                                continue
+                            
                             if 'texts' in file_data:
                                 all_texts.extend(file_data['texts'])
                                 if 'sources' in file_data:
@@ -298,8 +582,8 @@ class TrainingService:
                     except Exception as e:
                         print(f"Erro ao carregar {filename}: {e}")
     
-    def _load_chat_data(self, all_texts, total_sources):
-        """Carrega dados de conversas do chat"""
+    def _load_chat_data(self, all_texts, total_sources, since=None, older_texts=None):
+        """Carrega dados de conversas do chat (com corte, conversas antigas vão para older_texts)"""
         chat_data_dir = 'chat_training_data'
         if os.path.exists(chat_data_dir):
             chat_texts = []
@@ -309,10 +593,17 @@ class TrainingService:
                     try:
                         with open(file_path, 'r', encoding='utf-8') as f:
                             chat_data = json.load(f)
+                            is_old = self._is_before_cutoff(chat_data.get('end_time'), since)
+                            if is_old and older_texts is None:
+                                continue
+                            
                             if 'training_data' in chat_data:
                                 for item in chat_data['training_data']:
                                     if 'input' in item and 'output' in item:
                                         chat_text = f"Usuário: {item['input']}\nAssistente: {item['output']}"
+                                        if is_old:
+                                            older_texts.append(chat_text)
+                                            continue
                                         chat_texts.append(chat_text)
                                         total_sources.add(f"Chat: {chat_data['conversation_id']}")
                     except Exception as e:
@@ -321,35 +612,41 @@ class TrainingService:
             all_texts.extend(chat_texts)
             print(f"Adicionados {len(chat_texts)} textos de conversas do chat")
     
-    def _collect_new_data(self, config, all_texts, total_sources):
+    def _collect_new_data(self, config, all_texts, total_sources, email_checkpoints=None):
         """Coleta novos dados das fontes configuradas"""
         print("Coletando novos dados...")
         
-        # Coleta web
+        # Coleta web (downloads e parsing concorrentes)
         if config['web_sources']:
-            for url in config['web_sources']:
-                try:
-                    web_texts = self.data_collector.collect_web_data(url, config['keywords'])
+            try:
+                web_results = self.data_collector.collect_web_sources(
+                    config['web_sources'], config['keywords'], config.get('fetch_config'),
+                    config.get('crawl_config')
+                )
+                for url, web_texts in web_results.items():
                     if web_texts:
                         all_texts.extend(web_texts)
                         total_sources.add(url)
                         print(f"Coletados {len(web_texts)} textos de {url}")
-                except Exception as e:
-                    print(f"Erro ao coletar de {url}: {e}")
+            except Exception as e:
+                print(f"Erro na coleta web: {e}")
         
         # Coleta email
         if config['email_config']:
             try:
-                email_texts = self.data_collector.collect_email_data(config['email_config'])
+                job_id = self.job_scheduler.current_job_id()
+                email_texts = self.data_collector.collect_email_data(
+                    config['email_config'], lambda snapshot: self._report_email_progress(snapshot, job_id=job_id),
+                    email_checkpoints)
                 if email_texts:
                     all_texts.extend(email_texts)
-                    total_sources.add(f"Email: {config['email_config']['username']}")
+                    total_sources.update(self._email_sources(config['email_config']))
                     print(f"Coletados {len(email_texts)} textos de email")
             except Exception as e:
                 print(f"Erro ao coletar emails: {e}")
     
-    def _save_and_start_retrain(self, new_config, data, previous_config_file, use_chat_data, merge_strategy):
-        """Salva dados e inicia retreinamento"""
+    def _save_retrain_data(self, new_config, data, previous_config_file, use_chat_data, merge_strategy):
+        """Salva dados e configuração do retreinamento e retorna o arquivo de configuração"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         valid_texts = data['valid_texts']
         total_sources = data['total_sources']
@@ -367,7 +664,10 @@ class TrainingService:
                 'merge_strategy': merge_strategy,
                 'used_chat_data': use_chat_data,
                 'original_texts_count': data['stats']['original_count'],
-                'unique_texts_count': len(valid_texts)
+                'unique_texts_count': len(valid_texts),
+                'continued_from': new_config.get('init_model_path'),
+                'new_texts_count': data['stats']['new_texts_count'],
+                'replay_texts_count': data['stats']['replay_texts_count']
             }
         }
         
@@ -385,29 +685,10 @@ class TrainingService:
         with open(config_filename, 'w', encoding='utf-8') as f:
             json.dump(new_config, f, ensure_ascii=False, indent=2)
         
+        new_config['config_file'] = config_filename
         print(f"Configuração salva em: {config_filename}")
         
-        # Iniciar treinamento
-        training_thread = threading.Thread(
-            target=self._run_training_process,
-            args=(new_config, config_filename),
-            daemon=True
-        )
-        training_thread.start()
-        
-        return {
-            'status': 'success',
-            'message': 'Retreinamento iniciado com base na configuração anterior',
-            'config_file': config_filename,
-            'data_file': data_filename,
-            'stats': {
-                'total_texts': len(valid_texts),
-                'total_sources': len(total_sources),
-                'previous_config': previous_config_file,
-                'merge_strategy': merge_strategy,
-                'used_chat_data': use_chat_data
-            }
-        }
+        return config_filename
     
     def _run_training_process(self, config, config_filename):
         """Executa processo de treinamento"""
@@ -17,6 +17,7 @@ if __name__ == '__main__':
         print(f"  - ConfigManager: {services['config_manager'].__class__.__name__}")
         print(f"  - DataCollector: {services['data_collector'].__class__.__name__}")
         print(f"  - ModelTrainer: {services['model_trainer'].__class__.__name__}")
+        print(f"  - TrainingJobScheduler: {services['job_scheduler'].__class__.__name__}")
         print(f"  - TrainingService: {services['training_service'].__class__.__name__}")
         print(f"  - ChatService: {services['chat_service'].__class__.__name__}")
         print(f"  - DataService: {services['data_service'].__class__.__name__}")
@@ -0,0 +1,230 @@
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# Elementos que delimitam blocos de texto
+BLOCK_TAGS = {
+    'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'dt', 'dd', 'td', 'th', 'tr', 'blockquote',
+    'pre', 'figcaption', 'caption', 'article', 'section', 'main', 'div', 'ul', 'ol', 'dl',
+    'table', 'tbody', 'thead', 'body', 'form', 'fieldset', 'address', 'details', 'summary',
+}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+# Conteúdo ignorado por completo (inclui descendentes)
+SKIP_TAGS = {'script', 'style', 'nav', 'header', 'footer', 'aside', 'noscript', 'template', 'svg', 'iframe'}
+# Elementos sem tag de fechamento
+VOID_TAGS = {'br', 'img', 'input', 'meta', 'link', 'hr', 'area', 'base', 'col', 'embed', 'source', 'track', 'wbr'}
+# Tags que fecham implicitamente um irmão aberto do mesmo tipo (<p>a<p>b, <li>a<li>b)
+IMPLIED_CLOSE = {'p': {'p'}, 'li': {'li'}, 'dt': {'dt', 'dd'}, 'dd': {'dt', 'dd'},
+                 'tr': {'tr'}, 'td': {'td', 'th'}, 'th': {'td', 'th'}}
+MAIN_CONTENT_TAGS = {'main', 'article'}
+
+_CHARSET_RE = re.compile(rb'(?:<meta[^>]+charset=|<\?xml[^>]+encoding=)["\']?([\w-]+)', re.IGNORECASE)
+# Declaração <?xml ...?> de páginas XHTML: o lxml recusa texto (str) que declara encoding
+_XML_DECLARATION_RE = re.compile(r'^\ufeff?\s*<\?xml[^>]*\?>')
+_CLASS_CONTENT_RE = re.compile(r'content', re.IGNORECASE)
+
+class _BlockBuilder:
+    """
+    Monta blocos de texto a partir de eventos start/end/data em uma única passada.
+
+    O texto pertence sempre ao bloco aberto mais interno; ao abrir um bloco
+    aninhado, o texto acumulado do bloco pai é emitido antes. Assim cada
+    trecho de texto aparece exatamente uma vez, na ordem do documento.
+    Segue a interface de "parser target" do lxml (start, end, data, close).
+    """
+
+    def __init__(self, collect_links=False):
+        self.blocks = []
+        self.collect_links = collect_links
+        self.links = []
+        self.base_href = None
+        # (tag, bloco mais interno, caminho de blocos, dentro do conteúdo principal)
+        self.stack = []
+        self.pending = []
+        self.skip_depth = 0
+        self.last_heading = None
+
+    def start(self, tag, attrs):
+        tag = tag.lower() if isinstance(tag, str) else ''
+        if self.collect_links and tag in ('a', 'base'):
+            # Links de menus (nav) também servem para o crawler, mesmo sem texto extraído
+            self._collect_link(tag, attrs)
+        if self.skip_depth:
+            if tag in SKIP_TAGS:
+                self.skip_depth += 1
+            return
+        if tag in SKIP_TAGS:
+            self.skip_depth = 1
+            return
+        if tag in VOID_TAGS:
+            if tag in ('br', 'hr'):
+                self.pending.append(' ')
+            return
+
+        is_block = tag in BLOCK_TAGS
+        if is_block:
+            closes = IMPLIED_CLOSE.get(tag)
+            if closes and self.stack and self.stack[-1][0] in closes:
+                self.end(self.stack[-1][0])
+            if self.pending:
+                self._flush()
+
+        if self.stack:
+            _, block_tag, path, in_main = self.stack[-1]
+        else:
+            block_tag, path, in_main = 'body', '', False
+
+        if is_block:
+            block_tag = tag
+            path = f'{path}>{tag}' if path else tag
+        if not in_main:
+            in_main = tag in MAIN_CONTENT_TAGS or (tag in ('div', 'section') and
+                                                   bool(_CLASS_CONTENT_RE.search(attrs.get('class') or '')))
+        self.stack.append((tag, block_tag, path, in_main))
+
+    def end(self, tag):
+        tag = tag.lower() if isinstance(tag, str) else ''
+        if self.skip_depth:
+            if tag in SKIP_TAGS:
+                self.skip_depth -= 1
+            return
+        if tag in VOID_TAGS:
+            return
+
+        # Fechar até a tag correspondente (HTML malformado deixa tags abertas)
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == tag:
+                break
+        else:
+            return
+
+        while len(self.stack) > index:
+            open_tag, block_tag = self.stack[-1][:2]
+            if open_tag == block_tag and self.pending:
+                self._flush()
+            self.stack.pop()
+
+    def data(self, text):
+        if not self.skip_depth:
+            self.pending.append(text)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        while self.stack:
+            self.end(self.stack[-1][0])
+        self._flush()
+        return self.blocks
+
+    def _collect_link(self, tag, attrs):
+        href = (attrs.get('href') or '').strip()
+        if not href:
+            return
+        if tag == 'base':
+            self.base_href = self.base_href or href
+        elif 'nofollow' not in (attrs.get('rel') or '').lower():
+            self.links.append(href)
+
+    def _flush(self):
+        if not self.pending:
+            return
+        text = ' '.join(''.join(self.pending).split())
+        self.pending = []
+        if not text:
+            return
+
+        _, block_tag, path, in_main = self.stack[-1] if self.stack else ('', 'body', '', False)
+        is_heading = block_tag in HEADING_TAGS
+        if is_heading:
+            self.last_heading = text
+
+        self.blocks.append({
+            'text': text,
+            'tag': block_tag,
+            'path': path,
+            'heading': None if is_heading else self.last_heading,
+            'in_main_content': in_main,
+        })
+
+class _StdlibDriver(HTMLParser):
+    """Alimenta o _BlockBuilder com o parser da biblioteca padrão (sem lxml)"""
+
+    def __init__(self, builder):
+        super().__init__(convert_charrefs=True)
+        self.builder = builder
+
+    def handle_starttag(self, tag, attrs):
+        self.builder.start(tag, dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.builder.start(tag, dict(attrs))
+        if tag not in VOID_TAGS:
+            self.builder.end(tag)
+
+    def handle_endtag(self, tag):
+        self.builder.end(tag)
+
+    def handle_data(self, data):
+        self.builder.data(data)
+
+def decode_html(content):
+    """Converte o corpo da resposta em texto (charset do <meta>, UTF-8 ou cp1252)"""
+    if isinstance(content, str):
+        return content
+
+    match = _CHARSET_RE.search(content[:4096])
+    encodings = ([match.group(1).decode('ascii', 'ignore')] if match else []) + ['utf-8', 'cp1252']
+    for encoding in encodings:
+        try:
+            return content.decode(encoding)
+        except (LookupError, UnicodeDecodeError):
+            continue
+    return content.decode('utf-8', errors='replace')
+
+def extract_blocks(content, engine=None):
+    """
+    Extrai os blocos de texto do HTML em uma única passada.
+
+    Cada bloco: {'text', 'tag', 'path', 'heading', 'in_main_content'}.
+    engine: 'lxml', 'stdlib' ou None (lxml quando instalado).
+    """
+    return _parse(content, engine, collect_links=False).blocks
+
+def extract_page(content, engine=None):
+    """
+    Blocos de texto e links da página na mesma passada.
+
+    Retorna (blocos, links); links são os href dos <a> (sem rel="nofollow"),
+    já resolvidos contra o <base href> quando a página declara um.
+    """
+    builder = _parse(content, engine, collect_links=True)
+    links = builder.links
+    if builder.base_href:
+        links = [urljoin(builder.base_href, href) for href in links]
+    return builder.blocks, links
+
+def _parse(content, engine, collect_links):
+    html = decode_html(content)
+    builder = _BlockBuilder(collect_links)
+
+    if engine is None:
+        engine = 'lxml' if etree is not None else 'stdlib'
+
+    if engine == 'lxml':
+        # Documento vazio gera erro no lxml
+        html = _XML_DECLARATION_RE.sub('', html, count=1)
+        if html.strip():
+            etree.fromstring(html, etree.HTMLParser(target=builder, remove_comments=True))
+        return builder
+
+    driver = _StdlibDriver(builder)
+    driver.feed(html)
+    driver.close()
+    builder.close()
+    return builder
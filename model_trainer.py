@@ -1,11 +1,19 @@
 from transformers import (
     AutoTokenizer, AutoModelForCausalLM, 
-    TrainingArguments, Trainer, DataCollatorForLanguageModeling
+    TrainingArguments, Trainer, DataCollatorForLanguageModeling,
+    TrainerCallback, EarlyStoppingCallback
 )
 from datasets import Dataset
 import torch
 import json
+import math
 import os
+import queue
+import re
+import socket
+import sys
+import threading
+import time
 import warnings
 from datetime import datetime
 
@@ -13,22 +21,344 @@ from datetime import datetime
 warnings.filterwarnings("ignore", message=".*pin_memory.*")
 warnings.filterwarnings("ignore", message=".*loss_type.*")
 
+def get_peak_memory_mb():
+    """Retorna o pico de memória residente (RSS) do processo em MB"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux informa em KB, macOS em bytes
+        return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+    except ImportError:
+        pass
+    
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+def get_current_memory_mb():
+    """Retorna a memória residente (RSS) atual do processo em MB (ou None se indisponível)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return round(resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+class MemorySampler:
+    """
+    Pico de RSS durante um trecho de código, amostrado por uma thread.
+
+    Ao contrário de ru_maxrss (pico da vida inteira do processo), mede só o
+    trecho: em um servidor de longa duração, jobs e modelos anteriores não
+    contaminam a medição.
+    """
+    
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def __enter__(self):
+        self.peak = get_current_memory_mb()
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        current = get_current_memory_mb()
+        if current is not None and self.peak is not None:
+            self.peak = max(self.peak, current)
+    
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            current = get_current_memory_mb()
+            if current is not None:
+                self.peak = max(self.peak, current)
+
+def cpu_supports_bf16():
+    """Indica se a CPU executa bfloat16 nativamente (AVX512-BF16/AMX via oneDNN)"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+def loss_to_perplexity(loss):
+    """Perplexidade a partir da loss média (entropia cruzada em nats)"""
+    if loss is None:
+        return None
+    try:
+        return round(math.exp(loss), 3)
+    except OverflowError:
+        return float('inf')
+
+def get_total_memory_mb():
+    """Retorna a memória física total da máquina em MB (ou None se indisponível)"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        pass
+    
+    try:
+        import psutil
+        return psutil.virtual_memory().total / (1024 * 1024)
+    except ImportError:
+        return None
+
+def mean_real_tokens(dataset, sample_size=10000):
+    """Média de tokens reais (sem padding) por amostra, pela attention_mask de até sample_size amostras"""
+    if len(dataset) == 0:
+        return 0
+    sample = dataset.select(range(min(len(dataset), sample_size)))
+    if 'attention_mask' not in sample.column_names:
+        return len(sample[0]['input_ids'])
+    masks = sample['attention_mask']
+    return sum(sum(mask) for mask in masks) / len(masks)
+
+class TrainingTelemetryCallback(TrainerCallback):
+    """Publica telemetria do treinamento (passo, loss, throughput, ETA e memória) no status"""
+    
+    def __init__(self, model_trainer, tokens_per_sample, progress_range=(40, 90), min_interval=2.0,
+                 memory_sampler=None):
+        self.model_trainer = model_trainer
+        self.tokens_per_sample = tokens_per_sample
+        # Pico de RSS desta execução (ru_maxrss inclui jobs e modelos anteriores do processo)
+        self.memory_sampler = memory_sampler
+        self.progress_start, self.progress_end = progress_range
+        self.min_interval = min_interval
+        self.start_time = None
+        self.start_step = 0
+        self.samples_per_step = 1
+        self.last_publish = 0
+        self.last_logs = {}
+    
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.start_time = time.time()
+        self.start_step = state.global_step
+        self.samples_per_step = (args.per_device_train_batch_size * 
+                                 args.gradient_accumulation_steps * 
+                                 max(1, args.world_size))
+        self._publish(args, state, force=True)
+    
+    def on_step_end(self, args, state, control, **kwargs):
+        self._publish(args, state)
+    
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if logs:
+            self.last_logs.update({key: value for key, value in logs.items() 
+                                   if key in ('loss', 'learning_rate', 'grad_norm')})
+        self._publish(args, state, force=True)
+    
+    def on_epoch_end(self, args, state, control, **kwargs):
+        self._publish(args, state, force=True)
+    
+    def on_evaluate(self, args, state, control, metrics=None, **kwargs):
+        if metrics and 'eval_loss' in metrics:
+            self.last_logs['eval_loss'] = metrics['eval_loss']
+            self.last_logs['perplexity'] = loss_to_perplexity(metrics['eval_loss'])
+        self._publish(args, state, force=True)
+    
+    def build_metrics(self, state):
+        """Calcula métricas de throughput a partir do estado do Trainer"""
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        steps_done = state.global_step - self.start_step
+        samples_per_second = steps_done * self.samples_per_step / elapsed
+        seconds_per_step = elapsed / steps_done if steps_done > 0 else None
+        remaining_steps = max(state.max_steps - state.global_step, 0)
+        
+        return {
+            'step': state.global_step,
+            'max_steps': state.max_steps,
+            'epoch': round(state.epoch or 0, 3),
+            'loss': self.last_logs.get('loss'),
+            'learning_rate': self.last_logs.get('learning_rate'),
+            'eval_loss': self.last_logs.get('eval_loss'),
+            'perplexity': self.last_logs.get('perplexity'),
+            'samples_per_second': round(samples_per_second, 3),
+            'tokens_per_second': round(samples_per_second * self.tokens_per_sample, 1),
+            'seconds_per_step': round(seconds_per_step, 3) if seconds_per_step else None,
+            'elapsed_seconds': round(elapsed, 1),
+            'eta_seconds': round(remaining_steps * seconds_per_step, 1) if seconds_per_step else None,
+            'peak_memory_mb': self.memory_sampler.peak if self.memory_sampler else get_current_memory_mb(),
+            'rss_mb': get_current_memory_mb(),
+            'updated_at': datetime.now().isoformat()
+        }
+    
+    def _publish(self, args, state, force=False):
+        """Envia métricas para o status (limitado a uma atualização por intervalo)"""
+        now = time.time()
+        if not force and now - self.last_publish < self.min_interval:
+            return
+        self.last_publish = now
+        
+        metrics = self.build_metrics(state)
+        fraction = state.global_step / state.max_steps if state.max_steps else 0
+        progress = int(self.progress_start + (self.progress_end - self.progress_start) * fraction)
+        
+        message = f"Treinando: passo {metrics['step']}/{metrics['max_steps']} (época {metrics['epoch']:.2f})"
+        if metrics['loss'] is not None:
+            message += f" - loss {metrics['loss']:.4f}"
+        
+        self.model_trainer.update_status('training', progress, message, metrics)
+
+class CheckpointTimerCallback(TrainerCallback):
+    """Força um checkpoint sempre que o intervalo de tempo configurado é atingido"""
+    
+    def __init__(self, interval_minutes):
+        self.interval_seconds = interval_minutes * 60
+        self.last_save = time.time()
+    
+    def on_step_end(self, args, state, control, **kwargs):
+        if time.time() - self.last_save >= self.interval_seconds:
+            control.should_save = True
+    
+    def on_save(self, args, state, control, **kwargs):
+        self.last_save = time.time()
+
+def find_free_port():
+    """Porta TCP livre em localhost para o rendezvous do torch.distributed"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def run_distributed_worker(rank, world_size, config, master_port, num_threads, status_queue):
+    """Ponto de entrada de cada processo worker do treinamento distribuído (DDP/gloo na CPU)"""
+    # Variáveis lidas pelo Trainer para inicializar o process group e o DistributedSampler
+    os.environ.update({
+        'MASTER_ADDR': '127.0.0.1',
+        'MASTER_PORT': str(master_port),
+        'RANK': str(rank),
+        'LOCAL_RANK': str(rank),
+        'WORLD_SIZE': str(world_size),
+    })
+    torch.set_num_threads(num_threads)
+    
+    worker = DistributedWorkerTrainer(rank, status_queue)
+    worker.train_model({**config, 'distributed_worker': True})
+
+class MemoryProfileCallback(TrainerCallback):
+    """
+    Registra RSS atual e pico de memória a cada passo e avisa quando o orçamento é excedido.
+    
+    O pico vem de self.sampler, ativo durante trainer.train(): é o pico desta
+    execução, não o ru_maxrss de um processo que já rodou outros jobs.
+    """
+    
+    def __init__(self, memory_budget_mb=None, max_samples=200, sample_interval=0.05):
+        self.memory_budget_mb = memory_budget_mb
+        self.max_samples = max_samples
+        self.samples = []
+        self.sample_every = 1
+        self.budget_exceeded_at = None
+        self.sampler = MemorySampler(interval=sample_interval)
+    
+    def on_step_end(self, args, state, control, **kwargs):
+        peak = self.sampler.peak
+        
+        if state.global_step % self.sample_every == 0:
+            self.samples.append({
+                'step': state.global_step,
+                'rss_mb': get_current_memory_mb(),
+                'peak_rss_mb': peak
+            })
+            # Manter no máximo max_samples amostras: descartar metade e dobrar o intervalo
+            if len(self.samples) > self.max_samples:
+                self.samples = self.samples[::2]
+                self.sample_every *= 2
+        
+        if (self.memory_budget_mb and peak and peak > self.memory_budget_mb 
+                and self.budget_exceeded_at is None):
+            self.budget_exceeded_at = state.global_step
+            print(f"⚠️ Pico de memória ({peak:.0f}MB) excedeu o orçamento de {self.memory_budget_mb:.0f}MB no passo {state.global_step}")
+    
+    def summary(self):
+        """Resumo do perfil de memória para o training_info.json"""
+        peaks = [sample['peak_rss_mb'] for sample in self.samples if sample['peak_rss_mb'] is not None]
+        return {
+            'memory_budget_mb': self.memory_budget_mb,
+            'peak_rss_mb': max(peaks) if peaks else None,
+            'budget_exceeded_at_step': self.budget_exceeded_at,
+            'sample_every_steps': self.sample_every,
+            'samples': self.samples
+        }
+
+class EvaluationHistoryCallback(TrainerCallback):
+    """Guarda o histórico de avaliações (loss e perplexidade no conjunto de validação)"""
+    
+    def __init__(self):
+        self.history = []
+    
+    def on_evaluate(self, args, state, control, metrics=None, **kwargs):
+        if metrics and 'eval_loss' in metrics:
+            self.history.append({
+                'step': state.global_step,
+                'epoch': round(state.epoch or 0, 3),
+                'eval_loss': round(metrics['eval_loss'], 4),
+                'perplexity': loss_to_perplexity(metrics['eval_loss'])
+            })
+    
+    def summary(self, state, early_stopping_patience):
+        """Resumo da avaliação para o training_info.json e o registro de modelos"""
+        best_loss = state.best_metric
+        return {
+            'best_eval_loss': round(best_loss, 4) if best_loss is not None else None,
+            'best_perplexity': loss_to_perplexity(best_loss),
+            'best_checkpoint': state.best_model_checkpoint,
+            'early_stopping_patience': early_stopping_patience,
+            # Parou antes do total de passos previsto: a loss de validação estabilizou
+            'stopped_early': state.global_step < state.max_steps,
+            'steps_completed': state.global_step,
+            'max_steps': state.max_steps,
+            'history': self.history
+        }
+
 class ModelTrainer:
+    # Escolhas de estado do otimizador: Adafactor fatoriza os momentos e SGD não guarda estado
+    OPTIMIZERS = {
+        'adamw': 'adamw_torch',
+        'adafactor': 'adafactor',
+        'sgd': 'sgd',
+    }
+    
     def __init__(self, config_manager):
         self.config_manager = config_manager
         self.training_status = {
             'status': 'idle',
             'progress': 0,
-            'message': 'Aguardando início do treinamento'
+            'message': 'Aguardando início do treinamento',
+            'metrics': {}
         }
     
     def train_model(self, config):
         """Treina o modelo com os dados coletados"""
         try:
-            self.update_status('preparing', 5, 'Carregando dados coletados...')
+            distributed_config = config.get('distributed_config') or {}
+            is_worker = config.get('distributed_worker', False)
             
-            # Carregar dados coletados
-            data = self.load_training_data()
+            # Modo distribuído: este processo apenas coordena os workers
+            if distributed_config.get('num_workers', 1) > 1 and not is_worker:
+                return self.train_distributed(config)
+            
+            self.update_status('preparing', 5, 'Carregando dados coletados...', metrics={})
+            data_cutoff = config.get('data_cutoff', datetime.now().isoformat())
+            
+            # Carregar dados coletados (arquivos preparados pelo serviço, se informados)
+            data_files = self.training_data_files(config.get('collected_data'))
+            # Lista vazia: repassar a configuração (arquivos informados e ausentes não viram "todos")
+            data = self.load_training_data(data_files or config.get('collected_data'))
             
             if not data:
                 raise Exception("Nenhum dado encontrado para treinamento")
@@ -39,36 +369,142 @@ class ModelTrainer:
             
             # Configurar modelo e tokenizer primeiro
             model_name = config.get('base_model', 'microsoft/DialoGPT-small')
-            print(f"🤖 Carregando modelo: {model_name}")
+            training_mode = config.get('training_mode', 'full')
             
-            tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
-            model = AutoModelForCausalLM.from_pretrained(model_name)
+            # Treinamento contínuo: partir do último modelo treinado
+            init_model_path = config.get('init_model_path')
+            if init_model_path:
+                print(f"🔁 Continuando treinamento a partir de: {init_model_path}")
+                tokenizer = AutoTokenizer.from_pretrained(init_model_path, use_fast=True)
+                model = self.load_model_for_training(init_model_path, training_mode)
+            else:
+                print(f"🤖 Carregando modelo: {model_name}")
+                tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+                model = AutoModelForCausalLM.from_pretrained(model_name)
             
             # Adicionar token de padding se necessário
             if tokenizer.pad_token is None:
                 tokenizer.pad_token = tokenizer.eos_token
                 model.resize_token_embeddings(len(tokenizer))
             
+            # Economia de memória: recomputar ativações no backward em vez de guardá-las
+            memory_options = self.resolve_memory_options(config)
+            if memory_options['gradient_checkpointing']:
+                print("🧠 Gradient checkpointing ativado")
+                model.config.use_cache = False
+                model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={'use_reentrant': False})
+                if training_mode == 'lora':
+                    # Com o modelo base congelado (LoRA), os embeddings precisam propagar gradiente;
+                    # no treino completo eles já exigem gradiente e o hook seria só custo extra
+                    model.enable_input_require_grads()
+            
+            # Modo LoRA: congelar modelo base e treinar apenas adaptadores
+            if training_mode == 'lora' and not hasattr(model, 'peft_config'):
+                self.update_status('preparing', 20, 'Configurando adaptadores LoRA...')
+                model = self.apply_lora(model, config.get('lora_config', {}))
+            
             self.update_status('preparing', 25, 'Preparando dataset para treinamento...')
             
             # Preparar dataset com tokenizer configurado
             dataset = self.prepare_dataset(data, config, tokenizer)
             print(f"📝 Dataset preparado: {len(dataset)} exemplos")
             
+            # Separar conjunto de validação (semente fixa: mesmo split em todos os workers e ao retomar)
+            eval_config = config.get('eval_config') or {}
+            dataset, eval_dataset = self.split_validation(dataset, eval_config)
+            early_stopping_patience = eval_config.get('early_stopping_patience', 3) if eval_dataset else None
+            
             self.update_status('training', 30, 'Configurando parâmetros de treinamento...')
             
             # Determinar batch size baseado na memória disponível
             batch_size = config.get('batch_size', 2)  # Reduzido para 2 por padrão
             epochs = config.get('epochs', 3)
+            # Adaptadores LoRA toleram (e precisam de) learning rate maior
+            learning_rate = config.get('learning_rate', 2e-4 if training_mode == 'lora' else 5e-5)
+            gradient_accumulation_steps = config.get('gradient_accumulation_steps', 4)  # Compensar batch size menor
+            
+            # Preparar data collator
+            data_collator = DataCollatorForLanguageModeling(
+                tokenizer=tokenizer,
+                mlm=False,
+            )
+            
+            # Auto-tuning: maior micro-batch no orçamento de memória e threads mais rápidas,
+            # mantendo o batch efetivo (micro-batch x accumulation) solicitado
+            autotune_info = None
+            if config.get('auto_tune', False) and not is_worker:
+                from training_autotuner import TrainingAutoTuner
+                
+                self.update_status('training', 30, 'Ajustando batch size e threads da CPU...')
+                effective_batch_size = config.get('effective_batch_size', batch_size * gradient_accumulation_steps)
+                tuner = TrainingAutoTuner(model, dataset, data_collator, 
+                                          memory_budget_mb=config.get('memory_budget_mb'))
+                autotune_info = tuner.tune(effective_batch_size)
+                batch_size = autotune_info['micro_batch_size']
+                gradient_accumulation_steps = autotune_info['gradient_accumulation_steps']
+            
+            # Diretório estável (informado pelo job) permite retomar de checkpoints
+            output_dir = config.get('output_dir') or f'./models/trained_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+            
+            memory_args = {
+                'optim': self.OPTIMIZERS[memory_options['optimizer']],
+                'gradient_checkpointing': memory_options['gradient_checkpointing'],
+            }
+            if memory_options['gradient_checkpointing']:
+                memory_args['gradient_checkpointing_kwargs'] = {'use_reentrant': False}
+            if memory_options['bf16']:
+                # Autocast bfloat16 na CPU: ativações e cálculos em 16 bits, pesos mestres em fp32
+                memory_args['bf16'] = True
+                memory_args['use_cpu'] = not torch.cuda.is_available()
+            
+            # Em DDP cada worker processa apenas sua fração do dataset
+            world_size = int(os.environ.get('WORLD_SIZE', 1)) if is_worker else 1
+            requested_batch_size = batch_size * gradient_accumulation_steps
+            if world_size > 1:
+                # Cada passo de otimização soma os micro-batches de todos os workers: dividir a
+                # acumulação mantém o batch efetivo (e o número de passos) do treino em um processo
+                gradient_accumulation_steps = max(1, round(gradient_accumulation_steps / world_size))
+                effective_batch_size = batch_size * gradient_accumulation_steps * world_size
+                print(f"🧮 DDP com {world_size} workers: gradient accumulation {gradient_accumulation_steps}, "
+                      f"batch efetivo {effective_batch_size} (solicitado {requested_batch_size})")
+            distributed_args = {}
+            if is_worker:
+                # Gradientes agregados entre os processos via all-reduce do gloo (CPU)
+                distributed_args = {
+                    'ddp_backend': 'gloo',
+                    'use_cpu': True,
+                    'ddp_find_unused_parameters': False,
+                }
+            
+            # Checkpoints por passos de otimização (~10 por treinamento) e por tempo
+            updates_per_epoch = max(1, (len(dataset) // world_size // batch_size) // gradient_accumulation_steps)
+            total_steps = updates_per_epoch * epochs
+            save_steps = config.get('save_steps') or max(1, total_steps // 10)
+            checkpoint_interval_minutes = config.get('checkpoint_interval_minutes', 15)
+            
+            eval_args = {}
+            if eval_dataset is not None:
+                # Avaliar a cada checkpoint e restaurar o melhor ao final (menor eval_loss)
+                strategy_key = 'eval_strategy' if 'eval_strategy' in TrainingArguments.__dataclass_fields__ else 'evaluation_strategy'
+                eval_args = {
+                    strategy_key: 'steps',
+                    'eval_steps': save_steps,
+                    'per_device_eval_batch_size': batch_size,
+                    'load_best_model_at_end': True,
+                    'metric_for_best_model': 'eval_loss',
+                    'greater_is_better': False,
+                }
             
             # Configurar argumentos de treinamento otimizados
             training_args = TrainingArguments(
-                output_dir=f'./models/trained_{datetime.now().strftime("%Y%m%d_%H%M%S")}',
+                output_dir=output_dir,
                 overwrite_output_dir=True,
                 num_train_epochs=epochs,
                 per_device_train_batch_size=batch_size,
-                gradient_accumulation_steps=4,  # Compensar batch size menor
-                save_steps=len(dataset) // 2,  # Salvar na metade do treinamento
+                learning_rate=learning_rate,
+                gradient_accumulation_steps=gradient_accumulation_steps,
+                save_strategy='steps',
+                save_steps=save_steps,
                 save_total_limit=2,
                 prediction_loss_only=True,
                 logging_steps=max(1, len(dataset) // 10),  # Log a cada 10% dos dados
@@ -77,15 +513,28 @@ class ModelTrainer:
                 dataloader_pin_memory=False,  # Evitar aviso de pin_memory
                 report_to=None,  # Não enviar para wandb/tensorboard
                 disable_tqdm=False,  # Manter barra de progresso
+                **{**eval_args, **memory_args, **distributed_args}
             )
             
             self.update_status('training', 35, 'Inicializando processo de treinamento...')
             
-            # Preparar data collator
-            data_collator = DataCollatorForLanguageModeling(
-                tokenizer=tokenizer,
-                mlm=False,
+            # Telemetria em tempo real durante trainer.train()
+            memory_callback = MemoryProfileCallback(memory_options['memory_budget_mb'])
+            telemetry_callback = TrainingTelemetryCallback(
+                self,
+                tokens_per_sample=mean_real_tokens(dataset),
+                memory_sampler=memory_callback.sampler
             )
+            evaluation_callback = EvaluationHistoryCallback()
+            
+            callbacks = [telemetry_callback, memory_callback, evaluation_callback]
+            if eval_dataset is not None and early_stopping_patience:
+                callbacks.append(EarlyStoppingCallback(
+                    early_stopping_patience=early_stopping_patience,
+                    early_stopping_threshold=eval_config.get('early_stopping_threshold', 0.0)
+                ))
+            if checkpoint_interval_minutes:
+                callbacks.append(CheckpointTimerCallback(checkpoint_interval_minutes))
             
             # Inicializar trainer
             trainer = Trainer(
@@ -93,31 +542,76 @@ class ModelTrainer:
                 args=training_args,
                 data_collator=data_collator,
                 train_dataset=dataset,
+                eval_dataset=eval_dataset,
+                callbacks=callbacks,
             )
             
-            # Executar treinamento
-            print(f"🚀 Iniciando treinamento com {epochs} épocas...")
-            self.update_status('training', 40, f'Treinando modelo ({epochs} épocas)...')
+            # Retomar do último checkpoint válido (otimizador, scheduler e RNG restaurados pelo Trainer)
+            resume_checkpoint = self.find_resume_checkpoint(output_dir) if config.get('resume', True) else None
             
-            # Treinar modelo
-            trainer.train()
+            if resume_checkpoint:
+                print(f"♻️ Retomando treinamento do checkpoint: {resume_checkpoint}")
+                self.update_status('training', 40, f'Retomando treinamento de {os.path.basename(resume_checkpoint)}...')
+            else:
+                print(f"🚀 Iniciando treinamento com {epochs} épocas...")
+                self.update_status('training', 40, f'Treinando modelo ({epochs} épocas)...')
+            
+            # Treinar modelo (pico de memória amostrado só durante o treino)
+            with memory_callback.sampler:
+                trainer.train(resume_from_checkpoint=resume_checkpoint)
             
             # Salvar modelo treinado
             self.update_status('saving', 90, 'Salvando modelo treinado...')
             print("💾 Salvando modelo...")
             
-            trainer.save_model()
+            if training_mode == 'lora' and config.get('lora_config', {}).get('merge_weights', False):
+                # Mesclar adaptadores no modelo base e salvar modelo completo
+                if trainer.is_world_process_zero():
+                    model = model.merge_and_unload()
+                    model.save_pretrained(training_args.output_dir)
+                training_mode = 'lora_merged'
+            else:
+                # Em modo LoRA salva apenas os pesos dos adaptadores
+                trainer.save_model()
+            
+            if not trainer.is_world_process_zero():
+                # Demais workers DDP: tokenizer, informações e status final ficam com o rank 0
+                return
+            
             tokenizer.save_pretrained(training_args.output_dir)
             
             # Salvar informações do treinamento
             training_info = {
                 'model_name': model_name,
+                'training_mode': training_mode,
+                'lora_config': config.get('lora_config', {}) if training_mode != 'full' else None,
                 'epochs': epochs,
                 'batch_size': batch_size,
+                'gradient_accumulation_steps': gradient_accumulation_steps,
+                'num_threads': torch.get_num_threads(),
+                'distributed': {
+                    'backend': 'gloo',
+                    'num_workers': world_size,
+                    'effective_batch_size': batch_size * gradient_accumulation_steps * world_size,
+                    'requested_effective_batch_size': requested_batch_size
+                } if is_worker else None,
+                'autotune': autotune_info,
+                'memory_config': memory_options,
+                'memory_profile': memory_callback.summary(),
+                'learning_rate': learning_rate,
                 'dataset_size': len(dataset),
+                'eval_dataset_size': len(eval_dataset) if eval_dataset is not None else 0,
+                'evaluation': evaluation_callback.summary(trainer.state, early_stopping_patience) if eval_dataset is not None else None,
+                'save_steps': save_steps,
+                'resumed_from_checkpoint': resume_checkpoint,
                 'data_sources': len(data),
+                # Arquivos efetivamente usados: o retreinamento contínuo não os trata como dados novos
+                'data_files': data_files,
+                'data_cutoff': data_cutoff,
+                'continued_from': init_model_path,
                 'training_date': datetime.now().isoformat(),
-                'output_dir': training_args.output_dir
+                'output_dir': training_args.output_dir,
+                'telemetry': telemetry_callback.build_metrics(trainer.state)
             }
             
             info_file = os.path.join(training_args.output_dir, 'training_info.json')
@@ -125,6 +619,12 @@ class ModelTrainer:
                 json.dump(training_info, f, ensure_ascii=False, indent=2)
             
             success_message = f'Treinamento concluído! Modelo salvo em: {training_args.output_dir}'
+            if training_info['evaluation']:
+                evaluation = training_info['evaluation']
+                success_message += f" (perplexidade de validação: {evaluation['best_perplexity']}"
+                if evaluation['stopped_early']:
+                    success_message += f", parada antecipada no passo {evaluation['steps_completed']}/{evaluation['max_steps']}"
+                success_message += ')'
             self.update_status('completed', 100, success_message)
             print(f"✅ {success_message}")
             
@@ -133,51 +633,232 @@ class ModelTrainer:
             self.update_status('error', 0, error_message)
             print(f"❌ {error_message}")
     
-    def load_training_data(self):
-        """Carrega dados coletados para treinamento (corrigida)"""
-        data = []
+    def split_validation(self, dataset, eval_config):
+        """Separa um conjunto de validação; retorna (treino, validação ou None)"""
+        validation_split = eval_config.get('validation_split', 0.1)
+        min_eval_examples = eval_config.get('min_eval_examples', 2)
+        eval_size = int(len(dataset) * validation_split)
         
-        # Primeiro, tentar carregar do diretório training_data (novo formato)
+        # Poucos dados: melhor treinar com tudo do que avaliar com 1 exemplo
+        if not validation_split or eval_size < min_eval_examples:
+            print("ℹ️ Sem conjunto de validação (dados insuficientes ou desativado)")
+            return dataset, None
+        
+        split = dataset.train_test_split(test_size=eval_size, seed=eval_config.get('seed', 42))
+        print(f"🧪 Validação: {len(split['test'])} exemplos separados, {len(split['train'])} para treino")
+        return split['train'], split['test']
+    
+    def resolve_memory_options(self, config):
+        """
+        Resolve opções de memória a partir de config['memory_config'].
+        
+        Com memory_budget_mb informado (modo orçamento de memória), o padrão passa a ser
+        gradient checkpointing, bf16 quando a CPU suporta e Adafactor.
+        """
+        memory_config = config.get('memory_config') or {}
+        memory_budget_mb = config.get('memory_budget_mb')
+        budget_mode = memory_budget_mb is not None
+        
+        optimizer = memory_config.get('optimizer', 'adafactor' if budget_mode else 'adamw')
+        if optimizer not in self.OPTIMIZERS:
+            raise Exception(f"Otimizador inválido: {optimizer} (opções: {', '.join(self.OPTIMIZERS)})")
+        
+        bf16 = memory_config.get('bf16', 'auto' if budget_mode else False)
+        if bf16 == 'auto':
+            bf16 = cpu_supports_bf16()
+        elif bf16 and not torch.cuda.is_available() and not cpu_supports_bf16():
+            print("⚠️ bf16 solicitado, mas a CPU não suporta bfloat16 nativamente: usando fp32")
+            bf16 = False
+        
+        return {
+            'gradient_checkpointing': bool(memory_config.get('gradient_checkpointing', budget_mode)),
+            'bf16': bool(bf16),
+            'optimizer': optimizer,
+            'memory_budget_mb': memory_budget_mb,
+        }
+    
+    def train_distributed(self, config):
+        """Treina com N processos locais (DDP/gloo): cada worker treina um shard do dataset"""
+        distributed_config = config.get('distributed_config') or {}
+        num_workers = distributed_config['num_workers']
+        # Dividir os núcleos entre os workers para evitar disputa de threads
+        num_threads = distributed_config.get('threads_per_worker') or max(1, (os.cpu_count() or 1) // num_workers)
+        master_port = distributed_config.get('master_port') or find_free_port()
+        # Todos os ranks precisam gravar checkpoints no mesmo diretório
+        config = {**config, 'output_dir': config.get('output_dir') or f'./models/trained_{datetime.now().strftime("%Y%m%d_%H%M%S")}'}
+        
+        print(f"🧵 Treinamento distribuído: {num_workers} processos x {num_threads} threads (gloo, porta {master_port})")
+        self.update_status('preparing', 5, f'Iniciando {num_workers} processos de treinamento...', metrics={})
+        
+        status_queue = torch.multiprocessing.get_context('spawn').Queue()
+        process_context = torch.multiprocessing.spawn(
+            run_distributed_worker,
+            args=(num_workers, config, master_port, num_threads, status_queue),
+            nprocs=num_workers,
+            join=False
+        )
+        
+        last_status = None
+        try:
+            finished = False
+            while not finished and last_status != 'error':
+                # join() levanta exceção se algum worker terminar com falha
+                finished = process_context.join(timeout=1)
+                for status, progress, message, metrics in self._drain_status_queue(status_queue):
+                    last_status = status
+                    self.update_status(status, progress, message, metrics)
+        finally:
+            # Cancelamento ou erro em um rank: os demais ficariam bloqueados no all-reduce
+            for process in process_context.processes:
+                if process.is_alive():
+                    process.terminate()
+        
+        if last_status not in ('completed', 'error'):
+            raise Exception("Processos de treinamento distribuído terminaram sem concluir o treinamento")
+    
+    def _drain_status_queue(self, status_queue):
+        """Lê todas as atualizações de status pendentes enviadas pelos workers"""
+        updates = []
+        while True:
+            try:
+                updates.append(status_queue.get(timeout=0.1))
+            except queue.Empty:
+                return updates
+    
+    def apply_lora(self, model, lora_options):
+        """Envolve o modelo com adaptadores LoRA (somente os adaptadores são treinados)"""
+        try:
+            from peft import LoraConfig, TaskType, get_peft_model
+        except ImportError:
+            raise Exception("Modo LoRA requer o pacote 'peft' (pip install peft)")
+        
+        lora_config = LoraConfig(
+            task_type=TaskType.CAUSAL_LM,
+            r=lora_options.get('r', 8),
+            lora_alpha=lora_options.get('alpha', 16),
+            lora_dropout=lora_options.get('dropout', 0.05),
+            # None = módulos padrão do peft para a arquitetura (ex.: c_attn no GPT-2)
+            target_modules=lora_options.get('target_modules'),
+        )
+        
+        model = get_peft_model(model, lora_config)
+        
+        trainable, total = model.get_nb_trainable_parameters()
+        print(f"🧩 LoRA ativo: {trainable:,} de {total:,} parâmetros treináveis ({100 * trainable / total:.2f}%)")
+        
+        return model
+    
+    def find_resume_checkpoint(self, output_dir):
+        """Retorna o checkpoint válido mais recente em output_dir (ou None)"""
+        if not os.path.isdir(output_dir):
+            return None
+        
+        checkpoints = []
+        for folder in os.listdir(output_dir):
+            match = re.match(r'^checkpoint-(\d+)$', folder)
+            if match and os.path.isdir(os.path.join(output_dir, folder)):
+                checkpoints.append((int(match.group(1)), os.path.join(output_dir, folder)))
+        
+        weight_files = ('model.safetensors', 'pytorch_model.bin', 
+                        'adapter_model.safetensors', 'adapter_model.bin',
+                        'model.safetensors.index.json', 'pytorch_model.bin.index.json')
+        
+        # Do mais recente para o mais antigo: um checkpoint interrompido no meio
+        # do salvamento não tem todos os arquivos e é ignorado
+        for step, path in sorted(checkpoints, reverse=True):
+            files = set(os.listdir(path))
+            has_weights = any(name in files for name in weight_files)
+            has_state = 'trainer_state.json' in files and 'optimizer.pt' in files
+            
+            if has_weights and has_state:
+                try:
+                    with open(os.path.join(path, 'trainer_state.json'), 'r', encoding='utf-8') as f:
+                        json.load(f)
+                    return path
+                except Exception:
+                    pass
+            
+            print(f"⚠️ Checkpoint incompleto ignorado: {path}")
+        
+        return None
+    
+    def load_model_for_training(self, model_path, training_mode):
+        """Carrega um modelo treinado anteriormente (completo ou adaptador LoRA) para continuar o treino"""
+        if not os.path.exists(os.path.join(model_path, 'adapter_config.json')):
+            return AutoModelForCausalLM.from_pretrained(model_path)
+        
+        try:
+            from peft import PeftConfig, PeftModel
+        except ImportError:
+            raise Exception("Modelo anterior é um adaptador LoRA e requer o pacote 'peft' (pip install peft)")
+        
+        base_model_name = PeftConfig.from_pretrained(model_path).base_model_name_or_path
+        base_model = AutoModelForCausalLM.from_pretrained(base_model_name)
+        
+        if training_mode == 'lora':
+            # Continuar treinando os mesmos adaptadores
+            return PeftModel.from_pretrained(base_model, model_path, is_trainable=True)
+        
+        # Treino completo a partir do adaptador: mesclar no modelo base
+        return PeftModel.from_pretrained(base_model, model_path).merge_and_unload()
+    
+    def training_data_files(self, data_files=None):
+        """Arquivos de dados do treinamento: os informados (existentes) ou todos os collected_data_*"""
         training_data_dir = 'training_data'
+        if data_files:
+            return [path for path in data_files if os.path.exists(path)]
         if os.path.exists(training_data_dir):
-            for filename in os.listdir(training_data_dir):
-                if filename.startswith('collected_data_') and filename.endswith('.json'):
-                    file_path = os.path.join(training_data_dir, filename)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            file_data = json.load(f)
-                        
-                        # Verificar se tem o campo 'texts' (novo formato)
-                        if 'texts' in file_data:
-                            texts = file_data['texts']
-                            sources = file_data.get('sources', [])
-                            
-                            # Converter para formato esperado pelo trainer
-                            for i, text in enumerate(texts):
-                                if isinstance(text, str) and len(text.strip()) > 20:
-                                    data.append({
-                                        'content': text.strip(),
-                                        'source': sources[0] if sources else 'unknown',
-                                        'id': f"{filename}_{i}",
-                                        'timestamp': file_data.get('timestamp', datetime.now().isoformat())
-                                    })
-                            
-                            print(f"📂 Carregados {len(texts)} textos de {filename}")
+            # Ordem estável: workers distribuídos precisam do mesmo dataset para o sharding
+            return [os.path.join(training_data_dir, filename)
+                    for filename in sorted(os.listdir(training_data_dir))
+                    if filename.startswith('collected_data_') and filename.endswith('.json')]
+        return []
+    
+    def load_training_data(self, data_files=None):
+        """Carrega dados coletados para treinamento (todos os collected_data_* ou os arquivos informados)"""
+        data = []
+        
+        # Primeiro, tentar carregar do diretório training_data (novo formato)
+        file_paths = self.training_data_files(data_files)
+        
+        if file_paths:
+            for file_path in file_paths:
+                filename = os.path.basename(file_path)
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        file_data = json.load(f)
+                    
+                    # Verificar se tem o campo 'texts' (novo formato)
+                    if 'texts' in file_data:
+                        texts = file_data['texts']
+                        sources = file_data.get('sources', [])
                         
-                        # Verificar formato detalhado
-                        elif 'detailed_data' in file_data:
-                            for item in file_data['detailed_data']:
-                                if 'content' in item and len(item['content'].strip()) > 20:
-                                    data.append({
-                                        'content': item['content'].strip(),
-                                        'source': item.get('source', 'unknown'),
-                                        'id': item.get('id', f"{filename}_{len(data)}"),
-                                        'timestamp': item.get('timestamp', datetime.now().isoformat())
-                                    })
+                        # Converter para formato esperado pelo trainer
+                        for i, text in enumerate(texts):
+                            if isinstance(text, str) and len(text.strip()) > 20:
+                                data.append({
+                                    'content': text.strip(),
+                                    'source': sources[0] if sources else 'unknown',
+                                    'id': f"{filename}_{i}",
+                                    'timestamp': file_data.get('timestamp', datetime.now().isoformat())
+                                })
                         
-                    except Exception as e:
-                        print(f"❌ Erro ao carregar {filename}: {e}")
-                        continue
+                        print(f"📂 Carregados {len(texts)} textos de {filename}")
+                    
+                    # Verificar formato detalhado
+                    elif 'detailed_data' in file_data:
+                        for item in file_data['detailed_data']:
+                            if 'content' in item and len(item['content'].strip()) > 20:
+                                data.append({
+                                    'content': item['content'].strip(),
+                                    'source': item.get('source', 'unknown'),
+                                    'id': item.get('id', f"{filename}_{len(data)}"),
+                                    'timestamp': item.get('timestamp', datetime.now().isoformat())
+                                })
+                    
+                except Exception as e:
+                    print(f"❌ Erro ao carregar {filename}: {e}")
+                    continue
         
         # Fallback: tentar diretório 'data' (formato antigo)
         if not data and os.path.exists('data'):
@@ -246,7 +927,7 @@ class ModelTrainer:
             tokenized = tokenizer(
                 examples['text'],
                 truncation=True,
-                max_length=256,  # Reduzido para treinar mais rápido
+                max_length=config.get('max_length', 256),  # Menor = treino mais rápido e com menos memória
                 padding='max_length',
                 return_tensors=None
             )
@@ -267,15 +948,35 @@ class ModelTrainer:
         
         return tokenized_dataset
     
-    def update_status(self, status, progress, message):
-        """Atualiza status do treinamento"""
+    def update_status(self, status, progress, message, metrics=None):
+        """Atualiza status do treinamento (métricas são mantidas se não informadas)"""
+        if metrics is None:
+            metrics = self.training_status.get('metrics', {})
+        
         self.training_status = {
             'status': status,
             'progress': progress,
-            'message': message
+            'message': message,
+            'metrics': metrics
         }
         print(f"Status: {message} ({progress}%)")
     
     def get_status(self):
         """Retorna status atual do treinamento"""
         return self.training_status
+
+class DistributedWorkerTrainer(ModelTrainer):
+    """ModelTrainer de um processo worker DDP: repassa o status ao processo principal"""
+    
+    def __init__(self, rank, status_queue):
+        super().__init__(None)
+        self.rank = rank
+        self.status_queue = status_queue
+    
+    def update_status(self, status, progress, message, metrics=None):
+        # Progresso vem do rank 0; erros de qualquer rank interrompem o treinamento
+        if self.rank != 0 and status != 'error':
+            return
+        
+        super().update_status(status, progress, message, metrics)
+        self.status_queue.put((status, progress, message, self.training_status['metrics']))
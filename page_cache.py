@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+class PageCache:
+    """
+    Cache em disco de páginas baixadas para requisições HTTP condicionais.
+
+    Para cada URL guarda o corpo da resposta, os validadores (ETag e
+    Last-Modified) e os textos já extraídos e filtrados por variante de
+    extração (palavras-chave + versão do extrator). Em uma resposta 304
+    o coletor reaproveita esses textos sem refazer parsing nem filtragem.
+    """
+
+    def __init__(self, cache_dir='collected_data/page_cache'):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def conditional_headers(self, url):
+        """Cabeçalhos If-None-Match / If-Modified-Since para revalidar a URL"""
+        meta = self._load_meta(url)
+        # Sem corpo em cache um 304 não serviria para nada
+        if not meta or not os.path.exists(self._body_path(url)):
+            return {}
+
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def store_response(self, url, content, headers):
+        """Guarda o corpo de uma resposta 200; textos extraídos da versão anterior são descartados"""
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        # Sem validadores não há como revalidar: não vale ocupar disco
+        if not etag and not last_modified:
+            self.invalidate(url)
+            return
+
+        self._write_atomic(self._body_path(url), content)
+        self._save_meta(url, {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': datetime.now().isoformat(),
+            'validated_at': datetime.now().isoformat(),
+            'extracted': {}
+        })
+
+    def load_body(self, url):
+        """Corpo em cache da URL (ou None) e marca a revalidação"""
+        try:
+            with open(self._body_path(url), 'rb') as f:
+                content = f.read()
+        except OSError:
+            return None
+
+        meta = self._load_meta(url)
+        if meta:
+            meta['validated_at'] = datetime.now().isoformat()
+            self._save_meta(url, meta)
+        return content
+
+    def get_extracted(self, url, variant):
+        """Textos extraídos anteriormente para a variante (ou None)"""
+        meta = self._load_meta(url)
+        if not meta:
+            return None
+        return meta.get('extracted', {}).get(variant)
+
+    def put_extracted(self, url, variant, texts):
+        meta = self._load_meta(url)
+        # Sem metadados a página não é cacheável (ex.: resposta sem ETag/Last-Modified)
+        if not meta:
+            return
+        meta.setdefault('extracted', {})[variant] = texts
+        self._save_meta(url, meta)
+
+    def invalidate(self, url):
+        for path in (self._meta_path(url), self._body_path(url)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _key(self, url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _meta_path(self, url):
+        return os.path.join(self.cache_dir, f'{self._key(url)}.json')
+
+    def _body_path(self, url):
+        return os.path.join(self.cache_dir, f'{self._key(url)}.body')
+
+    def _load_meta(self, url):
+        try:
+            with open(self._meta_path(url), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_meta(self, url, meta):
+        self._write_atomic(self._meta_path(url), json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+    def _write_atomic(self, path, data):
+        with self._lock:
+            temp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
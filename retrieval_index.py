@@ -0,0 +1,412 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+from ann_index import IVFIndex
+from content_index import _ClosingConnection, _finish_rebuild, _mark_rebuild
+from embedding_service import shared_embedding_service
+
+_TOKEN_RE = re.compile(r'\w+')
+_COMBINING_RE = re.compile('[\u0300-\u036f]')
+
+# Palavras muito frequentes que não ajudam a encontrar passagens (português e inglês, sem acentos)
+STOPWORDS = set('''
+a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela pelos pelas para pra com sem
+e ou mas que se nao sim ja mais menos muito muita muitos muitas ao aos a as eu voce voces ele ela eles elas
+nos me te lhe seu sua seus suas meu minha meus minhas isso isto esse essa este esta aquele aquela ser estar
+ter ha foi era sao esta estao tem como quando onde qual quais quem porque sobre entre ate the of and to in
+is are was were be been it this that for on with as at by from or an not do does can you your we our
+'''.split())
+
+def tokenize(text):
+    """Termos do texto: minúsculas, sem acentos, sem stopwords e com pelo menos 2 caracteres"""
+    normalized = _COMBINING_RE.sub('', unicodedata.normalize('NFKD', (text or '').lower()))
+    return [token for token in _TOKEN_RE.findall(normalized) if len(token) > 1 and token not in STOPWORDS]
+
+def default_encoder():
+    """Serviço de embeddings do modelo definido em RETRIEVAL_EMBEDDING_MODEL (None sem modelo ou sem a biblioteca)"""
+    model_name = os.environ.get('RETRIEVAL_EMBEDDING_MODEL')
+    if not model_name:
+        return None
+    return shared_embedding_service(model_name)
+
+class RetrievalIndex:
+    """
+    Índice de busca sobre o corpus de treinamento (training_data/collected_data_*)
+    e as respostas de atendentes das conversas salvas (chat_training_data).
+
+    - Passagens (textos do corpus, os longos divididos em blocos de até
+      chunk_words palavras) e a frequência de cada termo ficam em SQLite;
+      o índice invertido BM25 é mantido em memória e atualizado só com as
+      passagens novas (por id), inclusive as gravadas por outro processo
+    - Com um encoder (encode(textos) -> matriz), cada passagem também ganha
+      um embedding em um índice ANN (IVFIndex, arquivos mapeados em memória)
+      e a busca combina BM25 com a similaridade de cosseno dos
+      dense_candidates vizinhos mais próximos da pergunta
+    - search(pergunta, k) retorna as k melhores passagens em milissegundos
+    """
+
+    def __init__(self, db_path='training_data/retrieval_index.db', data_dir='training_data',
+                 chat_data_dir='chat_training_data', encoder=None, ann_dir=None, k1=1.5, b=0.75,
+                 chunk_words=250, dense_weight=0.5, dense_candidates=100):
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self.chat_data_dir = chat_data_dir
+        self.encoder = encoder
+        self.ann_dir = ann_dir or os.path.splitext(db_path)[0] + '_ann'
+        self.k1 = k1
+        self.b = b
+        self.chunk_words = chunk_words
+        self.dense_weight = dense_weight
+        self.dense_candidates = dense_candidates
+
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._loaded_id = 0
+        self._postings = {}  # termo -> ([ids], [frequências])
+        self._arrays = {}  # termo -> (ids, frequências) como arrays (cache invalidado a cada inserção)
+        self._lengths = np.zeros(1, dtype=np.float32)  # posição = id da passagem
+        self._total_length = 0.0
+        self._count = 0
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.ann = IVFIndex(self.ann_dir) if encoder is not None else None
+        is_new = not os.path.exists(db_path)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS passages (
+                    id INTEGER PRIMARY KEY,
+                    digest BLOB UNIQUE,
+                    text TEXT,
+                    source TEXT,
+                    data_file TEXT,
+                    length INTEGER,
+                    terms TEXT
+                )
+            ''')
+            rebuild_pending = _mark_rebuild(conn, is_new)
+
+        self._ready = threading.Event()
+        if rebuild_pending:
+            # Primeira execução: indexar o corpus (e gerar os embeddings) em background; enquanto
+            # isso a busca responde com as passagens já indexadas
+            threading.Thread(target=self._initial_rebuild, name='retrieval-index-rebuild', daemon=True).start()
+        else:
+            self._ready.set()
+
+    def add(self, texts, data_file=None, sources=None):
+        """
+        Indexa textos gravados no corpus (sources: fonte de cada texto ou uma
+        fonte para todos). Passagens já indexadas são ignoradas; retorna
+        quantas passagens novas foram adicionadas.
+        """
+        if sources is None or isinstance(sources, str):
+            sources = [sources] * len(texts)
+
+        rows = []
+        seen = set()
+        for text, source in zip(texts, sources):
+            for passage in self._split(text):
+                digest = hashlib.sha1(re.sub(r'\s+', ' ', passage.lower()).strip().encode('utf-8')).digest()
+                terms = Counter(tokenize(passage))
+                if not terms or digest in seen:
+                    continue
+                seen.add(digest)
+                rows.append((digest, passage, source, data_file, sum(terms.values()),
+                             json.dumps(terms, ensure_ascii=False)))
+        if not rows:
+            return 0
+
+        with self._write_lock:
+            rows = self._unindexed(rows)
+            if not rows:
+                return 0
+            # Embeddings antes da transação: o encoder pode levar segundos e a escrita bloqueia outros processos
+            vectors = self._encode_passages([row[1] for row in rows]) if self.ann is not None else None
+
+            with self._connect() as conn:
+                # Transação de escrita desde o início: serializa entre processos também a gravação no índice ANN
+                conn.execute('BEGIN IMMEDIATE')
+                first_id = (conn.execute('SELECT MAX(id) FROM passages').fetchone()[0] or 0) + 1
+                before = conn.total_changes
+                conn.executemany('INSERT OR IGNORE INTO passages (digest, text, source, data_file, length, terms) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)', rows)
+                added = conn.total_changes - before
+
+                if added and vectors is not None:
+                    inserted = dict(conn.execute('SELECT digest, id FROM passages WHERE id >= ?', (first_id,)))
+                    positions = [position for position, row in enumerate(rows) if row[0] in inserted]
+                    self._add_embeddings([inserted[rows[position][0]] for position in positions], vectors[positions])
+
+        # O índice em memória é carregado por quem busca (refresh), não por quem grava
+        return added
+
+    def search(self, query, k=5):
+        """
+        As k passagens mais relevantes para a pergunta:
+        [{'id', 'text', 'source', 'score', 'bm25', 'coverage'}], onde coverage é
+        a fração dos termos da pergunta presentes na passagem.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        self.refresh()
+
+        with self._lock:
+            if not self._count:
+                return []
+
+            size = len(self._lengths)
+            bm25 = np.zeros(size, dtype=np.float32)
+            matched = np.zeros(size, dtype=np.float32)
+            average_length = self._total_length / self._count
+
+            for term in terms:
+                ids, frequencies = self._term_arrays(term)
+                if ids is None:
+                    continue
+                idf = np.log(1 + (self._count - len(ids) + 0.5) / (len(ids) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[ids] / average_length)
+                bm25[ids] += idf * frequencies * (self.k1 + 1) / (frequencies + norm)
+                matched[ids] += 1
+
+            scores = bm25 / bm25.max() if bm25.max() > 0 else bm25
+            dense = self._dense_scores(query, size)
+            if dense is not None:
+                scores = (1 - self.dense_weight) * scores + self.dense_weight * dense
+
+            candidates = np.flatnonzero(scores > 0)
+            if not len(candidates):
+                return []
+            top = candidates[np.argsort(-scores[candidates], kind='stable')[:k]]
+            hits = [{'id': int(passage_id), 'score': round(float(scores[passage_id]), 4),
+                     'bm25': round(float(bm25[passage_id]), 4),
+                     'coverage': round(float(matched[passage_id]) / len(terms), 3) if terms else 0.0}
+                    for passage_id in top]
+
+        texts = self._passages([hit['id'] for hit in hits])
+        for hit in hits:
+            hit['text'], hit['source'] = texts.get(hit['id'], ('', None))
+        return hits
+
+    def refresh(self):
+        """Carrega na memória as passagens indexadas desde a última atualização"""
+        with self._lock:
+            with self._connect() as conn:
+                rows = conn.execute('SELECT id, length, terms FROM passages WHERE id > ? ORDER BY id',
+                                    (self._loaded_id,)).fetchall()
+            if rows:
+                last_id = rows[-1][0]
+                if last_id >= len(self._lengths):
+                    lengths = np.zeros(max(last_id + 1, len(self._lengths) * 2), dtype=np.float32)
+                    lengths[:len(self._lengths)] = self._lengths
+                    self._lengths = lengths
+
+                for passage_id, length, terms in rows:
+                    self._lengths[passage_id] = length
+                    self._total_length += length
+                    for term, frequency in json.loads(terms).items():
+                        ids, frequencies = self._postings.setdefault(term, ([], []))
+                        ids.append(passage_id)
+                        frequencies.append(frequency)
+                        self._arrays.pop(term, None)
+
+                self._count += len(rows)
+                self._loaded_id = last_id
+
+    def count(self):
+        self.refresh()
+        return self._count
+
+    def warm_up(self):
+        """Indexa conversas salvas ainda fora do índice e carrega o índice na memória"""
+        self._ready.wait()
+        self.add_chat_files()
+        self.sync_embeddings()
+        self.refresh()
+
+    def sync_embeddings(self, batch_size=1000):
+        """
+        Gera os embeddings das passagens que ainda não estão no índice ANN (ex.: modelo
+        configurado depois da indexação, ou índice ANN apagado). Com o serviço de
+        embeddings, só os textos nunca calculados passam pelo modelo.
+        """
+        if self.ann is None:
+            return 0
+
+        embedded = set(self.ann.ids().tolist())
+        with self._connect() as conn:
+            missing = [passage_id for (passage_id,) in conn.execute('SELECT id FROM passages ORDER BY id')
+                       if passage_id not in embedded]
+        if not missing:
+            return 0
+
+        started = time.time()
+        for start in range(0, len(missing), batch_size):
+            passages = self._passages(missing[start:start + batch_size])
+            passage_ids = [passage_id for passage_id in missing[start:start + batch_size] if passage_id in passages]
+            vectors = self._encode_passages([passages[passage_id][0] for passage_id in passage_ids])
+            if vectors is None:
+                break
+            with self._write_lock, self._connect() as conn:
+                # Mesma transação de escrita do add(): serializa a gravação no índice ANN entre processos
+                conn.execute('BEGIN IMMEDIATE')
+                embedded = set(self.ann.ids().tolist())
+                positions = [position for position, passage_id in enumerate(passage_ids) if passage_id not in embedded]
+                self._add_embeddings([passage_ids[position] for position in positions], vectors[positions])
+
+        print(f"🧠 Embeddings sincronizados: {len(missing)} passagens ({time.time() - started:.1f}s)")
+        return len(missing)
+
+    def add_chat_file(self, file_path):
+        """
+        Indexa uma conversa salva em chat_training_data: só os pares respondidos
+        por atendentes (respostas do próprio bot voltariam para ele como
+        resposta "do corpus") e sem avaliação negativa.
+        """
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        pairs = [f"Usuário: {item['input']}\nAssistente: {item['output']}"
+                 for item in data.get('training_data', [])
+                 if item.get('interaction_type') == 'human_response' and item.get('rating') != 'negative'
+                 and item.get('input') and item.get('output')]
+        return self.add(pairs, file_path, f"Chat: {data.get('conversation_id', 'unknown')}")
+
+    def add_chat_files(self):
+        """Indexa as conversas de chat_data_dir que ainda não têm passagens no índice"""
+        if not self.chat_data_dir or not os.path.exists(self.chat_data_dir):
+            return 0
+
+        with self._connect() as conn:
+            indexed = {row[0] for row in conn.execute("SELECT DISTINCT data_file FROM passages "
+                                                      "WHERE source LIKE 'Chat: %'")}
+        added = 0
+        for filename in sorted(os.listdir(self.chat_data_dir)):
+            file_path = os.path.join(self.chat_data_dir, filename)
+            if not (filename.startswith('conversation_') and filename.endswith('.json')) or file_path in indexed:
+                continue
+            try:
+                added += self.add_chat_file(file_path)
+            except Exception as e:
+                print(f"Erro ao indexar {filename} para busca: {e}")
+        return added
+
+    def rebuild_from_files(self):
+        """Indexa os textos de todos os collected_data_*.json do diretório de dados e as conversas salvas"""
+        started = time.time()
+        added = self.add_chat_files()
+        if not os.path.exists(self.data_dir):
+            return added
+
+        for filename in sorted(os.listdir(self.data_dir)):
+            if not (filename.startswith('collected_data_') and filename.endswith('.json')):
+                continue
+
+            file_path = os.path.join(self.data_dir, filename)
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                texts = [text for text in data.get('texts', []) if isinstance(text, str)]
+                sources = data.get('sources') or []
+                added += self.add(texts, file_path, sources[0] if len(sources) == 1 else None)
+            except Exception as e:
+                print(f"Erro ao indexar {filename} para busca: {e}")
+
+        print(f"🔎 Índice de busca criado: {added} passagens do corpus e das conversas existentes "
+              f"({time.time() - started:.1f}s)")
+        return added
+
+    def _initial_rebuild(self):
+        try:
+            self.rebuild_from_files()
+            _finish_rebuild(self._connect)
+        except Exception as e:
+            print(f"Erro na indexação inicial do índice de busca: {e}")
+        finally:
+            self._ready.set()
+
+    def _split(self, text):
+        """Passagens do texto: inteiro se curto, senão blocos de até chunk_words palavras"""
+        text = (text or '').strip()
+        words = text.split()
+        if len(words) <= self.chunk_words:
+            return [text] if text else []
+        return [' '.join(words[start:start + self.chunk_words]) for start in range(0, len(words), self.chunk_words)]
+
+    def _term_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings.get(term)
+            if postings is None:
+                return None, None
+            arrays = (np.array(postings[0], dtype=np.int64), np.array(postings[1], dtype=np.float32))
+            self._arrays[term] = arrays
+        return arrays
+
+    def _passages(self, passage_ids):
+        if not passage_ids:
+            return {}
+        placeholders = ','.join('?' * len(passage_ids))
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT id, text, source FROM passages WHERE id IN ({placeholders})', passage_ids)
+            return {row[0]: (row[1], row[2]) for row in rows}
+
+    def _unindexed(self, rows):
+        """Linhas cujas passagens ainda não estão no índice (evita gerar embeddings de repetidas)"""
+        digests = [row[0] for row in rows]
+        known = set()
+        with self._connect() as conn:
+            for start in range(0, len(digests), 500):
+                chunk = digests[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                known.update(row[0] for row in conn.execute(f'SELECT digest FROM passages '
+                                                            f'WHERE digest IN ({placeholders})', chunk))
+        return [row for row in rows if row[0] not in known]
+
+    def _encode(self, texts):
+        vectors = np.asarray(self.encoder.encode(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _encode_passages(self, texts):
+        try:
+            return self._encode(texts)
+        except Exception as e:
+            print(f"⚠️ Erro ao gerar embeddings das passagens: {e}")
+            return None
+
+    def _add_embeddings(self, passage_ids, vectors):
+        try:
+            self.ann.add(passage_ids, vectors)
+        except Exception as e:
+            # Ex.: modelo de embeddings trocado (outra dimensão); apagar o diretório do índice ANN para recriar
+            print(f"⚠️ Erro ao gravar embeddings no índice ANN ({self.ann_dir}): {e}")
+
+    def _dense_scores(self, query, size):
+        if self.ann is None:
+            return None
+        self.ann.refresh()
+        if not self.ann.count:
+            return None
+        try:
+            query_vector = self._encode([query])[0]
+        except Exception as e:
+            print(f"⚠️ Erro ao gerar embedding da pergunta: {e}")
+            return None
+
+        ids, similarities = self.ann.search(query_vector, k=self.dense_candidates)
+        dense = np.zeros(size, dtype=np.float32)
+        valid = ids < size
+        dense[ids[valid]] = np.maximum(similarities[valid], 0)
+        return dense
+
+    def _connect(self):
+        return _ClosingConnection(sqlite3.connect(self.db_path, timeout=30))
@@ -0,0 +1,279 @@
+import posixpath
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, urlunsplit, urljoin, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+
+import requests
+
+# Parâmetros de rastreamento/sessão que não mudam o conteúdo da página
+TRACKING_PARAMS = re.compile(r'^(utm_\w+|fbclid|gclid|msclkid|mc_cid|mc_eid|_ga|phpsessid|jsessionid|sid)$', re.IGNORECASE)
+
+# Arquivos que não são páginas HTML
+SKIPPED_EXTENSIONS = {
+    '.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.ico', '.css', '.js', '.json', '.xml',
+    '.zip', '.gz', '.tar', '.rar', '.7z', '.exe', '.dmg', '.mp3', '.mp4', '.avi', '.mov', '.woff', '.woff2',
+    '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
+}
+
+def canonicalize_url(url, base=None):
+    """
+    Forma canônica de uma URL para deduplicar a fronteira.
+
+    Resolve contra base, normaliza esquema/host/porta padrão, remove
+    fragmento, segmentos "." e "..", parâmetros de rastreamento e ordena a
+    query. Retorna None para URLs que não são http(s).
+    """
+    try:
+        parts = urlsplit(urljoin(base, url.strip()) if base else url.strip())
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or '').lower()
+        port = parts.port
+    except ValueError:
+        return None
+
+    if scheme not in ('http', 'https') or not host:
+        return None
+
+    netloc = host if port is None or (scheme, port) in (('http', 80), ('https', 443)) else f'{host}:{port}'
+
+    path = re.sub(r'/{2,}', '/', parts.path or '/')
+    normalized = posixpath.normpath(path)
+    if path.endswith('/') and normalized != '/':
+        normalized += '/'
+
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if not TRACKING_PARAMS.match(key)))
+
+    return urlunsplit((scheme, netloc, normalized, query, ''))
+
+class SiteCrawler:
+    """
+    Crawler de sites a partir de URLs semente.
+
+    - Fronteira em largura (por profundidade) deduplicada por URL canônica,
+      com uma fila por domínio
+    - Cortesia por domínio: uma requisição por vez e um intervalo mínimo
+      entre requisições (o maior entre politeness_delay e o Crawl-delay do
+      robots.txt)
+    - robots.txt respeitado (urllib.robotparser), limites de profundidade
+      e de páginas
+    - Downloads pelo WebFetcher (retentativas, cache de páginas) e parsing
+      no pool de processos do fetcher, enquanto outros downloads continuam
+    """
+
+    def __init__(self, fetcher, max_depth=2, max_pages=100, politeness_delay=1.0, same_domain=True,
+                 respect_robots=True, include_patterns=None, exclude_patterns=None, user_agent=None):
+        self.fetcher = fetcher
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.politeness_delay = politeness_delay
+        self.same_domain = same_domain
+        self.respect_robots = respect_robots
+        self.include_res = [re.compile(pattern) for pattern in include_patterns or []]
+        self.exclude_res = [re.compile(pattern) for pattern in exclude_patterns or []]
+        self.user_agent = user_agent or fetcher.session.headers.get('User-Agent', '*')
+
+        self._robots = {}
+        self._robots_locks = {}
+        self._robots_lock = threading.Lock()
+        self.last_stats = None
+
+    def crawl(self, seeds, parse, parse_args=(), on_page=None):
+        """
+        Percorre o site a partir das sementes.
+
+        parse(content, *parse_args) roda no pool de parsing e deve retornar
+        (resultado, links). on_page(url, fetch_result, resultado) é chamado na
+        thread atual assim que cada página termina de ser processada.
+        Retorna {url: resultado} das páginas processadas, na ordem de conclusão.
+        """
+        started = time.time()
+        stats = {'fetched': 0, 'failed': 0, 'robots_blocked': 0, 'not_html': 0, 'discovered': 0}
+        results = {}
+
+        frontier = {}  # host -> deque[(url, profundidade)]
+        seen = set()
+        allowed_hosts = set()
+        for seed in seeds:
+            url = canonicalize_url(seed)
+            if url and url not in seen:
+                seen.add(url)
+                allowed_hosts.add(urlsplit(url).netloc)
+                frontier.setdefault(urlsplit(url).netloc, deque()).append((url, 0))
+
+        host_ready_at = {}  # host -> instante em que pode receber a próxima requisição
+        fetch_futures = {}
+        parse_futures = {}
+        scheduled = 0
+
+        with ThreadPoolExecutor(max_workers=self.fetcher.max_concurrency, thread_name_prefix='crawl') as fetch_pool, \
+                self.fetcher._parse_pool() as parse_pool:
+            while True:
+                now = time.monotonic()
+                for host, queue in frontier.items():
+                    if not queue or scheduled >= self.max_pages or len(fetch_futures) >= self.fetcher.max_concurrency:
+                        continue
+                    if host_ready_at.get(host, 0) > now:
+                        continue
+                    url, depth = queue.popleft()
+                    if self.politeness_delay > 0 or self._crawl_delay(host) or \
+                            (self.respect_robots and host not in self._robots):
+                        # Host ocupado até a resposta chegar (o intervalo conta a partir dela);
+                        # sem robots.txt carregado ainda não se conhece o Crawl-delay
+                        host_ready_at[host] = float('inf')
+                    fetch_futures[fetch_pool.submit(self._fetch, url)] = (url, depth)
+                    scheduled += 1
+
+                pending = list(fetch_futures) + list(parse_futures)
+                if not pending:
+                    waiting = [host_ready_at[host] for host, queue in frontier.items()
+                               if queue and host in host_ready_at]
+                    if scheduled >= self.max_pages or not any(frontier.values()):
+                        break
+                    time.sleep(max(0.0, min(waiting, default=now) - time.monotonic()))
+                    continue
+
+                # Acordar também quando um host volta a aceitar requisições
+                timers = [ready - now for host, ready in host_ready_at.items()
+                          if frontier.get(host) and now < ready < float('inf')]
+                done, _ = wait(pending, timeout=min(timers) if timers else None, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    if future in fetch_futures:
+                        url, depth = fetch_futures.pop(future)
+                        host = urlsplit(url).netloc
+                        if host_ready_at.get(host) == float('inf'):
+                            host_ready_at[host] = time.monotonic() + max(self.politeness_delay, self._crawl_delay(host))
+
+                        fetch_result = future.result()
+                        if fetch_result is None:
+                            stats['robots_blocked'] += 1
+                            continue
+                        if not fetch_result.ok:
+                            stats['failed'] += 1
+                            print(f"❌ Erro ao baixar {url}: {fetch_result.error}")
+                            continue
+                        if not self._is_html(fetch_result):
+                            stats['not_html'] += 1
+                            continue
+
+                        final_url = canonicalize_url(fetch_result.final_url) or url
+                        if final_url != url:
+                            # Redirecionada: o destino não entra na fronteira de novo e, para
+                            # uma semente, o host de destino passa a fazer parte do site
+                            seen.add(final_url)
+                            if depth == 0:
+                                allowed_hosts.add(urlsplit(final_url).netloc)
+
+                        stats['fetched'] += 1
+                        try:
+                            parse_future = parse_pool.submit(parse, fetch_result.content, *parse_args)
+                        except BrokenProcessPool:
+                            parse_future = fetch_pool.submit(parse, fetch_result.content, *parse_args)
+                        parse_futures[parse_future] = (url, depth, fetch_result)
+                        continue
+
+                    url, depth, fetch_result = parse_futures.pop(future)
+                    try:
+                        output, links = future.result()
+                    except BrokenProcessPool:
+                        # Pool de processos indisponível: processar na thread atual
+                        output, links = parse(fetch_result.content, *parse_args)
+                    except Exception as e:
+                        print(f"❌ Erro ao processar {url}: {e}")
+                        continue
+
+                    results[url] = output
+                    if on_page:
+                        on_page(url, fetch_result, output)
+
+                    if depth < self.max_depth:
+                        for link in links:
+                            link = canonicalize_url(link, base=fetch_result.final_url)
+                            if not link or link in seen or not self._should_follow(link, allowed_hosts):
+                                continue
+                            seen.add(link)
+                            stats['discovered'] += 1
+                            frontier.setdefault(urlsplit(link).netloc, deque()).append((link, depth + 1))
+
+        stats['pages'] = len(results)
+        stats['seconds'] = round(time.time() - started, 2)
+        self.last_stats = stats
+        print(f"🕸️ Crawler: {stats['pages']} páginas processadas em {stats['seconds']}s "
+              f"({stats['discovered']} links novos, {stats['failed']} falhas, "
+              f"{stats['robots_blocked']} bloqueadas pelo robots.txt, {stats['not_html']} não-HTML)")
+        return results
+
+    def _fetch(self, url):
+        """Download de uma página (None se o robots.txt proíbe)"""
+        if self.respect_robots:
+            try:
+                allowed = self._robots_for(url).can_fetch(self.user_agent, url)
+            except Exception as e:
+                print(f"⚠️ Erro ao ler robots.txt de {url}: {e}")
+                allowed = True
+            if not allowed:
+                return None
+        return self.fetcher.fetch(url)
+
+    def _should_follow(self, url, allowed_hosts):
+        parts = urlsplit(url)
+        if self.same_domain and parts.netloc not in allowed_hosts:
+            return False
+        if posixpath.splitext(parts.path)[1].lower() in SKIPPED_EXTENSIONS:
+            return False
+        if self.include_res and not any(pattern.search(url) for pattern in self.include_res):
+            return False
+        return not any(pattern.search(url) for pattern in self.exclude_res)
+
+    def _is_html(self, fetch_result):
+        content_type = next((value for key, value in fetch_result.headers.items()
+                             if key.lower() == 'content-type'), '')
+        # 304 pode vir sem Content-Type: o corpo em cache já foi aceito como HTML
+        return not content_type or 'html' in content_type.lower()
+
+    def _crawl_delay(self, host):
+        robots = self._robots.get(host)
+        if robots is None:
+            return 0
+        delay = robots.crawl_delay(self.user_agent)
+        try:
+            return float(delay or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    def _robots_for(self, url):
+        """robots.txt do host (baixado uma vez por crawler)"""
+        parts = urlsplit(url)
+        host = parts.netloc
+        with self._robots_lock:
+            if host in self._robots:
+                return self._robots[host]
+            host_lock = self._robots_locks.setdefault(host, threading.Lock())
+
+        with host_lock:
+            if host not in self._robots:
+                self._robots[host] = self._load_robots(f'{parts.scheme}://{host}/robots.txt')
+            return self._robots[host]
+
+    def _load_robots(self, robots_url):
+        robots = RobotFileParser(robots_url)
+        try:
+            response = self.fetcher.session.get(robots_url, timeout=self.fetcher.timeout)
+        except requests.RequestException:
+            # Sem robots.txt acessível: permitido (mesmo comportamento de RobotFileParser.read)
+            robots.allow_all = True
+            return robots
+
+        if response.status_code in (401, 403):
+            robots.disallow_all = True
+        elif response.status_code >= 400:
+            robots.allow_all = True
+        else:
+            robots.parse(response.text.splitlines())
+        return robots
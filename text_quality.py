@@ -0,0 +1,230 @@
+import re
+import time
+
+import numpy as np
+
+# Palavras funcionais frequentes: textos reais têm muitas, listas de menu/código quase nenhuma
+STOPWORDS = {
+    'pt': ['de', 'a', 'o', 'que', 'e', 'do', 'da', 'em', 'um', 'para', 'é', 'com', 'não', 'uma',
+           'os', 'no', 'se', 'na', 'por', 'mais', 'as', 'dos', 'como', 'mas', 'ao', 'ele', 'das',
+           'seu', 'sua', 'ou', 'quando', 'muito', 'nos', 'já', 'também', 'pelo', 'pela', 'até'],
+    'en': ['the', 'of', 'and', 'to', 'in', 'is', 'that', 'it', 'for', 'on', 'with', 'as', 'was',
+           'be', 'by', 'this', 'are', 'or', 'from', 'at', 'an', 'not', 'but', 'have', 'has', 'you'],
+}
+
+PUNCTUATION = '.,;:!?()[]{}"\'«»“”‘’-–—…'
+
+# Frases de boilerplate; um parágrafo só é rejeitado quando elas cobrem boa parte dele
+# (boilerplate_min_coverage), então avisos inteiros são cobertos até o fim da frase
+BOILERPLATE_PATTERNS = [
+    r'(usamos|utilizamos|este site (usa|utiliza)|we use|this (web)?site uses) cookies[^.!?\n]*',
+    r'(aceitar|aceito|accept)( todos os| all)? cookies',
+    r'(ao continuar navegando|by continuing to (browse|use))[^.!?\n]*',
+    r'pol[ií]tica de (privacidade|cookies)', r'(privacy|cookie) policy', r'termos de (uso|servi[cç]o)',
+    r'terms of (use|service)', r'todos os direitos reservados', r'all rights reserved', r'(©|copyright)[^.!?\n]*',
+    r'clique aqui', r'click here', r'leia mais', r'read more', r'saiba mais', r'newsletter',
+    r'(assine|receba|cadastre-se|sign up|subscribe)[^.!?\n]{0,30}newsletter[^.!?\n]*', r'inscreva-se', r'subscribe',
+    r'(compartilhe|share)( (este|esta|this) \w+| (no|on|via))?:?',
+    r'\b(facebook|twitter|linkedin|whatsapp|instagram|pinterest|telegram)\b', r'fa[cç]a login', r'sign in',
+]
+
+class TextQualityFilter:
+    """
+    Filtro de qualidade em lote para parágrafos coletados.
+
+    As características (tamanho, proporção de letras, palavras, palavras
+    funcionais e trecho coberto por boilerplate) são calculadas de uma vez para toda a lista:
+    os textos são concatenados, convertidos em um vetor NumPy de code points
+    e contados por segmento, sem laços Python por caractere.
+
+    Regras extras podem ser registradas com add_rule(nome, regra), onde
+    regra(textos) devolve um booleano por texto (True = manter).
+    """
+
+    REASON_MESSAGES = {
+        'empty': 'Texto vazio ou inválido',
+        'too_short': 'Texto muito curto',
+        'too_long': 'Texto muito longo',
+        'low_alpha_ratio': 'Texto com poucos caracteres alfabéticos',
+        'too_few_words': 'Poucas palavras',
+        'boilerplate': 'Texto padrão de site (cookies, rodapé, chamadas)',
+        'language': 'Idioma não reconhecido (poucas palavras funcionais)',
+    }
+
+    def __init__(self, min_length=30, max_length=None, min_alpha_ratio=0.5, min_words=5,
+                 languages=('pt', 'en'), min_stopword_ratio=0.05, language_min_words=8,
+                 boilerplate_patterns=None, boilerplate_max_length=300, boilerplate_min_coverage=0.5):
+        self.min_length = min_length
+        self.max_length = max_length
+        self.min_alpha_ratio = min_alpha_ratio
+        self.min_words = min_words
+        self.min_stopword_ratio = min_stopword_ratio
+        self.language_min_words = language_min_words
+        self.boilerplate_max_length = boilerplate_max_length
+        self.boilerplate_min_coverage = boilerplate_min_coverage
+        self.extra_rules = []
+
+        self.stopwords = {word for language in (languages or []) for word in STOPWORDS[language]}
+
+        # Um regex por padrão: alternações grandes impedem a busca rápida por prefixo literal do re
+        patterns = BOILERPLATE_PATTERNS if boilerplate_patterns is None else boilerplate_patterns
+        self.boilerplate_res = [re.compile(pattern.lower()) for pattern in patterns]
+
+        # Tabelas de classificação para code points baixos (Latin estendido); os demais via str
+        low_chars = [chr(code) for code in range(0x250)]
+        self._alpha_table = np.array([char.isalpha() for char in low_chars])
+        self._space_table = np.array([char.isspace() for char in low_chars])
+
+    def add_rule(self, name, rule, message=None):
+        """Registra uma regra extra aplicada em lote após as regras padrão"""
+        self.extra_rules.append((name, rule))
+        if message:
+            self.REASON_MESSAGES = {**self.REASON_MESSAGES, name: message}
+
+    def evaluate(self, texts):
+        """Retorna o motivo de rejeição de cada texto (None = aceito)"""
+        texts = [text.strip() if isinstance(text, str) else '' for text in texts]
+        if not texts:
+            return []
+
+        features = self._features(texts)
+        lengths = features['lengths']
+        words = features['words']
+
+        # Regras em ordem: o motivo registrado é a primeira regra que falha
+        checks = [
+            ('empty', lengths > 0),
+            ('too_short', lengths >= self.min_length),
+            ('too_long', lengths <= self.max_length if self.max_length else np.ones(len(texts), dtype=bool)),
+            ('low_alpha_ratio', features['alpha'] >= lengths * self.min_alpha_ratio),
+            ('too_few_words', words >= self.min_words),
+            ('boilerplate', ~((features['boilerplate'] >= lengths * self.boilerplate_min_coverage) &
+                              (lengths < self.boilerplate_max_length))),
+            ('language', (words < self.language_min_words) | (not self.stopwords) |
+                         (features['stopwords'] >= words * self.min_stopword_ratio)),
+        ]
+
+        reasons = np.full(len(texts), None, dtype=object)
+        pending = np.ones(len(texts), dtype=bool)
+
+        for name, passed in checks:
+            failed = pending & ~passed
+            reasons[failed] = name
+            pending &= passed
+
+        for name, rule in self.extra_rules:
+            indices = np.flatnonzero(pending)
+            if not len(indices):
+                break
+            passed = np.array([bool(value) for value in rule([texts[i] for i in indices])], dtype=bool)
+            reasons[indices[~passed]] = name
+            pending[indices[~passed]] = False
+
+        return reasons.tolist()
+
+    def filter(self, texts):
+        """
+        Filtra uma lista de textos.
+
+        Retorna (aceitos, estatísticas) com contagem e exemplo por motivo de rejeição.
+        """
+        started = time.time()
+        reasons = self.evaluate(texts)
+
+        accepted = []
+        rejected = {}
+        examples = {}
+        for text, reason in zip(texts, reasons):
+            text = text if isinstance(text, str) else ''
+            if reason is None:
+                accepted.append(text.strip())
+                continue
+            rejected[reason] = rejected.get(reason, 0) + 1
+            examples.setdefault(reason, (text or '')[:80])
+
+        stats = {
+            'total': len(texts),
+            'accepted': len(accepted),
+            'rejected': rejected,
+            'examples': examples,
+            'seconds': round(time.time() - started, 4)
+        }
+        return accepted, stats
+
+    def format_stats(self, stats):
+        """Resumo de uma linha das rejeições"""
+        if not stats['rejected']:
+            return 'nenhuma rejeição'
+        return ', '.join(f"{self.REASON_MESSAGES.get(reason, reason).lower()}: {count}"
+                         for reason, count in sorted(stats['rejected'].items(), key=lambda item: -item[1]))
+
+    def _features(self, texts):
+        """Contagens por texto calculadas sobre o lote concatenado"""
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        # Separador \n (espaço): as palavras de cada texto ficam contíguas no lote
+        starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+        joined = '\n'.join(texts)
+        lowered = joined.lower()
+        codes = np.frombuffer(joined.encode('utf-32-le'), dtype=np.uint32)
+
+        is_alpha = self._classify(codes, self._alpha_table, str.isalpha)
+        is_space = self._classify(codes, self._space_table, str.isspace)
+        # Início de palavra: caractere não-espaço precedido de espaço (ou início do lote)
+        word_start = ~is_space & np.concatenate(([True], is_space[:-1]))
+        words = self._segment_sums(word_start, starts, lengths)
+
+        return {
+            'lengths': lengths,
+            'alpha': self._segment_sums(is_alpha, starts, lengths),
+            'words': words,
+            'stopwords': self._stopword_counts(lowered, words),
+            'boilerplate': self._boilerplate_coverage(joined, lowered, starts, lengths),
+        }
+
+    def _classify(self, codes, table, predicate):
+        result = np.zeros(len(codes), dtype=bool)
+        low = codes < len(table)
+        result[low] = table[codes[low]]
+
+        high = ~low
+        if high.any():
+            # Poucos code points distintos fora da tabela: classificar cada um só uma vez
+            unique_codes, inverse = np.unique(codes[high], return_inverse=True)
+            values = np.array([predicate(chr(code)) for code in unique_codes.tolist()], dtype=bool)
+            result[high] = values[inverse]
+
+        return result
+
+    def _segment_sums(self, mask, starts, lengths):
+        cumulative = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+        return cumulative[starts + lengths] - cumulative[starts]
+
+    def _stopword_counts(self, lowered, words):
+        """Palavras funcionais por texto: split() do lote segue a mesma definição de palavra"""
+        if not self.stopwords:
+            return np.zeros(len(words), dtype=np.int64)
+
+        stopwords = self.stopwords
+        tokens = lowered.split()
+        is_stopword = np.fromiter((token.strip(PUNCTUATION) in stopwords for token in tokens),
+                                  dtype=bool, count=len(tokens))
+        segments = np.repeat(np.arange(len(words)), words)
+        return np.bincount(segments[is_stopword], minlength=len(words))
+
+    def _boilerplate_coverage(self, joined, lowered, starts, lengths):
+        """Caracteres de cada texto cobertos por boilerplate (uma varredura do lote por padrão)"""
+        # lower() raramente muda o tamanho do texto (ex.: 'İ'); aí as posições não batem
+        if len(lowered) == len(joined):
+            scans = [pattern.finditer(lowered) for pattern in self.boilerplate_res]
+        else:
+            scans = [re.compile(pattern.pattern, re.IGNORECASE).finditer(joined) for pattern in self.boilerplate_res]
+
+        # Trechos cobertos por mais de um padrão contam uma vez: +1 no início e -1 no fim de cada
+        # ocorrência, e um caractere é coberto quando a soma acumulada é positiva
+        spans = np.fromiter((position for scan in scans for match in scan for position in match.span()),
+                            dtype=np.int64).reshape(-1, 2)
+        boundaries = np.zeros(len(joined) + 1, dtype=np.int64)
+        np.add.at(boundaries, spans[:, 0], 1)
+        np.add.at(boundaries, spans[:, 1], -1)
+        covered = np.cumsum(boundaries[:-1]) > 0
+        return self._segment_sums(covered, starts, lengths)
@@ -0,0 +1,212 @@
+import torch
+import json
+import os
+import time
+from datetime import datetime
+
+from model_trainer import MemorySampler, get_current_memory_mb, get_total_memory_mb
+
+# Versão da sondagem no cache: resultados de versões anteriores são refeitos
+AUTOTUNE_VERSION = 2
+
+class TrainingAutoTuner:
+    """
+    Ajusta automaticamente micro-batch, gradient accumulation e threads da CPU.
+    
+    1. Sonda o maior micro-batch que cabe no orçamento de memória (dobrando o batch)
+    2. Mede tokens/s para alguns micro-batches e números de threads
+    3. Escolhe a configuração mais rápida que mantém o batch efetivo solicitado
+    
+    Os resultados ficam em cache por modelo/sequência/máquina para que os
+    treinamentos seguintes não precisem repetir a sondagem.
+    """
+    
+    def __init__(self, model, dataset, data_collator, memory_budget_mb=None,
+                 max_micro_batch=32, probe_steps=2, cache_file='models/autotune_cache.json'):
+        self.model = model
+        self.dataset = dataset
+        self.data_collator = data_collator
+        self.max_micro_batch = max_micro_batch
+        self.probe_steps = probe_steps
+        self.cache_file = cache_file
+        
+        if memory_budget_mb is None:
+            total_memory = get_total_memory_mb()
+            # Sem informação da máquina: orçamento conservador de 4GB
+            memory_budget_mb = total_memory * 0.7 if total_memory else 4096
+        self.memory_budget_mb = memory_budget_mb
+    
+    def tune(self, effective_batch_size, cache_key=None):
+        """Retorna a melhor configuração para o batch efetivo informado"""
+        cache_key = cache_key or self._default_cache_key(effective_batch_size)
+        cached = self._load_cache().get(cache_key)
+        
+        if cached:
+            print(f"⚡ Auto-tuning em cache: micro-batch {cached['micro_batch_size']}, "
+                  f"accumulation {cached['gradient_accumulation_steps']}, {cached['num_threads']} threads")
+            self._apply_threads(cached['num_threads'], cached.get('num_interop_threads'))
+            return {**cached, 'from_cache': True}
+        
+        started = time.time()
+        interop_threads = self._apply_interop_threads()
+        max_batch = self.find_max_micro_batch(min(self.max_micro_batch, effective_batch_size))
+        
+        # Micro-batches candidatos: potências de 2 até o máximo, preferindo divisores do batch efetivo
+        batch_candidates = [bs for bs in self._powers_of_two(max_batch) if effective_batch_size % bs == 0]
+        batch_candidates = batch_candidates[-3:] or [max_batch]
+        
+        measurements = []
+        for num_threads in self._thread_candidates():
+            for micro_batch in batch_candidates:
+                tokens_per_second = self.measure_throughput(micro_batch, num_threads)
+                measurements.append({
+                    'micro_batch_size': micro_batch,
+                    'num_threads': num_threads,
+                    'tokens_per_second': round(tokens_per_second, 1)
+                })
+                print(f"   🔬 micro-batch {micro_batch}, {num_threads} threads: {tokens_per_second:.1f} tokens/s")
+        
+        best = max(measurements, key=lambda m: m['tokens_per_second'])
+        self._apply_threads(best['num_threads'])
+        
+        result = {
+            'micro_batch_size': best['micro_batch_size'],
+            'gradient_accumulation_steps': max(1, effective_batch_size // best['micro_batch_size']),
+            'effective_batch_size': effective_batch_size,
+            'num_threads': best['num_threads'],
+            'num_interop_threads': interop_threads,
+            'max_micro_batch_in_budget': max_batch,
+            'memory_budget_mb': round(self.memory_budget_mb, 1),
+            'tokens_per_second': best['tokens_per_second'],
+            'measurements': measurements,
+            'tuning_seconds': round(time.time() - started, 1),
+            'tuned_at': datetime.now().isoformat()
+        }
+        
+        print(f"✅ Auto-tuning: micro-batch {result['micro_batch_size']} x accumulation "
+              f"{result['gradient_accumulation_steps']}, {result['num_threads']} threads "
+              f"({result['tokens_per_second']} tokens/s)")
+        
+        cache = self._load_cache()
+        cache[cache_key] = result
+        self._save_cache(cache)
+        
+        return {**result, 'from_cache': False}
+    
+    def find_max_micro_batch(self, upper_limit):
+        """Maior micro-batch (potência de 2) cujo pico de memória cabe no orçamento"""
+        best = 1
+        previous_peak = None
+        
+        if get_current_memory_mb() is None:
+            # Sem medição de memória disponível: não arriscar além do batch inicial
+            return min(upper_limit, 2)
+        
+        for batch_size in self._powers_of_two(upper_limit):
+            try:
+                # Pico do RSS atual durante a sondagem: memória em uso agora (modelo, dados)
+                # mais o que o passo acrescenta, sem o pico histórico de jobs anteriores
+                with MemorySampler() as sampler:
+                    self._train_step(batch_size)
+            except RuntimeError as e:
+                print(f"   ⚠️ Micro-batch {batch_size} falhou ({str(e)[:80]})")
+                break
+            
+            peak = sampler.peak
+            if peak > self.memory_budget_mb:
+                break
+            
+            best = batch_size
+            
+            # Dobrar o batch ~dobra a memória de ativações: prever o próximo pico
+            if previous_peak is not None and peak + (peak - previous_peak) * 2 > self.memory_budget_mb:
+                break
+            previous_peak = peak
+        
+        print(f"   📏 Maior micro-batch no orçamento de {self.memory_budget_mb:.0f}MB: {best}")
+        return best
+    
+    def measure_throughput(self, micro_batch, num_threads):
+        """Mede tokens/s de forward+backward para um micro-batch e número de threads"""
+        self._apply_threads(num_threads)
+        
+        # Aquecimento (alocação de buffers)
+        self._train_step(micro_batch)
+        
+        started = time.time()
+        tokens = 0
+        for _ in range(self.probe_steps):
+            tokens += self._train_step(micro_batch)
+        
+        return tokens / max(time.time() - started, 1e-6)
+    
+    def _train_step(self, batch_size):
+        """Executa forward+backward sem atualizar pesos; retorna tokens processados"""
+        indices = [i % len(self.dataset) for i in range(batch_size)]
+        batch = self.data_collator([self.dataset[i] for i in indices])
+        batch = {key: value for key, value in batch.items() if isinstance(value, torch.Tensor)}
+        
+        self.model.train()
+        try:
+            outputs = self.model(**batch)
+            outputs.loss.backward()
+        finally:
+            self.model.zero_grad(set_to_none=True)
+        
+        return batch['input_ids'].numel()
+    
+    def _thread_candidates(self):
+        """Números de threads a testar: todos os núcleos, metade e um quarto"""
+        cores = os.cpu_count() or 1
+        return sorted({max(1, cores), max(1, cores // 2), max(1, cores // 4)}, reverse=True)
+    
+    def _powers_of_two(self, limit):
+        sizes = []
+        size = 1
+        while size <= limit:
+            sizes.append(size)
+            size *= 2
+        return sizes
+    
+    def _apply_threads(self, num_threads, num_interop_threads=None):
+        torch.set_num_threads(num_threads)
+        if num_interop_threads:
+            self._apply_interop_threads(num_interop_threads)
+    
+    def _apply_interop_threads(self, num_interop_threads=None):
+        """Define threads inter-op (só é permitido antes de qualquer trabalho paralelo no processo)"""
+        if num_interop_threads is None:
+            num_interop_threads = min(2, os.cpu_count() or 1)
+        
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError:
+            # Já definido neste processo: manter o valor atual
+            pass
+        
+        return torch.get_num_interop_threads()
+    
+    def _default_cache_key(self, effective_batch_size):
+        model_name = getattr(getattr(self.model, 'config', None), '_name_or_path', 'model')
+        seq_len = len(self.dataset[0]['input_ids'])
+        return (f"{model_name}|seq{seq_len}|ebs{effective_batch_size}|cpu{os.cpu_count()}|"
+                f"mem{int(self.memory_budget_mb)}|v{AUTOTUNE_VERSION}")
+    
+    def _load_cache(self):
+        if not os.path.exists(self.cache_file):
+            return {}
+        
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Erro ao ler cache de auto-tuning: {e}")
+            return {}
+    
+    def _save_cache(self, cache):
+        try:
+            os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"Erro ao salvar cache de auto-tuning: {e}")
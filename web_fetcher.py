@@ -0,0 +1,216 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Respostas que valem nova tentativa (limite de taxa e falhas temporárias do servidor)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+class FetchResult:
+    """Resultado do download de uma URL"""
+
+    def __init__(self, url, status_code=None, content=None, headers=None, error=None,
+                 attempts=0, elapsed=0.0, not_modified=False, final_url=None):
+        self.url = url
+        # URL depois dos redirecionamentos (base para resolver os links da página)
+        self.final_url = final_url or url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.error = error
+        self.attempts = attempts
+        self.elapsed = elapsed
+        # 304: content veio do cache em disco
+        self.not_modified = not_modified
+        # Resultado do parse reaproveitado (parsing e filtragem não executados)
+        self.reused = False
+
+    @property
+    def ok(self):
+        return self.error is None and self.status_code is not None and self.status_code < 400
+
+class WebFetcher:
+    """
+    Download concorrente de páginas com limites global e por host.
+
+    - Um pool de threads faz as requisições (I/O) compartilhando uma única
+      sessão HTTP com pool de conexões (keep-alive por host)
+    - Semáforos por host evitam sobrecarregar um mesmo servidor
+    - Falhas temporárias são repetidas com backoff exponencial e jitter
+    - O parsing (CPU) roda em um pool de processos separado, em paralelo
+      com os downloads ainda pendentes
+    - Com page_cache, páginas já baixadas são revalidadas com requisições
+      condicionais (ETag / Last-Modified) e um 304 reutiliza o corpo em disco
+    """
+
+    def __init__(self, max_concurrency=16, per_host_concurrency=4, max_retries=3,
+                 backoff_factor=0.5, timeout=10, parse_workers=None, headers=None, page_cache=None):
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.parse_workers = parse_workers if parse_workers is not None else min(4, multiprocessing.cpu_count())
+        self.page_cache = page_cache
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._host_slots = {}
+        self._host_lock = threading.Lock()
+
+    def fetch(self, url, headers=None):
+        """Baixa uma URL respeitando o limite do host, com novas tentativas"""
+        started = time.time()
+        attempt = 0
+        conditional = self.page_cache is not None
+
+        while True:
+            attempt += 1
+            request_headers = dict(headers or {})
+            if conditional:
+                request_headers.update(self.page_cache.conditional_headers(url))
+            
+            try:
+                with self._host_slot(url):
+                    response = self.session.get(url, headers=request_headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt > self.max_retries:
+                    return FetchResult(url, error=str(e), attempts=attempt, elapsed=time.time() - started)
+                self._sleep_backoff(attempt)
+                continue
+            except requests.RequestException as e:
+                return FetchResult(url, error=str(e), attempts=attempt, elapsed=time.time() - started)
+
+            if response.status_code in RETRY_STATUS_CODES and attempt <= self.max_retries:
+                self._sleep_backoff(attempt, response.headers.get('Retry-After'))
+                continue
+
+            if response.status_code == 304:
+                content = self.page_cache.load_body(url) if conditional else None
+                if content is None:
+                    # Cache removido entre a revalidação e a leitura: baixar de novo
+                    conditional = False
+                    continue
+                return FetchResult(url, 304, content, dict(response.headers), attempts=attempt,
+                                   elapsed=time.time() - started, not_modified=True, final_url=response.url)
+
+            if self.page_cache is not None and response.status_code == 200:
+                self.page_cache.store_response(url, response.content, response.headers)
+
+            error = f'HTTP {response.status_code}' if response.status_code >= 400 else None
+            return FetchResult(url, response.status_code, response.content, dict(response.headers),
+                               error=error, attempts=attempt, elapsed=time.time() - started, final_url=response.url)
+
+    def fetch_all(self, urls, parse, parse_args=(), reuse=None, on_result=None):
+        """
+        Baixa e processa várias URLs em paralelo.
+
+        parse(content, *parse_args) roda no pool de parsing e deve ser uma função
+        de módulo (serializável). Retorna {url: (FetchResult, resultado_do_parse)}
+        na ordem das URLs; resultado é None quando o download falha.
+
+        reuse(fetch_result), se informado, pode devolver um resultado já conhecido
+        (ex.: textos de uma página não modificada); nesse caso o parse é pulado e
+        fetch_result.reused fica True.
+
+        on_result(url, fetch_result, resultado), se informado, é chamado na thread
+        atual assim que cada URL termina (download e parse), na ordem de conclusão.
+        """
+        urls = list(dict.fromkeys(urls))
+        results = {}
+        started = time.time()
+
+        def finish(url, fetch_result, output):
+            results[url] = (fetch_result, output)
+            if on_result:
+                on_result(url, fetch_result, output)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='fetch') as fetch_pool, \
+                self._parse_pool() as parse_pool:
+            fetch_futures = {fetch_pool.submit(self.fetch, url): url for url in urls}
+            parse_futures = {}
+
+            # Parsing começa assim que cada download termina; resultados saem assim que o parsing termina
+            try:
+                while fetch_futures or parse_futures:
+                    done, _ = wait(list(fetch_futures) + list(parse_futures), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future in fetch_futures:
+                            del fetch_futures[future]
+                            fetch_result = future.result()
+                            if not fetch_result.ok:
+                                print(f"❌ Erro ao baixar {fetch_result.url}: {fetch_result.error}")
+                                finish(fetch_result.url, fetch_result, None)
+                                continue
+
+                            reused = reuse(fetch_result) if reuse else None
+                            if reused is not None:
+                                fetch_result.reused = True
+                                finish(fetch_result.url, fetch_result, reused)
+                                continue
+
+                            try:
+                                parse_futures[parse_pool.submit(parse, fetch_result.content, *parse_args)] = fetch_result
+                            except BrokenProcessPool:
+                                # Pool de processos indisponível: processar na thread atual
+                                finish(fetch_result.url, fetch_result, parse(fetch_result.content, *parse_args))
+                            continue
+
+                        fetch_result = parse_futures.pop(future)
+                        try:
+                            output = future.result()
+                        except BrokenProcessPool:
+                            output = parse(fetch_result.content, *parse_args)
+                        except Exception as e:
+                            print(f"❌ Erro ao processar {fetch_result.url}: {e}")
+                            output = None
+                        finish(fetch_result.url, fetch_result, output)
+            except BaseException:
+                # on_result interrompeu a coleta: downloads ainda não iniciados são cancelados
+                for future in fetch_futures:
+                    future.cancel()
+                raise
+
+        not_modified = sum(1 for fetch_result, _ in results.values() if fetch_result.not_modified)
+        print(f"🌐 {len(urls)} URLs baixadas em {time.time() - started:.1f}s "
+              f"(concorrência {self.max_concurrency}, {self.per_host_concurrency} por host, "
+              f"{not_modified} não modificadas)")
+
+        return {url: results[url] for url in urls}
+
+    def _parse_pool(self):
+        if self.parse_workers > 1:
+            # spawn: seguro com as threads do Flask e dos jobs já em execução
+            return ProcessPoolExecutor(max_workers=self.parse_workers,
+                                       mp_context=multiprocessing.get_context('spawn'))
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix='parse')
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._host_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_concurrency)
+            return self._host_slots[host]
+
+    def _sleep_backoff(self, attempt, retry_after=None):
+        delay = self.backoff_factor * (2 ** (attempt - 1))
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), 60))
+            except ValueError:
+                pass
+        time.sleep(delay + random.uniform(0, delay / 2))